@@ -0,0 +1,253 @@
+"""Loudness, peak, tempo, key, silence and fingerprint analysis of library tracks, run in worker processes.
+
+Each track is decoded once and measured with vectorized NumPy DSP; results are stored in the
+library catalog by file hash, so sorting and filtering by them never touches the audio. The
+pipeline runs as one background scheduler job that only feeds the pool while no interactive job
+is running.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_stitch import pcm_blocks
+import fingerprint
+from generation_scheduler import get_scheduler, Priority, LOCAL
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_RATE = 22050
+WORKERS = max(1, min(2, (os.cpu_count() or 2) - 1))
+SILENCE_DB = -50.0
+MIN_SILENCE = 0.5
+KEY_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Krumhansl-Kessler key profiles
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def decode(path, rate=ANALYSIS_RATE):
+    """The whole file as float32 (frames, 2) in [-1, 1]."""
+    blocks = list(pcm_blocks(path, rate, 2))
+    if not blocks:
+        return np.zeros((0, 2), dtype=np.float32)
+    return np.concatenate(blocks) / 32768.0
+
+
+def _biquad_power(b, a, frequencies, rate):
+    z = np.exp(-2j * np.pi * frequencies / rate)
+    return np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+
+
+def k_weighting(frequencies, rate):
+    """Power response of the BS.1770 K-weighting filter (high shelf, then RLB high-pass)."""
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1681.97 / rate
+    alpha = np.sin(w0) / (2 * 0.7072)
+    cos, root = np.cos(w0), 2 * np.sqrt(gain) * alpha
+    shelf = _biquad_power(
+        [gain * ((gain + 1) + (gain - 1) * cos + root), -2 * gain * ((gain - 1) + (gain + 1) * cos),
+         gain * ((gain + 1) + (gain - 1) * cos - root)],
+        [(gain + 1) - (gain - 1) * cos + root, 2 * ((gain - 1) - (gain + 1) * cos),
+         (gain + 1) - (gain - 1) * cos - root],
+        frequencies, rate)
+    w0 = 2 * np.pi * 38.135 / rate
+    alpha = np.sin(w0) / (2 * 0.5003)
+    cos = np.cos(w0)
+    highpass = _biquad_power([(1 + cos) / 2, -(1 + cos), (1 + cos) / 2], [1 + alpha, -2 * cos, 1 - alpha],
+                             frequencies, rate)
+    return shelf * highpass
+
+
+def integrated_loudness(samples, rate, chunk=256):
+    """Gated loudness in LUFS over 400 ms blocks with 75% overlap, K-weighted in the frequency domain."""
+    size, hop = int(0.4 * rate), int(0.1 * rate)
+    if len(samples) < size:
+        return None
+    weights = k_weighting(np.fft.rfftfreq(size, 1 / rate), rate)
+    # Parseval over a real FFT: the bins between DC and Nyquist stand for two
+    weights[1:-1 if size % 2 == 0 else None] *= 2
+    energies = []
+    for channel in samples.T:
+        blocks = sliding_window_view(channel, size)[::hop]
+        energy = np.concatenate([
+            (np.abs(np.fft.rfft(blocks[i:i + chunk], axis=1)) ** 2 * weights).sum(axis=1) / size ** 2
+            for i in range(0, len(blocks), chunk)
+        ])
+        energies.append(energy)
+    power = np.sum(energies, axis=0)
+    with np.errstate(divide='ignore'):
+        loudness = -0.691 + 10 * np.log10(power)
+    gated = power[loudness > -70]
+    if not len(gated):
+        return None
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10
+    gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def stft_magnitude(mono, size, hop, chunk=1024):
+    """Magnitude spectrogram (frames, bins) with a Hann window, computed chunk by chunk."""
+    if len(mono) < size:
+        mono = np.pad(mono, (0, size - len(mono)))
+    frames = sliding_window_view(mono, size)[::hop]
+    window = np.hanning(size).astype(np.float32)
+    return np.concatenate([np.abs(np.fft.rfft(frames[i:i + chunk] * window, axis=1)).astype(np.float32)
+                           for i in range(0, len(frames), chunk)])
+
+
+def estimate_tempo(mono, rate, low=60, high=200):
+    """BPM from the autocorrelation of the spectral-flux onset envelope, biased towards 120 BPM."""
+    hop = 512
+    spectrum = np.log1p(stft_magnitude(mono, 1024, hop) * 100)
+    flux = np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+    if len(flux) < 8:
+        return None
+    flux -= np.convolve(flux, np.ones(16) / 16, mode='same')
+    flux = np.maximum(flux, 0)
+    fps = rate / hop
+    n = 1 << int(np.ceil(np.log2(2 * len(flux))))
+    spectrum = np.fft.rfft(flux, n)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), n)[:len(flux)]
+    lags = np.arange(int(fps * 60 / high), min(int(fps * 60 / low) + 1, len(autocorrelation)))
+    if len(lags) < 3:
+        return None
+    bpm = 60 * fps / lags
+    scores = autocorrelation[lags] * np.exp(-0.5 * np.log2(bpm / 120) ** 2)
+    best = int(np.argmax(scores))
+    lag = float(lags[best])
+    if 0 < best < len(lags) - 1:
+        # Parabolic interpolation between neighbouring lags
+        left, centre, right = scores[best - 1:best + 2]
+        denominator = left - 2 * centre + right
+        if denominator:
+            lag += 0.5 * (left - right) / denominator
+    return float(60 * fps / lag)
+
+
+def chroma_profile(mono, rate):
+    """Energy per pitch class (C first), normalized to sum to 1."""
+    size = 4096
+    spectrum = stft_magnitude(mono, size, size // 2).mean(axis=0) ** 2
+    frequencies = np.fft.rfftfreq(size, 1 / rate)
+    usable = (frequencies >= 55) & (frequencies <= 5000)
+    pitch_classes = np.round(12 * np.log2(frequencies[usable] / 440) + 69).astype(int) % 12
+    chroma = np.bincount(pitch_classes, weights=spectrum[usable], minlength=12)
+    total = chroma.sum()
+    return chroma / total if total > 0 else chroma
+
+
+def estimate_key(chroma):
+    """Best-correlating major or minor key, e.g. 'A minor'."""
+    if not chroma.any():
+        return None
+    best, best_score = None, -2.0
+    for mode, profile in (('major', MAJOR_PROFILE), ('minor', MINOR_PROFILE)):
+        for tonic in range(12):
+            score = np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+            if score > best_score:
+                best, best_score = f"{KEY_NAMES[tonic]} {mode}", score
+    return best
+
+
+def silences(mono, rate, threshold_db=SILENCE_DB, min_length=MIN_SILENCE):
+    """[start, end] seconds of every run of 50 ms frames quieter than threshold_db."""
+    size = int(0.05 * rate)
+    frames = len(mono) // size
+    if not frames:
+        return []
+    rms = np.sqrt((mono[:frames * size].reshape(frames, size) ** 2).mean(axis=1))
+    with np.errstate(divide='ignore'):
+        quiet = 20 * np.log10(rms) < threshold_db
+    edges = np.diff(np.concatenate([[0], quiet.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [[round(float(start * size / rate), 2), round(float(end * size / rate), 2)]
+            for start, end in zip(starts, ends) if (end - start) * size / rate >= min_length]
+
+
+def analyze(path):
+    """Every measurement for one file; runs in a worker process."""
+    samples = decode(path)
+    rate = ANALYSIS_RATE
+    mono = samples.mean(axis=1) if len(samples) else np.zeros(0, dtype=np.float32)
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+    chroma = chroma_profile(mono, rate) if len(mono) else np.zeros(12)
+    return {
+        'duration': len(samples) / rate,
+        'loudness': integrated_loudness(samples, rate),
+        'peak': float(20 * np.log10(peak)) if peak > 0 else None,
+        'tempo': estimate_tempo(mono, rate) if len(mono) else None,
+        'key': estimate_key(chroma),
+        'chroma': [round(float(value), 4) for value in chroma],
+        'silences': silences(mono, rate),
+        'fingerprint': fingerprint.to_bytes(fingerprint.compute(mono, rate)) if len(mono) else b'',
+    }
+
+
+def _lower_priority():
+    # Worker processes yield the CPU to the GUI and everything else
+    try:
+        if hasattr(os, 'nice'):
+            os.nice(10)
+        else:
+            import psutil
+            psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+    except (ImportError, OSError) as e:
+        logger.debug(f"Could not lower the analysis worker's priority: {str(e)}")
+
+
+def interactive_busy(scheduler):
+    return any(job.priority == Priority.INTERACTIVE for job in scheduler.jobs())
+
+
+def analyze_library(library, job, on_progress=None, workers=WORKERS, idle_poll=2.0):
+    """Analyze every cataloged track without results; returns how many were analyzed.
+
+    Batches are only handed to the pool while no interactive job is running.
+    """
+    scheduler = get_scheduler()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority) as pool:
+        while True:
+            job.check_cancelled()
+            pending = library.unanalyzed(limit=workers * 2)
+            if not pending:
+                return done
+            while interactive_busy(scheduler):
+                job.sleep(idle_poll)
+            futures = {pool.submit(analyze, track['path']): track for track in pending}
+            for future in as_completed(futures):
+                track = futures[future]
+                try:
+                    result = future.result()
+                    library.save_fingerprint(track['file_hash'], fingerprint.from_bytes(result.pop('fingerprint')))
+                    library.save_analysis(track['file_hash'], result)
+                except Exception as e:
+                    # Recorded as failed so the track is not retried on every pass
+                    logger.warning(f"Could not analyze {track['path']}: {str(e)}")
+                    library.save_analysis(track['file_hash'], None, error=str(e))
+                done += 1
+            if on_progress:
+                on_progress(done)
+
+
+_analysis_job = None
+_analysis_lock = threading.Lock()
+
+
+def schedule_analysis(parent, library, on_progress=None, on_done=None):
+    """Start the background analysis job unless one is already running; it picks up new tracks itself."""
+    global _analysis_job
+    # Imported here so worker processes, which import this module, do not load Qt and the API clients
+    from qt_jobs import submit_job
+    with _analysis_lock:
+        if _analysis_job is not None and not _analysis_job.finished:
+            return _analysis_job
+
+        def run(job, emit_chunk):
+            return analyze_library(library, job, on_progress=lambda done: emit_chunk(str(done)))
+
+        _analysis_job = submit_job(parent, LOCAL, run, on_done=on_done, on_chunk=on_progress,
+                                   priority=Priority.BACKGROUND, label='audio_analysis')
+        return _analysis_job
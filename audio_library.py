@@ -0,0 +1,438 @@
+"""Catalog of generated tracks, so the library can be browsed and filtered without opening audio files.
+
+Every track in generated_songs/ has a row with its UdioPro metadata, the song and SongResponse it
+was generated from, and its file's size, hash and duration; audio_analysis adds loudness, tempo
+and key per file hash. New files are hashed once when they are added; listing, filtering and
+sorting only read the indexed catalog.
+
+Each analyzed file also gets an acoustic fingerprint. Its words go into an inverted index, so a new
+track is compared only against the few tracks sharing the most words with it, and a track that
+turns out to be a near-duplicate is linked to the earliest copy of the same audio. The totals the
+library shows for duplicates are kept up to date as tracks are added, removed and fingerprinted,
+rather than recounted from the whole catalog.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import wave
+from collections import Counter
+import fingerprint
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_DIR = 'generated_songs'
+LIBRARY_PATH = os.path.join(LIBRARY_DIR, 'library.db')
+AUDIO_EXTENSIONS = ('.mp3', '.wav')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    song_title TEXT,
+    chain_id INTEGER,
+    prompt TEXT NOT NULL DEFAULT '',
+    tags TEXT NOT NULL DEFAULT '',
+    model_name TEXT NOT NULL DEFAULT '',
+    song_response TEXT,
+    duration REAL,
+    file_size INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    created_at REAL NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_title ON tracks (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_song_title ON tracks (song_title, created_at);
+CREATE INDEX IF NOT EXISTS tracks_created_at ON tracks (created_at);
+CREATE INDEX IF NOT EXISTS tracks_duration ON tracks (duration);
+CREATE INDEX IF NOT EXISTS tracks_model_name ON tracks (model_name, created_at);
+CREATE INDEX IF NOT EXISTS tracks_file_hash ON tracks (file_hash);
+CREATE TABLE IF NOT EXISTS analysis (
+    file_hash TEXT PRIMARY KEY,
+    loudness REAL,
+    peak REAL,
+    tempo REAL,
+    key TEXT,
+    chroma TEXT,
+    silences TEXT,
+    error TEXT,
+    analyzed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_loudness ON analysis (loudness);
+CREATE INDEX IF NOT EXISTS analysis_tempo ON analysis (tempo);
+CREATE INDEX IF NOT EXISTS analysis_key ON analysis (key);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    file_hash TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL,
+    duplicate_of TEXT,
+    similarity REAL,
+    fingerprinted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_duplicate_of ON fingerprints (duplicate_of);
+CREATE TABLE IF NOT EXISTS fingerprint_words (
+    word INTEGER NOT NULL,
+    file_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprint_words_word ON fingerprint_words (word);
+"""
+
+# Near-duplicate candidates checked per new track, and the fewest shared words that makes one
+DUPLICATE_CANDIDATES = 5
+MIN_SHARED_WORDS = 8
+# SQLite's limit on host parameters is 999 in older builds
+WORDS_PER_QUERY = 900
+
+# Sortable columns, by the names the UI offers
+SORT_COLUMNS = {
+    'created': 'created_at',
+    'title': 'title COLLATE NOCASE',
+    'duration': 'duration',
+    'song': 'song_title COLLATE NOCASE',
+    'size': 'file_size',
+    'loudness': 'loudness',
+    'peak': 'peak',
+    'tempo': 'tempo',
+    'key': 'key',
+}
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DuplicateTally:
+    """Running totals of what duplicates() reports, regrouping only the tracks a change touches."""
+
+    def __init__(self, rows=()):
+        self.tracks = {}
+        self.paths = {}
+        self.hashes = {}
+        self.groups = {}
+        self.stats = {}
+        self.duplicates = 0
+        self.reclaimable = 0
+        for row in rows:
+            self.add(row)
+
+    def add(self, track):
+        """track has the columns duplicates() selects, with original the audio it is grouped under."""
+        self.remove(track['path'])
+        self.tracks[track['id']] = track
+        self.paths[track['path']] = track['id']
+        self.hashes.setdefault(track['file_hash'], set()).add(track['id'])
+        self.groups.setdefault(track['original'], {})[track['id']] = track
+        self._recount(track['original'])
+
+    def remove(self, path):
+        track = self.tracks.pop(self.paths.pop(path, None), None)
+        if track is not None:
+            self.hashes[track['file_hash']].discard(track['id'])
+            del self.groups[track['original']][track['id']]
+            self._recount(track['original'])
+
+    def relink(self, file_hash, original):
+        """Move the tracks of file_hash into original's group, once its fingerprint is known."""
+        for track_id in list(self.hashes.get(file_hash, ())):
+            self.add(dict(self.tracks[track_id], original=original))
+
+    def _recount(self, original):
+        duplicates, reclaimable = self.stats.pop(original, (0, 0))
+        self.duplicates -= duplicates
+        self.reclaimable -= reclaimable
+        tracks = sorted(self.groups.get(original, {}).values(), key=lambda track: (track['created_at'], track['id']))
+        if not tracks:
+            self.groups.pop(original, None)
+        if len(tracks) < 2:
+            return
+        keep = next((track for track in tracks if track['file_hash'] == original), tracks[0])
+        stats = (len(tracks) - 1, sum(track['file_size'] for track in tracks) - keep['file_size'])
+        self.stats[original] = stats
+        self.duplicates += stats[0]
+        self.reclaimable += stats[1]
+
+    def summary(self):
+        return {'groups': len(self.stats), 'duplicates': self.duplicates, 'reclaimable': self.reclaimable}
+
+
+def header_duration(path):
+    """Duration from a WAV header; other formats would need decoding, so they are left unknown."""
+    if not path.lower().endswith('.wav'):
+        return None
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+class AudioLibrary:
+    def __init__(self, path=LIBRARY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Built on the first duplicate_summary() call
+        self._tally = None
+        self._tally_lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def add(self, path, title=None, song_title=None, chain_id=None, clip=None, song_response=None, duration=None):
+        """Catalog a track file (replacing any row for the same path); returns its id."""
+        clip = clip or {}
+        stat = os.stat(path)
+        created = clip.get('createTime')
+        values = {
+            'path': os.path.normpath(path),
+            'title': title or clip.get('title') or os.path.splitext(os.path.basename(path))[0],
+            'song_title': song_title,
+            'chain_id': chain_id,
+            'prompt': clip.get('prompt', ''),
+            'tags': clip.get('tags', ''),
+            'model_name': clip.get('model_name', ''),
+            'song_response': json.dumps(song_response, ensure_ascii=False) if song_response else None,
+            'duration': duration if duration is not None else header_duration(path) or clip.get('duration'),
+            'file_size': stat.st_size,
+            'file_hash': file_hash(path),
+            'mtime': stat.st_mtime,
+            # UdioPro's createTime is in milliseconds
+            'created_at': created / 1000 if created else stat.st_mtime,
+            'added_at': time.time(),
+        }
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        track_id = self._execute(f"INSERT OR REPLACE INTO tracks ({columns}) VALUES ({placeholders})",
+                                 tuple(values.values())).lastrowid
+        with self._tally_lock:
+            if self._tally is not None:
+                rows = self._query("SELECT duplicate_of FROM fingerprints WHERE file_hash = ?", (values['file_hash'],))
+                self._tally.add({'id': track_id, 'path': values['path'], 'title': values['title'],
+                                 'song_title': song_title, 'file_size': values['file_size'],
+                                 'created_at': values['created_at'], 'file_hash': values['file_hash'],
+                                 'original': rows[0]['duplicate_of'] if rows and rows[0]['duplicate_of']
+                                 else values['file_hash'],
+                                 'similarity': None})
+        return track_id
+
+    def sync(self, folder=LIBRARY_DIR):
+        """Catalog audio files in folder that have no row yet and drop rows whose file is gone.
+
+        Known files are matched by path alone, so a sync of a large, unchanged library reads no audio.
+        """
+        known = {row['path'] for row in self._query("SELECT path FROM tracks")}
+        added = 0
+        if os.path.isdir(folder):
+            for entry in os.scandir(folder):
+                path = os.path.normpath(entry.path)
+                if entry.is_file() and entry.name.lower().endswith(AUDIO_EXTENSIONS) and path not in known:
+                    try:
+                        self.add(path)
+                        added += 1
+                    except OSError as e:
+                        logger.warning(f"Could not catalog {path}: {str(e)}")
+        gone = [path for path in known if not os.path.exists(path)]
+        with self._lock:
+            self._db.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in gone])
+        with self._tally_lock:
+            if self._tally is not None:
+                for path in gone:
+                    self._tally.remove(path)
+        if added or gone:
+            logger.info(f"Audio library synced: {added} tracks added, {len(gone)} removed")
+        return added, len(gone)
+
+    def query(self, search=None, song_title=None, model_name=None, key=None, tempo=None, loudness=None,
+              sort='created', descending=True, limit=None, offset=0, collapse_duplicates=False):
+        """Catalog rows matching the filters, with their analysis; search matches title, song, tags and prompt.
+
+        tempo and loudness are (low, high) ranges; tracks not analyzed yet never match them.
+        collapse_duplicates leaves out copies of a file and near-duplicates of a track still in the library.
+        """
+        where, params = [], []
+        if collapse_duplicates:
+            where.append("tracks.id IN (SELECT MIN(id) FROM tracks GROUP BY file_hash)")
+            where.append("(duplicate_of IS NULL OR duplicate_of NOT IN (SELECT file_hash FROM tracks))")
+        if search:
+            where.append("(title LIKE ? OR song_title LIKE ? OR tags LIKE ? OR prompt LIKE ?)")
+            params += [f"%{search}%"] * 4
+        if song_title:
+            where.append("song_title = ?")
+            params.append(song_title)
+        if model_name:
+            where.append("model_name = ?")
+            params.append(model_name)
+        if key:
+            where.append("key = ?")
+            params.append(key)
+        for column, bounds in (('tempo', tempo), ('loudness', loudness)):
+            if bounds:
+                where.append(f"{column} BETWEEN ? AND ?")
+                params += list(bounds)
+        sql = ("SELECT id, path, title, song_title, chain_id, prompt, tags, model_name, duration, file_size, "
+               "created_at, tracks.file_hash, loudness, peak, tempo, key, duplicate_of, similarity "
+               "FROM tracks LEFT JOIN analysis ON analysis.file_hash = tracks.file_hash "
+               "LEFT JOIN fingerprints ON fingerprints.file_hash = tracks.file_hash")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # Unanalyzed tracks sort last whichever the direction
+        sql += f" ORDER BY {SORT_COLUMNS[sort].split()[0]} IS NULL, {SORT_COLUMNS[sort]} "
+        sql += f"{'DESC' if descending else 'ASC'}, id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self._query(sql, params)
+
+    def unanalyzed(self, limit=None):
+        # Tracks analyzed before fingerprinting existed are analyzed again to get one
+        sql = ("SELECT tracks.path, tracks.file_hash FROM tracks "
+               "LEFT JOIN analysis ON analysis.file_hash = tracks.file_hash "
+               "LEFT JOIN fingerprints ON fingerprints.file_hash = tracks.file_hash "
+               "WHERE analysis.file_hash IS NULL OR (fingerprints.file_hash IS NULL AND analysis.error IS NULL) "
+               "GROUP BY tracks.file_hash ORDER BY MAX(tracks.added_at) DESC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql)
+
+    def save_analysis(self, file_hash, result, error=None):
+        result = result or {}
+        self._execute(
+            "INSERT OR REPLACE INTO analysis (file_hash, loudness, peak, tempo, key, chroma, silences, error, "
+            "analyzed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_hash, result.get('loudness'), result.get('peak'), result.get('tempo'), result.get('key'),
+             json.dumps(result.get('chroma')) if 'chroma' in result else None,
+             json.dumps(result.get('silences')) if 'silences' in result else None, error, time.time()))
+        if result.get('duration'):
+            # Fills in durations that could not be read from the file's header
+            self._execute("UPDATE tracks SET duration = ? WHERE file_hash = ? AND duration IS NULL",
+                          (result['duration'], file_hash))
+
+    def analysis(self, file_hash):
+        rows = self._query("SELECT * FROM analysis WHERE file_hash = ?", (file_hash,))
+        if not rows:
+            return None
+        analysis = rows[0]
+        for name in ('chroma', 'silences'):
+            analysis[name] = json.loads(analysis[name]) if analysis[name] else None
+        return analysis
+
+    def _candidates(self, file_hash, words):
+        """Fingerprinted files sharing the most indexed words with words, most first."""
+        shared = Counter()
+        for start in range(0, len(words), WORDS_PER_QUERY):
+            chunk = words[start:start + WORDS_PER_QUERY]
+            rows = self._query(
+                f"SELECT file_hash, COUNT(*) AS hits FROM fingerprint_words WHERE word IN "
+                f"({', '.join('?' for _ in chunk)}) AND file_hash != ? GROUP BY file_hash", (*chunk, file_hash))
+            shared.update({row['file_hash']: row['hits'] for row in rows})
+        return [candidate for candidate, hits in shared.most_common(DUPLICATE_CANDIDATES) if hits >= MIN_SHARED_WORDS]
+
+    def save_fingerprint(self, file_hash, words):
+        """Index a file's fingerprint and link it to the audio it duplicates; returns that file's hash or None."""
+        duplicate_of, best = None, 0.0
+        for candidate in self._candidates(file_hash, fingerprint.query_words(words)):
+            rows = self._query("SELECT fingerprint, duplicate_of FROM fingerprints WHERE file_hash = ?", (candidate,))
+            score = fingerprint.similarity(words, fingerprint.from_bytes(rows[0]['fingerprint']))
+            if score >= 1.0 - fingerprint.MATCH_BER and score > best:
+                # Link to the original rather than to another duplicate of it
+                duplicate_of, best = rows[0]['duplicate_of'] or candidate, score
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("DELETE FROM fingerprint_words WHERE file_hash = ?", (file_hash,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO fingerprints (file_hash, fingerprint, duplicate_of, similarity, "
+                    "fingerprinted_at) VALUES (?, ?, ?, ?, ?)",
+                    (file_hash, fingerprint.to_bytes(words), duplicate_of, best if duplicate_of else None,
+                     time.time()))
+                self._db.executemany("INSERT INTO fingerprint_words (word, file_hash) VALUES (?, ?)",
+                                     [(word, file_hash) for word in fingerprint.index_words(words)])
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+        with self._tally_lock:
+            if self._tally is not None:
+                self._tally.relink(file_hash, duplicate_of or file_hash)
+        if duplicate_of:
+            logger.info(f"Audio {file_hash[:12]} duplicates {duplicate_of[:12]} (similarity {best:.2f})")
+        return duplicate_of
+
+    def duplicates(self):
+        """Groups of tracks with the same audio, each {'keep': track, 'duplicates': [tracks], 'reclaimable': bytes}.
+
+        The earliest track of the original audio is kept; exact copies of a file count as duplicates too.
+        """
+        groups = {}
+        for row in self._grouped_tracks():
+            groups.setdefault(row['original'], []).append(row)
+        result = []
+        for original, tracks in groups.items():
+            if len(tracks) < 2:
+                continue
+            keep = next((track for track in tracks if track['file_hash'] == original), tracks[0])
+            duplicates = [track for track in tracks if track is not keep]
+            result.append({'keep': keep, 'duplicates': duplicates,
+                           'reclaimable': sum(track['file_size'] for track in duplicates)})
+        return result
+
+    def _grouped_tracks(self):
+        return self._query(
+            "SELECT id, path, title, song_title, file_size, created_at, tracks.file_hash, "
+            "COALESCE(duplicate_of, tracks.file_hash) AS original, similarity FROM tracks "
+            "LEFT JOIN fingerprints ON fingerprints.file_hash = tracks.file_hash ORDER BY created_at, id")
+
+    def duplicate_summary(self):
+        """{'groups', 'duplicates', 'reclaimable'} totals of duplicates(), without rescanning the catalog."""
+        with self._tally_lock:
+            if self._tally is None:
+                self._tally = DuplicateTally(self._grouped_tracks())
+            return self._tally.summary()
+
+    def reclaimable_bytes(self):
+        """Disk space that deleting every duplicate would free."""
+        return self.duplicate_summary()['reclaimable']
+
+    def track(self, track_id):
+        rows = self._query("SELECT * FROM tracks WHERE id = ?", (track_id,))
+        if not rows:
+            return None
+        track = rows[0]
+        track['song_response'] = json.loads(track['song_response']) if track['song_response'] else None
+        return track
+
+    def rename_song(self, old_title, new_title):
+        self._execute("UPDATE tracks SET song_title = ? WHERE song_title = ?", (new_title, old_title))
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """The app's catalog, or None if it cannot be opened; tracks are then listed without metadata."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            try:
+                _library = AudioLibrary()
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Could not open the audio library {LIBRARY_PATH}: {str(e)}")
+        return _library
@@ -0,0 +1,154 @@
+"""Streams audio segments into one track with crossfades, a block of PCM at a time.
+
+Segments are decoded block by block (WAV directly, anything else through ffmpeg) and written to a
+WAV file as they are read, so memory holds one block plus the crossfade overlap, however long the
+track gets.
+"""
+import logging
+import subprocess
+import wave
+import numpy as np
+from pydub.utils import get_encoder_name
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BLOCK_FRAMES = 65536
+CROSSFADE_MS = 1500
+# A clip that continues its parent from where it ended only needs the seam de-clicked
+CONTINUATION_CROSSFADE_MS = 10
+
+
+class AudioStitchError(Exception):
+    pass
+
+
+def _wav_blocks(path, block_frames):
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise AudioStitchError(f"{path}: only 16-bit WAV is supported, got {wav.getsampwidth() * 8}-bit")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        while True:
+            data = wav.readframes(block_frames)
+            if not data:
+                return
+            yield rate, np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+
+
+def _ffmpeg_blocks(path, block_frames, rate, channels):
+    command = [get_encoder_name(), '-v', 'error', '-i', path, '-f', 's16le', '-acodec', 'pcm_s16le',
+               '-ac', str(channels), '-ar', str(rate), '-']
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise AudioStitchError(f"Could not start ffmpeg to decode {path}: {str(e)}")
+    block_bytes = block_frames * channels * 2
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            # A read can end mid-frame only at end of stream
+            data = data[:len(data) - len(data) % (channels * 2)]
+            yield rate, np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+    finally:
+        process.stdout.close()
+        error = process.stderr.read().decode('utf-8', 'replace').strip()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise AudioStitchError(f"ffmpeg could not decode {path}: {error}")
+
+
+def _conform(block, rate, channels, target_rate):
+    """Match the output channel count and rate; resampling is linear, which is enough for a preview mix."""
+    if block.shape[1] != channels:
+        block = np.repeat(block[:, :1], channels, axis=1) if block.shape[1] == 1 else block[:, :channels]
+    if rate != target_rate and len(block):
+        length = max(1, int(round(len(block) * target_rate / rate)))
+        positions = np.linspace(0, len(block) - 1, length)
+        block = np.stack([np.interp(positions, np.arange(len(block)), block[:, c]) for c in range(channels)], axis=1)
+    return block.astype(np.float32)
+
+
+def pcm_blocks(path, rate=SAMPLE_RATE, channels=CHANNELS, block_frames=BLOCK_FRAMES):
+    """Yield float32 (frames, channels) blocks of the file at the given rate and channel count."""
+    if path.lower().endswith('.wav'):
+        blocks = _wav_blocks(path, block_frames)
+    else:
+        blocks = _ffmpeg_blocks(path, block_frames, rate, channels)
+    for source_rate, block in blocks:
+        yield _conform(block, source_rate, channels, rate)
+
+
+def _crossfade(tail, head):
+    """Equal-power mix of the previous segment's tail into the next segment's head."""
+    t = (np.arange(len(tail), dtype=np.float32) + 0.5) / len(tail)
+    return tail * np.cos(t * np.pi / 2)[:, None] + head * np.sin(t * np.pi / 2)[:, None]
+
+
+def stitch(paths, out_path, crossfade_ms=CROSSFADE_MS, rate=SAMPLE_RATE, channels=CHANNELS,
+           block_frames=BLOCK_FRAMES):
+    """Join the files in order into one 16-bit WAV, crossfading each boundary; returns its length in seconds.
+
+    crossfade_ms is either one length for every boundary or a list with one per boundary. Each boundary
+    fades over at most the frames both of its segments can spare, so a take shorter than its crossfades
+    shares its frames between the boundary before it and the one after.
+    """
+    if isinstance(crossfade_ms, (int, float)):
+        crossfade_ms = [crossfade_ms] * max(0, len(paths) - 1)
+    fades = [int(rate * ms / 1000) for ms in crossfade_ms]
+    written = 0
+
+    with wave.open(out_path, 'wb') as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+
+        def write(frames):
+            nonlocal written
+            if len(frames):
+                out.writeframes(np.clip(np.round(frames), -32768, 32767).astype('<i2').tobytes())
+                written += len(frames)
+
+        # The last `fade` frames of the segment being read are held back to mix into the next one
+        tail = np.zeros((0, channels), dtype=np.float32)
+        for index, path in enumerate(paths):
+            # Held back for the boundary after this segment
+            fade = fades[index] if index < len(fades) else 0
+            held = np.zeros((0, channels), dtype=np.float32)
+            head = []
+            read = 0
+            mixing = len(tail) > 0
+            for block in pcm_blocks(path, rate, channels, block_frames):
+                read += len(block)
+                if mixing:
+                    head.append(block)
+                    # Mixed once the segment is known to cover both its crossfades
+                    if read < len(tail) + fade:
+                        continue
+                    block = np.concatenate(head)
+                    write(_crossfade(tail, block[:len(tail)]))
+                    block = block[len(tail):]
+                    mixing = False
+                held = np.concatenate([held, block])
+                if len(held) > fade:
+                    write(held[:len(held) - fade])
+                    held = held[len(held) - fade:]
+            if not read:
+                logger.warning(f"Skipping empty audio segment {path}")
+                continue
+            if mixing:
+                # Too short for both crossfades: the boundary after it keeps up to half of it, or more if
+                # the boundary before needs less, and the boundary before fades over the rest
+                block = np.concatenate(head)
+                keep = min(fade, max(len(block) - len(tail), len(block) // 2))
+                overlap = min(len(tail), len(block) - keep)
+                write(tail[:len(tail) - overlap])
+                if overlap:
+                    write(_crossfade(tail[len(tail) - overlap:], block[:overlap]))
+                held = block[overlap:]
+            tail = held
+        write(tail)
+    return written / rate
@@ -0,0 +1,259 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from openai import OpenAI
+from PyQt5.QtCore import QCoreApplication
+from generation_scheduler import get_scheduler, OPENAI_CHAT
+from prompt_registry import get_prompt_registry
+from song_stages import STAGES, DOCUMENT_FILES, load_documents, run_stage
+from stage_graph import StageGraphExecutor
+from telemetry import get_telemetry, request_context
+from tracing import span
+from log_setup import setup_logging
+from paths import song_folder
+
+logger = logging.getLogger(__name__)
+
+SONGS_DIR = 'songs'
+SONGS_INDEX = 'songs.json'
+# Per song folder: input hash of every stage's last run, so --rerun-from skips stages whose inputs are unchanged
+STAGE_INPUTS_FILE = 'stage_inputs.json'
+
+_index_lock = threading.Lock()
+
+
+class BatchReport:
+    def __init__(self):
+        self.results = []
+        self.failures = []
+        self.songs = []
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, title, result):
+        with self._lock:
+            self.results.append((title, result))
+        ttft = result.time_to_first_token
+        logger.info(f"{title} / {result.stage}: {result.latency:.2f}s (first token {ttft or 0:.2f}s), "
+                    f"{result.prompt_tokens} prompt + {result.completion_tokens} completion tokens")
+
+    def add_song(self, title, wall_clock, critical_path):
+        with self._lock:
+            self.songs.append({'title': title, 'wall_clock': wall_clock, 'critical_path': critical_path})
+
+    def fail(self, title, stage, error):
+        with self._lock:
+            self.failures.append({'title': title, 'stage': stage, 'error': str(error)})
+
+    def summary(self):
+        stages = {}
+        for title, result in self.results:
+            entry = stages.setdefault(result.stage, {'latency': [], 'ttft': [], 'prompt_tokens': 0, 'completion_tokens': 0})
+            entry['latency'].append(result.latency)
+            if result.time_to_first_token is not None:
+                entry['ttft'].append(result.time_to_first_token)
+            entry['prompt_tokens'] += result.prompt_tokens
+            entry['completion_tokens'] += result.completion_tokens
+        summary = {}
+        for stage in sorted(stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            entry = stages[stage]
+            summary[stage] = {
+                'runs': len(entry['latency']),
+                'latency_mean': statistics.mean(entry['latency']),
+                'latency_max': max(entry['latency']),
+                'ttft_mean': statistics.mean(entry['ttft']) if entry['ttft'] else None,
+                'prompt_tokens': entry['prompt_tokens'],
+                'completion_tokens': entry['completion_tokens'],
+            }
+        return {
+            'wall_clock': time.time() - self.started_at,
+            'songs': len(self.songs),
+            'song_wall_clock_mean': statistics.mean(s['wall_clock'] for s in self.songs) if self.songs else None,
+            'song_critical_path_mean': statistics.mean(s['critical_path'] for s in self.songs) if self.songs else None,
+            'stage_latency_sum_mean': sum(entry['latency_mean'] for entry in summary.values()),
+            'stages': summary,
+            'failures': self.failures,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"\n{'stage':<15}{'runs':>6}{'mean s':>10}{'max s':>10}{'ttft s':>10}{'prompt tok':>12}{'compl tok':>12}")
+        for stage, entry in summary['stages'].items():
+            ttft = f"{entry['ttft_mean']:.2f}" if entry['ttft_mean'] is not None else '-'
+            print(f"{stage:<15}{entry['runs']:>6}{entry['latency_mean']:>10.2f}{entry['latency_max']:>10.2f}"
+                  f"{ttft:>10}{entry['prompt_tokens']:>12}{entry['completion_tokens']:>12}")
+        print(f"\n{summary['songs']} songs in {summary['wall_clock']:.1f}s, {len(summary['failures'])} failed stages")
+        if summary['song_wall_clock_mean'] is not None:
+            print(f"Per song: {summary['song_wall_clock_mean']:.1f}s end to end, "
+                  f"critical path {summary['song_critical_path_mean']:.1f}s, "
+                  f"sum of stages {summary['stage_latency_sum_mean']:.1f}s")
+        for failure in summary['failures']:
+            print(f"  {failure['title']} / {failure['stage']}: {failure['error']}")
+
+
+def load_spec(path):
+    """Spec format: {"defaults": {stage: prompt}, "songs": [{"title", "brief", "prompts": {stage: prompt}}]}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'songs': spec}
+    for song in spec.get('songs', []):
+        if not song.get('title'):
+            raise ValueError(f"Every song in {path} needs a title")
+    return spec
+
+
+def stage_message(song, defaults, stage):
+    message = song.get('prompts', {}).get(stage) or defaults.get(stage) or song.get('brief', '')
+    return message.replace('{title}', song['title']).replace('{brief}', song.get('brief', ''))
+
+
+def load_fan_count():
+    try:
+        with open('band.json', 'r') as f:
+            return json.load(f).get('fans', 1)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 1
+
+
+def register_song(title, documents):
+    # Same record SongManagementTab keeps in songs.json
+    with _index_lock:
+        songs = []
+        if os.path.exists(SONGS_INDEX):
+            with open(SONGS_INDEX, 'r') as f:
+                songs = json.load(f)
+        record = next((song for song in songs if song['title'] == title), None)
+        if record is None:
+            record = {'title': title}
+            songs.append(record)
+        for component in ['lyrics', 'composition', 'visual_design', 'concept']:
+            record[component] = documents.get(component, '')
+        with open(SONGS_INDEX, 'w') as f:
+            json.dump(songs, f)
+
+
+def generate_song(client, prompts, song, defaults, stages, fan_count, report, songs_dir=SONGS_DIR, rerun_from=None):
+    title = song['title']
+    # Same folder the GUI opens for this title, and never outside songs_dir
+    folder = song_folder(title, songs_dir)
+    os.makedirs(folder, exist_ok=True)
+    for stage in STAGES:
+        path = os.path.join(folder, DOCUMENT_FILES[stage])
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('')
+    documents = load_documents(folder)
+    inputs_path = os.path.join(folder, STAGE_INPUTS_FILE)
+    try:
+        with open(inputs_path, 'r', encoding='utf-8') as f:
+            input_hashes = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        input_hashes = {}
+    inputs_lock = threading.Lock()
+
+    def run(stage, snapshot, job):
+        with request_context(tab='batch', song=title):
+            return run_stage(stage, client, prompts, snapshot, stage_message(song, defaults, stage),
+                             job=job, fan_count=fan_count)
+
+    def save(stage, result, document):
+        with open(os.path.join(folder, DOCUMENT_FILES[stage]), 'w', encoding='utf-8') as f:
+            f.write(document)
+        with inputs_lock:
+            with open(inputs_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(executor.input_hashes), f, indent=2)
+        report.add(title, result)
+
+    executor = StageGraphExecutor(run, documents, label=title, on_stage_done=save, input_hashes=input_hashes)
+    with span('song', title=title, rerun_from=rerun_from) as current:
+        if rerun_from:
+            executor.rerun_from(rerun_from, stages)
+            if executor.unchanged:
+                logger.info(f"{title}: inputs unchanged, not re-run: {', '.join(executor.unchanged)}")
+        else:
+            executor.run(stages)
+        current.set(critical_path=executor.critical_path(), failed=sorted(executor.errors))
+    for stage, error in executor.errors.items():
+        report.fail(title, stage, error)
+        logger.error(f"{title} / {stage} failed: {str(error)}")
+    report.add_song(title, executor.finished_at - executor.started_at, executor.critical_path())
+
+    register_song(title, executor.documents)
+    return title
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bandmanager batch', description='Generate full songs without the GUI')
+    parser.add_argument('spec', help='JSON spec file listing the songs to generate')
+    parser.add_argument('--workers', type=int, default=2, help='Songs generated concurrently')
+    parser.add_argument('--max-requests', type=int, default=None, help='Concurrent OpenAI chat requests')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run, in order')
+    parser.add_argument('--rerun-from', choices=STAGES,
+                        help='Only re-run the stages downstream of this one (within --stages) whose inputs changed')
+    parser.add_argument('--report', help='Write the latency and token report to this JSON file')
+    parser.add_argument('--openai-base-url', help='OpenAI-compatible endpoint, e.g. a local mock_services.py')
+    parser.add_argument('--udiopro-base-url', help='UdioPro endpoint, e.g. a local mock_services.py')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this localhost port')
+    parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.DEBUG if args.verbose else logging.INFO, log_file='batch.jsonl')
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    if args.metrics_port:
+        get_telemetry().serve(args.metrics_port)
+
+    load_dotenv()
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        print("Error: OpenAI API key not found. Please add OPENAI_API_KEY to your .env file.")
+        return 1
+
+    # The prompt registry is a QObject; a core application is enough without any widgets
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    prompts = get_prompt_registry()
+    if args.udiopro_base_url:
+        os.environ['UDIOPRO_BASE_URL'] = args.udiopro_base_url
+    # Without --openai-base-url the SDK falls back to OPENAI_BASE_URL
+    client = OpenAI(api_key=api_key, base_url=args.openai_base_url)
+    spec = load_spec(args.spec)
+    defaults = spec.get('defaults', {})
+    fan_count = load_fan_count()
+    if args.max_requests:
+        get_scheduler().limits[OPENAI_CHAT] = args.max_requests
+
+    report = BatchReport()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(generate_song, client, prompts, song, defaults, stages, fan_count, report,
+                                   rerun_from=args.rerun_from)
+                   for song in spec.get('songs', [])]
+        titles = {future: song['title'] for future, song in zip(futures, spec.get('songs', []))}
+        for future in as_completed(futures):
+            try:
+                logger.info(f"Song finished: {future.result()}")
+            except Exception as e:
+                # One song's failure is reported with the others rather than losing the whole summary
+                report.fail(titles[future], 'song', e)
+                logger.exception(f"{titles[future]} failed: {str(e)}")
+
+    report.print_summary()
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(dict(report.summary(), telemetry=get_telemetry().summary()), f, indent=2)
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
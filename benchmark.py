@@ -0,0 +1,539 @@
+"""Benchmarks for the generation, persistence and rendering hot paths.
+
+Everything runs in a scratch working directory against mock_services, so no API keys or network are needed:
+
+    python benchmark.py                       # run and compare with benchmarks/baseline.json
+    python benchmark.py --only waveform,songs
+    python benchmark.py --update-baseline     # accept the current numbers as the new baseline
+
+The exit status is 1 when any metric is slower than its baseline by more than --threshold.
+"""
+import argparse
+import array
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(REPO_DIR, 'benchmarks', 'baseline.json')
+
+DEFAULT_THRESHOLD = 0.25
+# Differences below this many milliseconds are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 2.0
+
+SONG_COUNT = 10000
+TRACK_SECONDS = 300
+DOCUMENT_CHARS = 60000
+STREAM_TOKENS = 2000
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class Skipped(Exception):
+    pass
+
+
+def timed(fn, repeat=1):
+    """Call fn repeat times and return the median duration in milliseconds."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def filler_text(chars, seed=0):
+    rng = random.Random(seed)
+    words = "neon static signal bloom midnight circuit echo chorus verse bridge synth pulse dream".split()
+    lines = []
+    length = 0
+    while length < chars:
+        line = " ".join(rng.choice(words) for _ in range(12))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:chars]
+
+
+def write_track(path, seconds=TRACK_SECONDS, rate=44100):
+    # One second of a decaying chord with noise, repeated: realistic sample range without minutes of Python loops
+    rng = random.Random(1)
+    second = array.array('h')
+    for i in range(rate):
+        t = i / rate
+        value = 0.4 * math.sin(2 * math.pi * 220 * t) + 0.3 * math.sin(2 * math.pi * 277 * t) + 0.1 * rng.uniform(-1, 1)
+        sample = int(20000 * value * (1 - t * 0.5))
+        second.extend((sample, sample))
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        frames = second.tobytes()
+        for _ in range(seconds):
+            wav.writeframes(frames)
+
+
+@contextmanager
+def quiet_dialogs():
+    """Answer modal message boxes immediately so save and delete paths can be timed."""
+    from PyQt5.QtWidgets import QMessageBox
+    originals = {name: getattr(QMessageBox, name) for name in ('information', 'warning', 'question')}
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+    try:
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(QMessageBox, name, original)
+
+
+def write_song_library(count=SONG_COUNT, chars=2000):
+    songs = [{'title': f"Song {i:05d}", 'lyrics': filler_text(chars, i), 'composition': filler_text(chars // 2, i),
+              'visual_design': filler_text(chars // 4, i), 'concept': filler_text(chars // 2, i)}
+             for i in range(count)]
+    random.Random(2).shuffle(songs)
+    with open('songs.json', 'w') as f:
+        json.dump(songs, f)
+    return songs
+
+
+class BenchmarkContext:
+    """Scratch working directory, mock services and a Qt application shared by every benchmark."""
+
+    def __init__(self, repeat=3):
+        self.repeat = repeat
+        self.app = None
+        self.mock = None
+
+    def __enter__(self):
+        from mock_services import MockServices, MockConfig
+        self.previous_cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix='bandmanager-bench-')
+        shutil.copytree(os.path.join(REPO_DIR, 'prompts'), os.path.join(self.workdir, 'prompts'))
+        os.chdir(self.workdir)
+        with open('band.json', 'w') as f:
+            json.dump({'name': 'Benchmark Band', 'fans': 1000}, f)
+
+        self.mock_config = MockConfig(ttft=0.2, tokens_per_second=400, completion_tokens=200, job_duration=1,
+                                      audio_seconds=1, image_latency=0.1, seed=1)
+        self.mock = MockServices(self.mock_config).start()
+        self.env = {'OPENAI_API_KEY': 'benchmark', 'OPENAI_BASE_URL': self.mock.openai_base_url,
+                    'UDIOPRO_API_KEY': 'benchmark', 'UDIOPRO_BASE_URL': self.mock.udiopro_base_url,
+                    'QT_QPA_PLATFORM': os.environ.get('QT_QPA_PLATFORM', 'offscreen')}
+        os.environ.update(self.env)
+        return self
+
+    def qt_app(self):
+        if self.app is None:
+            from PyQt5.QtWidgets import QApplication
+            self.app = QApplication.instance() or QApplication(sys.argv[:1])
+        return self.app
+
+    def __exit__(self, *exc_info):
+        self.mock.stop()
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+@benchmark('context_assembly')
+def bench_context_assembly(ctx):
+    from prompt_registry import get_prompt_registry
+    from song_stages import STAGES, DOCUMENTS, DOCUMENT_FILES, load_documents, build_messages
+    ctx.qt_app()
+    folder = os.path.join('songs', 'Context Song')
+    os.makedirs(folder, exist_ok=True)
+    for i, name in enumerate(DOCUMENTS):
+        base = '.' if name in ('band_info', 'management') else folder
+        with open(os.path.join(base, DOCUMENT_FILES[name]), 'w', encoding='utf-8') as f:
+            f.write(filler_text(DOCUMENT_CHARS, i))
+    prompts = get_prompt_registry()
+    documents = load_documents(folder)
+
+    def assemble():
+        for stage in STAGES:
+            build_messages(stage, prompts, documents, "Write the next part", fan_count=1000)
+
+    return {
+        'load_documents_ms': timed(lambda: load_documents(folder), ctx.repeat * 5),
+        'build_messages_all_stages_ms': timed(assemble, ctx.repeat * 5),
+    }
+
+
+@benchmark('stage_stream')
+def bench_stage_stream(ctx):
+    from openai import OpenAI
+    from prompt_registry import get_prompt_registry
+    from song_stages import load_documents, run_stage
+    ctx.qt_app()
+    client = OpenAI()
+    documents = load_documents()
+    config = ctx.mock_config
+    expected = config.ttft + config.completion_tokens / config.tokens_per_second
+    overheads = []
+    first_tokens = []
+    for _ in range(ctx.repeat):
+        result = run_stage('concept', client, get_prompt_registry(), documents, "A song about benchmarks")
+        overheads.append((result.latency - expected) * 1000)
+        first_tokens.append((result.time_to_first_token - config.ttft) * 1000)
+    # Time spent in our own code on top of what the mock server deliberately waits
+    return {'stage_overhead_ms': statistics.median(overheads),
+            'first_token_overhead_ms': statistics.median(first_tokens)}
+
+
+@benchmark('stream_render')
+def bench_stream_render(ctx):
+    from concept import ConceptTab
+    app = ctx.qt_app()
+    tab = ConceptTab()
+    tab.resize(1600, 900)
+    tab.show()
+    for i in range(500):
+        tab.chat_area.append(f"You: message {i}\nAssistant : {filler_text(400, i)}")
+    app.processEvents()
+    tokens = [word + " " for word in filler_text(STREAM_TOKENS * 8).split()[:STREAM_TOKENS]]
+    tab.chat_area.append("Assistant : ")
+    durations = []
+    started = time.perf_counter()
+    for token in tokens:
+        # Each streamed chunk arrives as its own queued signal, followed by a layout and paint pass
+        chunk_started = time.perf_counter()
+        tab.chat_area.insertPlainText(token)
+        app.processEvents()
+        durations.append((time.perf_counter() - chunk_started) * 1000)
+    total = (time.perf_counter() - started) * 1000
+    tab.close()
+    return {'chunk_p50_ms': percentile(durations, 0.5), 'chunk_p95_ms': percentile(durations, 0.95),
+            'chunk_max_ms': max(durations), 'stream_total_ms': total}
+
+
+@benchmark('waveform')
+def bench_waveform(ctx):
+    try:
+        import waveform_peaks
+        from waveform_widget import WaveformWidget
+    except ImportError as e:
+        raise Skipped(str(e))
+    ctx.qt_app()
+    path = os.path.abspath('track.wav')
+    if not os.path.exists(path):
+        write_track(path)
+    widget = WaveformWidget()
+    widget.resize(1600, 120)
+    # Peaks are built every time, as for a track the player has not prepared
+    build_ms = timed(lambda: widget.set_peaks(waveform_peaks.load(path)), max(1, ctx.repeat // 2))
+    # What the GUI thread spends showing a track whose peaks are in the cache
+    waveform_peaks.get_peak_cache().get(path)
+    cached_ms = timed(lambda: widget.load_audio(path), ctx.repeat)
+    widget.update_position(widget.duration // 2)
+    paint_ms = timed(widget.grab, ctx.repeat)
+    widget.resize(800, 120)
+    resized_paint_ms = timed(widget.grab, ctx.repeat)
+    # Zoomed in to single samples in the middle of the track
+    widget.view_start, widget.view_span = widget.total_seconds() / 2, widget.min_span()
+    zoomed_paint_ms = timed(widget.grab, ctx.repeat)
+    return {'build_peaks_ms': build_ms, 'load_audio_cached_ms': cached_ms, 'paint_ms': paint_ms, 'paint_after_resize_ms': resized_paint_ms,
+            'paint_sample_zoom_ms': zoomed_paint_ms}
+
+
+@benchmark('spectrogram')
+def bench_spectrogram(ctx):
+    try:
+        import spectrogram
+        from spectrogram_widget import SpectrogramWidget
+    except ImportError as e:
+        raise Skipped(str(e))
+    ctx.qt_app()
+    path = os.path.abspath('track.wav')
+    if not os.path.exists(path):
+        write_track(path)
+    cache = os.path.abspath('spectrograms')
+
+    def compute():
+        shutil.rmtree(cache, ignore_errors=True)
+        spectrogram.load(path, root=cache)
+
+    compute_ms = timed(compute, max(1, ctx.repeat // 2))
+    cached_ms = timed(lambda: spectrogram.load(path, root=cache), ctx.repeat)
+    widget = SpectrogramWidget()
+    widget.resize(1600, 120)
+    widget.spectrogram = spectrogram.load(path, root=cache)
+    widget.set_duration(int(widget.spectrogram.duration * 1000))
+    widget.update_position(widget.duration // 2)
+
+    def paint_cold():
+        widget._images.clear()
+        widget.grab()
+
+    metrics = {'compute_ms': compute_ms, 'load_cached_ms': cached_ms, 'paint_cold_ms': timed(paint_cold, ctx.repeat),
+               'paint_ms': timed(widget.grab, ctx.repeat)}
+    # Zoomed to ten seconds and panned across the track, as when dragging the view
+    widget.view_span = 10.0
+
+    def pan():
+        for start in range(0, int(widget.spectrogram.duration) - 10, 5):
+            widget.view_start = float(start)
+            widget.grab()
+
+    metrics['pan_zoomed_ms'] = timed(pan, ctx.repeat)
+    return metrics
+
+
+@benchmark('stitch')
+def bench_stitch(ctx):
+    from audio_stitch import stitch, CROSSFADE_MS, SAMPLE_RATE
+    write_track('take.wav', seconds=30, rate=SAMPLE_RATE)
+    # Shorter than the crossfades on either side of it, so both boundaries share its frames
+    write_track('short_take.wav', seconds=1, rate=SAMPLE_RATE)
+    paths = ['take.wav', 'short_take.wav', 'take.wav']
+    seconds = []
+    stitch_ms = timed(lambda: seconds.append(stitch(paths, 'stitched.wav', CROSSFADE_MS)), ctx.repeat)
+    # Each boundary fades over half of the short take
+    expected = 30 + 1 + 30 - 1
+    if abs(seconds[-1] - expected) > 1 / SAMPLE_RATE:
+        raise RuntimeError(f"Stitched {seconds[-1]:.3f}s of audio, expected {expected}s")
+    return {'stitch_ms': stitch_ms}
+
+
+@benchmark('songs')
+def bench_song_management(ctx):
+    from PyQt5.QtCore import Qt
+    from song_management import SongManagementTab
+    app = ctx.qt_app()
+    songs = write_song_library()
+    tab = SongManagementTab()
+    target = songs[-1]['title']
+
+    def select_target():
+        tab.song_list.setCurrentItem(tab.song_list.findItems(target, Qt.MatchExactly)[0])
+
+    metrics = {'load_songs_ms': timed(tab.load_songs, ctx.repeat)}
+    select_target()
+    metrics['get_current_song_ms'] = timed(tab.get_current_song, ctx.repeat)
+    song = tab.get_current_song()
+    song['lyrics'] += "\nOne more line"
+    metrics['update_current_song_ms'] = timed(lambda: tab.update_current_song(song), ctx.repeat)
+    with quiet_dialogs():
+        metrics['save_song_ms'] = timed(tab.save_song, ctx.repeat)
+        metrics['sort_songs_ms'] = timed(tab.sort_songs, ctx.repeat)
+    app.processEvents()
+    return metrics
+
+
+@benchmark('main_interface')
+def bench_main_interface(ctx):
+    try:
+        from main_interface import MainInterface
+    except ImportError as e:
+        raise Skipped(str(e))
+    from PyQt5.QtCore import Qt
+    app = ctx.qt_app()
+    songs = write_song_library()
+    title = songs[len(songs) // 2]['title']
+    folder = os.path.join('songs', title)
+    os.makedirs(folder, exist_ok=True)
+    for component in ('concept', 'lyrics', 'composition', 'visual_design'):
+        with open(os.path.join(folder, f'{component}.md'), 'w', encoding='utf-8') as f:
+            f.write(filler_text(DOCUMENT_CHARS))
+    interface = MainInterface()
+    app.processEvents()
+    song_list = interface.song_management_tab.song_list
+    song_list.setCurrentItem(song_list.findItems(title, Qt.MatchExactly)[0])
+
+    def load():
+        interface.load_song(title)
+        app.processEvents()
+
+    with quiet_dialogs():
+        metrics = {'load_song_ms': timed(load, ctx.repeat), 'save_song_ms': timed(interface.save_song, ctx.repeat)}
+    interface.close()
+    return metrics
+
+
+@benchmark('startup')
+def bench_startup(ctx):
+    durations = []
+    for _ in range(ctx.repeat):
+        env = dict(os.environ, BENCHMARK_SPAWNED_AT=repr(time.time()))
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-probe'], env=env,
+                                capture_output=True, text=True, timeout=120)
+        lines = [line for line in output.stdout.splitlines() if line.startswith('{')]
+        if output.returncode != 0 or not lines:
+            raise Skipped(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'startup probe failed')
+        durations.append(json.loads(lines[-1]))
+    return {key: statistics.median(d[key] for d in durations) for key in durations[0]}
+
+
+def startup_probe():
+    """Child process for the startup benchmark: cold imports to the main window's first paint.
+
+    The fixed splash-screen delay in main.py is left out; it is a constant, not a cost.
+    """
+    spawned_at = float(os.environ['BENCHMARK_SPAWNED_AT'])
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QObject, QEvent
+    from style import set_dark_theme
+    app = QApplication(sys.argv[:1])
+    set_dark_theme(app)
+    imported_at = time.time()
+    from main_interface import MainInterface
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not hasattr(self, 'painted_at'):
+                self.painted_at = time.time()
+                app.quit()
+            return False
+
+    first_paint = FirstPaint()
+    constructed_started = time.time()
+    interface = MainInterface()
+    constructed_at = time.time()
+    interface.installEventFilter(first_paint)
+    interface.show()
+    interface.update()
+    app.exec_()
+    print(json.dumps({
+        'qt_ready_ms': (imported_at - spawned_at) * 1000,
+        'main_interface_init_ms': (constructed_at - constructed_started) * 1000,
+        'first_paint_ms': (getattr(first_paint, 'painted_at', time.time()) - spawned_at) * 1000,
+    }))
+
+
+def run_benchmarks(names, repeat):
+    results = {}
+    skipped = {}
+    with BenchmarkContext(repeat) as ctx:
+        for name in names:
+            logger.info(f"Running {name}")
+            try:
+                metrics = BENCHMARKS[name](ctx)
+            except Skipped as e:
+                skipped[name] = str(e)
+                logger.warning(f"Skipped {name}: {str(e)}")
+                continue
+            for metric, value in metrics.items():
+                results[f"{name}.{metric}"] = round(value, 3)
+    return results, skipped
+
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpus': os.cpu_count(), 'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f).get('metrics', {})
+
+
+def compare(results, baseline, threshold):
+    """Return (metric, baseline, current, ratio) for every metric slower than the threshold allows."""
+    regressions = []
+    for metric, current in results.items():
+        previous = baseline.get(metric)
+        if previous is None:
+            continue
+        if current > previous * (1 + threshold) and current - previous > NOISE_FLOOR_MS:
+            regressions.append((metric, previous, current, current / previous if previous else float('inf')))
+    return regressions
+
+
+def print_results(results, baseline, skipped, regressions):
+    regressed = {metric for metric, *_ in regressions}
+    print(f"\n{'metric':<45}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, current in results.items():
+        previous = baseline.get(metric)
+        change = f"{(current / previous - 1) * 100:+.0f}%" if previous else 'new'
+        flag = '  REGRESSION' if metric in regressed else ''
+        base = f"{previous:.2f}" if previous is not None else '-'
+        print(f"{metric:<45}{base:>12}{current:>12.2f}{change:>10}{flag}")
+    for name, reason in skipped.items():
+        print(f"{name:<45} skipped: {reason}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Band Manager hot paths against local stand-ins')
+    parser.add_argument('--only', help=f"Comma-separated benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the median is kept')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown before a metric counts as a regression (0.25 = 25%%)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--startup-probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.startup_probe:
+        startup_probe()
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    results, skipped = run_benchmarks(names, max(1, args.repeat))
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold)
+    print_results(results, baseline, skipped, regressions)
+
+    report = {'environment': environment(), 'metrics': results, 'skipped': skipped}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        # Keep baseline entries for benchmarks that were not run this time; the ones that ran are replaced
+        # whole, so a metric a benchmark no longer reports does not linger
+        previous_skipped = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                previous_skipped = json.load(f).get('skipped', {})
+        report['metrics'] = dict({metric: value for metric, value in baseline.items()
+                                  if metric.split('.', 1)[0] not in names}, **results)
+        report['skipped'] = dict({name: reason for name, reason in previous_skipped.items() if name not in names},
+                                 **skipped)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} metrics regressed more than {args.threshold:.0%}:")
+        for metric, previous, current, ratio in regressions:
+            print(f"  {metric}: {previous:.2f} -> {current:.2f} ms ({ratio:.2f}x)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
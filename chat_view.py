@@ -0,0 +1,255 @@
+"""Chat pane that keeps a bounded number of lines in memory and the full conversation on disk.
+
+Each append() starts a transcript entry and insertPlainText() extends it while a reply streams in.
+Finished entries are appended as JSON lines to the pane's transcript; once the document exceeds
+its block limit Qt drops the oldest lines, and scrolling to the top pages earlier entries back in.
+"""
+import json
+import logging
+import os
+import time
+from PyQt5.QtWidgets import QPlainTextEdit
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtCore import QCoreApplication
+from paths import song_folder
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_DIR = 'transcripts'
+MAX_BLOCKS = 2000
+PAGE_ENTRIES = 50
+
+# Each block's user state is entry index * 2, plus 1 on the entry's first block
+HEAD = 1
+# Lines shown by greet(), which belong to no transcript entry
+GREETING = -2
+
+
+def session_transcript(name):
+    """Where a pane writes while no saved song is loaded."""
+    return os.path.join(TRANSCRIPT_DIR, f"{name}.jsonl")
+
+
+def song_transcript(song_title, name):
+    return os.path.join(song_folder(song_title), 'transcripts', f"{name}.jsonl")
+
+
+class Transcript:
+    """Append-only JSON-lines file with a line offset index for random access."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []
+        self.size = 0
+        if os.path.exists(path):
+            self._index()
+
+    def _index(self):
+        with open(self.path, 'rb') as f:
+            position = 0
+            for line in f:
+                if line.endswith(b'\n'):
+                    self.offsets.append(position)
+                position += len(line)
+        # A torn last line from a crash is ignored and overwritten by the next write
+        self.size = self.offsets[-1] + self._line_length(len(self.offsets) - 1) if self.offsets else 0
+
+    def _line_length(self, index):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[index])
+            return len(f.readline())
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, text):
+        line = (json.dumps({'ts': time.time(), 'text': text}, ensure_ascii=False) + "\n").encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                f.seek(self.size)
+                f.write(line)
+                f.truncate()
+        except OSError as e:
+            logger.warning(f"Could not write to transcript {self.path}: {str(e)}")
+            return
+        self.offsets.append(self.size)
+        self.size += len(line)
+
+    def read(self, start, stop):
+        """Texts of entries start..stop-1."""
+        if start >= stop:
+            return []
+        end = self.offsets[stop] if stop < len(self.offsets) else self.size
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[start])
+            data = f.read(end - self.offsets[start])
+        return [json.loads(line)['text'] for line in data.split(b'\n') if line]
+
+
+class ChatView(QPlainTextEdit):
+    """Drop-in for the read-only QTextEdit chat areas: append() and insertPlainText() keep working."""
+
+    def __init__(self, name, max_blocks=MAX_BLOCKS, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.max_blocks = max_blocks
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_blocks)
+        self.pending = None
+        self.transcript = None
+        self.floor = 0
+        self._paging = False
+        # Kept at the end of the document; cheaper than seeking there for every streamed chunk
+        self._end = QTextCursor(self.document())
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.flush)
+        self.set_transcript(session_transcript(name), show_history=False)
+
+    def set_transcript(self, path, show_history=True):
+        """Switch to another transcript file and show its most recent entries."""
+        self.flush()
+        self.transcript = Transcript(path)
+        self.floor = 0 if show_history else len(self.transcript)
+        self._reset()
+        if show_history:
+            self.page_in(len(self.transcript))
+            self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def flush(self):
+        if self.pending is not None:
+            self.transcript.append(self.pending)
+            self.pending = None
+
+    def append(self, text):
+        self.flush()
+        self.pending = text
+        self._write("\n" + text if self.document().characterCount() > 1 else text, head=True)
+
+    def greet(self, text):
+        """Show text like append() without writing it to the transcript, for a tab's welcome line."""
+        self.flush()
+        self._write("\n" + text if self.document().characterCount() > 1 else text, state=GREETING)
+
+    def insertPlainText(self, text):
+        if self.pending is None:
+            self.append(text)
+            return
+        self.pending += text
+        self._write(text)
+
+    def clear(self):
+        # Earlier entries stay in the transcript but are no longer paged back in
+        self.flush()
+        self.floor = len(self.transcript)
+        self._reset()
+
+    def _reset(self):
+        # Clearing moves the scroll bar to the top, which must not page anything in
+        self._paging = True
+        super().clear()
+        self.setMaximumBlockCount(self.max_blocks)
+        self._paging = False
+
+    def _write(self, text, head=False, state=None):
+        scrollbar = self.verticalScrollBar()
+        following = scrollbar.value() >= scrollbar.maximum() - 1
+        if following and self.maximumBlockCount() == 0:
+            # Back at the live end after reading history: drop the paged-in lines again
+            self.setMaximumBlockCount(self.max_blocks)
+        if not self._end.atEnd():
+            self._end.movePosition(QTextCursor.End)
+        self._end.insertText(text)
+        # Stamp the new lines with the entry they belong to, for paging
+        entry = len(self.transcript)
+        block, stamped = self.document().lastBlock(), None
+        while block.isValid() and block.userState() == -1:
+            block.setUserState(entry * 2 if state is None else state)
+            block, stamped = block.previous(), block
+        if head and stamped is not None:
+            stamped.setUserState(entry * 2 + HEAD)
+        if following:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def on_scroll(self, value):
+        if value == self.verticalScrollBar().minimum() and not self._paging:
+            self.page_in()
+
+    def wheelEvent(self, event):
+        # Without a scroll bar (or already at the top) there is no valueChanged to page in on
+        scrollbar = self.verticalScrollBar()
+        if event.angleDelta().y() > 0 and scrollbar.value() == scrollbar.minimum():
+            self.page_in()
+        super().wheelEvent(event)
+
+    def first_entry(self):
+        """(index, complete) of the oldest entry still shown."""
+        block = self.document().firstBlock()
+        while block.isValid() and block.userState() == GREETING:
+            block = block.next()
+        state = block.userState() if block.isValid() else -1
+        if state < 0:
+            return len(self.transcript), True
+        return state // 2, bool(state & HEAD)
+
+    def page_in(self, before=None):
+        """Prepend up to PAGE_ENTRIES entries from the transcript above what is shown."""
+        reload = False
+        if before is None:
+            before, complete = self.first_entry()
+            if not complete:
+                # The oldest entry was partly trimmed; reload it whole if it has been written yet
+                if before >= len(self.transcript):
+                    return
+                before, reload = before + 1, True
+        start = max(self.floor, before - PAGE_ENTRIES)
+        if start >= before:
+            return
+        try:
+            texts = self.transcript.read(start, before)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read transcript {self.transcript.path}: {str(e)}")
+            return
+
+        self._paging = True
+        scrollbar = self.verticalScrollBar()
+        from_bottom = scrollbar.maximum() - scrollbar.value()
+        # Stays unbounded while history is being read; _write restores the limit at the live end
+        self.setMaximumBlockCount(0)
+        document = self.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        if reload:
+            block = document.firstBlock()
+            while block.isValid() and block.userState() == (before - 1) * 2:
+                block = block.next()
+            cursor.movePosition(QTextCursor.Start)
+            if block.isValid():
+                cursor.setPosition(block.position(), QTextCursor.KeepAnchor)
+            else:
+                cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        shown = document.characterCount() > 1
+        old_first = document.firstBlock().userState()
+        texts = [text.replace("\r\n", "\n").replace("\r", "\n") for text in texts]
+        cursor.movePosition(QTextCursor.Start)
+        cursor.insertText("\n".join(texts) + ("\n" if shown else ""))
+        cursor.endEditBlock()
+
+        # Stamp the inserted lines by character position, one entry per joined text
+        starts, position = [], 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+        block, entry = document.firstBlock(), 0
+        while block.isValid() and block.position() < position:
+            while entry + 1 < len(starts) and starts[entry + 1] <= block.position():
+                entry += 1
+            block.setUserState((start + entry) * 2 + (HEAD if block.position() == starts[entry] else 0))
+            block = block.next()
+        if shown and block.isValid():
+            block.setUserState(old_first)
+        scrollbar.setValue(scrollbar.maximum() - from_bottom)
+        self._paging = False
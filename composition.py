@@ -1,12 +1,16 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QApplication
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QObject, pyqtSlot
 from dotenv import load_dotenv
 import os
 import sys
 sys.path.append('.')  # Ajoute le dossier courant au chemin de recherche
 from openai import OpenAI
-import os
-import sys
+from prompt_registry import get_prompt_registry
+from qt_jobs import submit_stage, submit_summary
+from song_stages import load_documents
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -27,15 +31,14 @@ class CompositionTab(QWidget):
         self.load_api_key()
         self.current_stream = None
         self.stream_buffer = ""
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('composition')
         self.client = None
         self.load_initial_composition()
 
     def load_initial_composition(self):
         try:
-            with open('composition.md', 'r', encoding='utf-8') as f:
-                initial_composition = f.read()
-            self.result_area.setPlainText(initial_composition)
+            self.result_file.load()
         except FileNotFoundError:
             self.chat_area.append("Warning: composition.md file not found. Starting with an empty composition.")
 
@@ -45,10 +48,8 @@ class CompositionTab(QWidget):
 
         # Chat area
         chat_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.textChanged.connect(lambda: self.chat_area.ensureCursorVisible())
-        self.chat_area.append("Greetings! I'm Rhythm, your composition companion. Welcome to the Composition Tab! Here you can work on the musical composition of your song. Start by describing your ideas for the melody, harmony, or overall structure in the input field below.")
+        self.chat_area = ChatView('composition')
+        self.chat_area.greet("Greetings! I'm Rhythm, your composition companion. Welcome to the Composition Tab! Here you can work on the musical composition of your song. Start by describing your ideas for the melody, harmony, or overall structure in the input field below.")
         chat_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -60,19 +61,20 @@ class CompositionTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        input_layout.addWidget(self.stop_button)
+
         chat_layout.addLayout(input_layout)
         layout.addLayout(chat_layout)
 
         # Composition display area
         self.result_area = QTextEdit()
-        self.result_area.textChanged.connect(self.save_composition)
+        self.result_file = DocumentFile(self.result_area, 'composition.md')
         self.result_area.textChanged.connect(lambda: self.result_area.ensureCursorVisible())
         layout.addWidget(self.result_area)
 
-    def save_composition(self):
-        with open('composition.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -88,18 +90,6 @@ class CompositionTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            composition_prompt = self.read_file(resource_path('prompts/composition.md'))
-            concept_content = self.read_file(resource_path('concept.md'))
-            lyrics_content = self.read_file(resource_path('lyrics.md'))
-            production_content = self.read_file(resource_path('production.md'))
-            
-            self.system_prompt = f"{composition_prompt}\n\nContext from concept.md:\n{concept_content}\n\nContext from lyrics.md:\n{lyrics_content}\n\nContext from production.md:\n{production_content}"
-        except Exception as e:
-            self.system_prompt = "You are a creative assistant to help compose music."
-            self.chat_area.append(f"Warning: Error loading prompts: {str(e)}. Using a default prompt.")
-
     def read_file(self, filepath):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
@@ -108,15 +98,9 @@ class CompositionTab(QWidget):
             return f"File {filepath} not found."
 
     def send_message(self):
-        # Update the system prompt with the latest content
-        self.load_system_prompt()
-        
-        user_message = self.input_field.text()
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
 
-    def send_message(self):
-        # Update the system prompt with the latest content
-        self.load_system_prompt()
-        
         user_message = self.input_field.text()
         self.chat_area.append(f"You: {user_message}")
         self.input_field.clear()
@@ -134,43 +118,48 @@ class CompositionTab(QWidget):
                 return
 
         try:
-            self.stream_buffer = ""
             self.chat_area.append("Assistant : ")
-            
+
             # Read content from relevant files
-            concept_content = self.read_file(resource_path('concept.md'))
-            lyrics_content = self.read_file(resource_path('lyrics.md'))
-            production_content = self.read_file(resource_path('production.md'))
-            
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "system", "content": f"Concept:\n{concept_content}"},
-                {"role": "system", "content": f"Lyrics:\n{lyrics_content}"},
-                {"role": "system", "content": f"Production:\n{production_content}"},
-                {"role": "user", "content": user_message}
-            ]
-            
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                stream=True
+            documents = load_documents()
+
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_stage(
+                self, 'composition', self.client, self.prompts, documents, user_message,
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=self.on_stream_done,
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                history=self.memory.messages()
             )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    self.stream_buffer += chunk.choices[0].delta.content
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
-            self.update_composition(self.stream_buffer)
         except Exception as e:
-            self.chat_area.append(f"Error sending message: {str(e)}")
-            self.chat_area.append("Please check your internet connection and the validity of your API key.")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        self.update_composition(result.text)
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Error sending message: {error}")
+        self.chat_area.append("Please check your internet connection and the validity of your API key.")
 
     def update_composition(self, new_content):
-        current_composition = self.result_area.toPlainText()
-        updated_composition = current_composition + "\n\n" + new_content
-        self.result_area.setPlainText(updated_composition)
-        self.composition_updated.emit(updated_composition)
-        
-        # Sauvegarder la composition dans composition.md
-        with open('composition.md', 'w', encoding='utf-8') as f:
-            f.write(updated_composition)
+        # Appended in place; rebuilding the whole text would relayout and rewrite everything
+        self.result_file.append(new_content)
+        if self.receivers(self.composition_updated):
+            self.composition_updated.emit(self.result_area.toPlainText())
@@ -1,12 +1,16 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QApplication
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QObject, pyqtSlot
 from dotenv import load_dotenv
 import os
 import sys
 sys.path.append('.')  # Ajoute le dossier courant au chemin de recherche
 from openai import OpenAI
-import os
-import sys
+from prompt_registry import get_prompt_registry
+from qt_jobs import submit_stage, submit_summary
+from song_stages import load_documents
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -27,15 +31,14 @@ class ConceptTab(QWidget):
         self.load_api_key()
         self.current_stream = None
         self.stream_buffer = ""
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('concept')
         self.client = None
         self.load_initial_concept()
 
     def load_initial_concept(self):
         try:
-            with open('concept.md', 'r', encoding='utf-8') as f:
-                initial_concept = f.read()
-            self.result_area.setPlainText(initial_concept)
+            self.result_file.load()
         except FileNotFoundError:
             self.chat_area.append("Warning: concept.md file not found. Starting with an empty concept.")
 
@@ -45,10 +48,8 @@ class ConceptTab(QWidget):
 
         # Chat area
         chat_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.textChanged.connect(lambda: self.chat_area.ensureCursorVisible())
-        self.chat_area.append("Hi there! I'm Lyra, your concept creator. Welcome to the Concept Tab! Here you can develop and refine your song concept. Start by typing your initial ideas or questions about the song concept in the input field below.")
+        self.chat_area = ChatView('concept')
+        self.chat_area.greet("Hi there! I'm Lyra, your concept creator. Welcome to the Concept Tab! Here you can develop and refine your song concept. Start by typing your initial ideas or questions about the song concept in the input field below.")
         chat_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -60,19 +61,20 @@ class ConceptTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        input_layout.addWidget(self.stop_button)
+
         chat_layout.addLayout(input_layout)
         layout.addLayout(chat_layout)
 
         # Concept display area
         self.result_area = QTextEdit()
-        self.result_area.textChanged.connect(self.save_concept)
+        self.result_file = DocumentFile(self.result_area, 'concept.md')
         self.result_area.textChanged.connect(lambda: self.result_area.ensureCursorVisible())
         layout.addWidget(self.result_area)
 
-    def save_concept(self):
-        with open('concept.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -88,14 +90,6 @@ class ConceptTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            concept_prompt = self.read_file(resource_path('prompts/concept.md'))
-            self.system_prompt = concept_prompt
-        except Exception as e:
-            self.system_prompt = "You are a creative assistant to help develop song concepts."
-            self.chat_area.append(f"Warning: Error loading prompt: {str(e)}. Using a default prompt.")
-
     def read_file(self, filepath):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
@@ -103,18 +97,10 @@ class ConceptTab(QWidget):
         except FileNotFoundError:
             return f"File {filepath} not found."
 
-    def load_context_info(self):
-        context = ""
-        files_to_read = ['band_info.txt', 'concept.md', 'management.md']
-        for file in files_to_read:
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    context += f"Content of {file}:\n{f.read().strip()}\n\n"
-            except FileNotFoundError:
-                context += f"File {file} not found.\n\n"
-        return context
-
     def send_message(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
+
         user_message = self.input_field.text()
         self.chat_area.append(f"You: {user_message}")
         self.input_field.clear()
@@ -133,35 +119,46 @@ class ConceptTab(QWidget):
 
         try:
             # Charger les informations contextuelles
-            context_info = self.load_context_info()
-            
-            self.stream_buffer = ""
+            documents = load_documents()
+
             self.chat_area.append("Assistant : ")
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "system", "content": f"Context Information:\n{context_info}"},
-                    {"role": "user", "content": user_message}
-                ],
-                stream=True
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_stage(
+                self, 'concept', self.client, self.prompts, documents, user_message,
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=self.on_stream_done,
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                history=self.memory.messages()
             )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    self.stream_buffer += chunk.choices[0].delta.content
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
-            self.update_concept(self.stream_buffer)
         except Exception as e:
-            self.chat_area.append(f"Error sending message: {str(e)}")
-            self.chat_area.append("Please check your internet connection and the validity of your API key.")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        self.update_concept(result.text)
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Error sending message: {error}")
+        self.chat_area.append("Please check your internet connection and the validity of your API key.")
 
     def update_concept(self, new_content):
-        current_concept = self.result_area.toPlainText()
-        updated_concept = current_concept + "\n\n" + new_content
-        self.result_area.setPlainText(updated_concept)
-        self.concept_updated.emit(updated_concept)
-        
-        # Sauvegarder le concept dans concept.md
-        with open('concept.md', 'w', encoding='utf-8') as f:
-            f.write(updated_concept)
+        # Appended in place; rebuilding the whole text would relayout and rewrite everything
+        self.result_file.append(new_content)
+        if self.receivers(self.concept_updated):
+            self.concept_updated.emit(self.result_area.toPlainText())
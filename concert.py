@@ -1,14 +1,16 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLabel, QPushButton, QApplication, QMessageBox
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 from openai import OpenAI
-import os
-import sys
 import json
 import random
 import math
 import logging
-from main import resource_path
+from paths import resource_path
+from prompt_registry import get_prompt_registry
+from generation_scheduler import Priority
+from qt_jobs import submit_chat_stream
+from chat_view import ChatView
 
 class ConcertTab(QWidget):
     def __init__(self):
@@ -20,8 +22,8 @@ class ConcertTab(QWidget):
         self.update_speed = 1000
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_fan_display)
-        self.load_system_prompt()
-        self.load_other_prompts()
+        self.prompts = get_prompt_registry()
+        self.current_stream = None
 
     def load_fan_count(self):
         try:
@@ -36,15 +38,19 @@ class ConcertTab(QWidget):
         self.setLayout(layout)
 
         left_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.append("Hello! I'm Spark, your concert coordinator. Welcome to the Concert Tab! Here you can simulate your band's concert performance. Click the 'Start Concert' button when you're ready to perform and see how your fan base grows!")
+        self.chat_area = ChatView('concert')
+        self.chat_area.greet("Hello! I'm Spark, your concert coordinator. Welcome to the Concert Tab! Here you can simulate your band's concert performance. Click the 'Start Concert' button when you're ready to perform and see how your fan base grows!")
         left_layout.addWidget(self.chat_area)
 
         self.start_concert_button = QPushButton("Start Concert")
         self.start_concert_button.clicked.connect(self.start_concert)
         left_layout.addWidget(self.start_concert_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_concert)
+        left_layout.addWidget(self.stop_button)
+
         layout.addLayout(left_layout, 1)
 
         right_layout = QVBoxLayout()
@@ -72,6 +78,9 @@ class ConcertTab(QWidget):
         self.client = None
 
     def start_concert(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
+
         audience_size = math.ceil(self.fans * 1.2)
 
         # Charger les contenus les plus récents
@@ -86,18 +95,19 @@ class ConcertTab(QWidget):
         prompt = f"""Create a short, engaging story about the band's concert performance of their new song. Use the provided information.
 
 Audience Size: {audience_size}
-Current Fan Count: {self.fans}
-
-{self.concert_system_prompt}"""
+Current Fan Count: {self.fans}"""
 
         try:
             self.chat_area.clear()
             self.chat_area.append("Generating concert story...")
             
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
+            self.start_concert_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.story_started = False
+            self.current_stream = submit_chat_stream(
+                self, self.client,
+                [
+                    {"role": "system", "content": self.prompts.text('concert')},
                     {"role": "system", "content": f"Management:\n{management_content}"},
                     {"role": "system", "content": f"Concept:\n{concept_content}"},
                     {"role": "system", "content": f"Lyrics:\n{lyrics_content}"},
@@ -107,24 +117,44 @@ Current Fan Count: {self.fans}
                     {"role": "system", "content": f"Critique:\n{critique_content}"},
                     {"role": "user", "content": prompt}
                 ],
-                stream=True
+                on_chunk=self.on_story_chunk,
+                on_done=lambda story: self.on_story_done(audience_size),
+                on_error=self.on_story_error,
+                on_cancel=self.on_story_cancelled,
+                priority=Priority.NORMAL,
+                label='concert'
             )
-            
-            self.chat_area.clear()
-            concert_story = ""
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    concert_story += content
-                    self.chat_area.insertPlainText(content)
-                    QApplication.processEvents()
-
-            self.update_fans(audience_size)
 
         except Exception as e:
-            error_message = f"Erreur lors du concert : {str(e)}"
-            self.chat_area.append(error_message)
-            logging.error(error_message)
+            self.on_story_error(str(e))
+
+    def on_story_chunk(self, content):
+        if not self.story_started:
+            self.chat_area.clear()
+            self.story_started = True
+        self.chat_area.insertPlainText(content)
+
+    def on_story_done(self, audience_size):
+        self.start_concert_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.update_fans(audience_size)
+
+    def stop_concert(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_story_cancelled(self):
+        # No fans are won from a concert that was stopped
+        self.start_concert_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("\nConcert stopped.")
+
+    def on_story_error(self, error):
+        self.start_concert_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        error_message = f"Erreur lors du concert : {error}"
+        self.chat_area.append(error_message)
+        logging.error(error_message)
 
     def read_file(self, filename):
         try:
@@ -179,36 +209,3 @@ Current Fan Count: {self.fans}
         with open(resource_path('band.json'), 'w') as f:
             json.dump(data, f)
 
-    def load_system_prompt(self):
-        file_name = 'prompts/concert.md'
-        full_path = resource_path(file_name)
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                self.concert_system_prompt = f.read()
-        except FileNotFoundError:
-            error_message = f"Erreur : Le fichier {full_path} n'a pas été trouvé. Veuillez vérifier que le fichier de prompt prompts/concert.md est présent."
-            print(error_message)
-            QMessageBox.critical(self, "Erreur de chargement", error_message)
-            sys.exit(1)
-
-    def load_system_prompt(self):
-        try:
-            with open(resource_path('prompts/concert.md'), 'r', encoding='utf-8') as f:
-                self.system_prompt = f.read()
-        except FileNotFoundError:
-            error_message = f"Erreur : Le fichier prompts/concert.md n'a pas été trouvé."
-            print(error_message)
-            self.system_prompt = "You are an AI assistant helping with concert simulations."
-
-    def load_other_prompts(self):
-        prompt_files = ['concept.md', 'lyrics.md', 'composition.md', 'visual_design.md', 'critique.md']
-        for file in prompt_files:
-            attr_name = file.split('.')[0] + '_prompt'
-            full_path = resource_path(os.path.join('prompts', file))
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    setattr(self, attr_name, f.read())
-            except FileNotFoundError:
-                error_message = f"Erreur : Le fichier {full_path} n'a pas été trouvé."
-                print(error_message)
-                setattr(self, attr_name, "")
@@ -0,0 +1,126 @@
+"""Per-tab conversation memory sent with each request.
+
+The last few turns go out verbatim; turns that fall out of that window are folded into a running
+summary by a background request, so the summary is recomputed only when the window moves. The
+history sent never exceeds the memory's token budget.
+"""
+import json
+import logging
+import os
+import time
+from paths import song_folder
+from rate_limiter import RateLimitedClient, estimate_tokens
+from telemetry import request_context
+
+logger = logging.getLogger(__name__)
+
+MEMORY_DIR = 'memory'
+KEEP_TURNS = 4
+BUDGET_TOKENS = 3000
+
+
+def session_memory(name):
+    return os.path.join(MEMORY_DIR, f"{name}.json")
+
+
+def song_memory(song_title, name):
+    return os.path.join(song_folder(song_title), 'memory', f"{name}.json")
+
+
+def clip(text, tokens):
+    # Same four-characters-per-token estimate the rate limiter uses
+    limit = max(0, tokens) * 4
+    return text if len(text) <= limit else text[:limit].rstrip() + " [...]"
+
+
+class ConversationMemory:
+    def __init__(self, name, path=None, keep_turns=KEEP_TURNS, budget_tokens=BUDGET_TOKENS):
+        self.name = name
+        self.keep_turns = keep_turns
+        self.budget_tokens = budget_tokens
+        self.path = None
+        self.summary = ""
+        self.turns = []
+        # Bumped on every switch, so a summary computed for another song is discarded
+        self.version = 0
+        self.summarizing = False
+        self.switch(path)
+
+    def switch(self, path):
+        """Follow another memory file; None keeps an unsaved session's memory in this object only."""
+        self.path = path
+        self.summary = ""
+        self.turns = []
+        self.version += 1
+        self.summarizing = False
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.summary = data.get('summary', "")
+            self.turns = data.get('turns', [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read conversation memory {path}: {str(e)}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'summary': self.summary, 'turns': self.turns, 'updated_at': time.time()}, f,
+                          ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save conversation memory {self.path}: {str(e)}")
+
+    def add_turn(self, user_message, reply):
+        self.turns.append({'user': user_message, 'assistant': reply})
+        self.save()
+
+    def evicted(self):
+        """Turns outside the verbatim window that are not in the summary yet."""
+        return self.turns[:max(0, len(self.turns) - self.keep_turns)]
+
+    def fold(self, version, count, summary):
+        if version != self.version:
+            return
+        self.summary = summary.strip()
+        del self.turns[:count]
+        self.save()
+
+    def messages(self):
+        """History to send before the new request, newest turns first in line for the budget."""
+        remaining = self.budget_tokens
+        history = []
+        if self.summary:
+            summary = clip(self.summary, self.budget_tokens // 3)
+            history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+            remaining -= estimate_tokens(history)
+        recent = []
+        # Turns waiting to be summarized still go out verbatim while the budget allows
+        for turn in reversed(self.turns):
+            pair = [{"role": "user", "content": turn['user']}, {"role": "assistant", "content": turn['assistant']}]
+            cost = estimate_tokens(pair)
+            if cost > remaining:
+                if not recent:
+                    pair[1]['content'] = clip(turn['assistant'], remaining - estimate_tokens(pair[:1]) - 4)
+                    recent = pair
+                break
+            recent[:0] = pair
+            remaining -= cost
+        return history + recent
+
+
+def summarize_turns(client, prompts, previous_summary, turns, job=None, model="gpt-4o-mini"):
+    """Fold turns into the previous summary with one chat request; returns the new summary."""
+    transcript = "\n\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+    content = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    messages = [
+        {"role": "system", "content": prompts.text('summary')},
+        {"role": "user", "content": content}
+    ]
+    gateway = RateLimitedClient(client, sleep=job.sleep if job is not None else time.sleep)
+    with request_context(stage='summary'):
+        return gateway.stream_chat(messages, lambda content: None, model=model,
+                                   should_stop=job.check_cancelled if job is not None else None)
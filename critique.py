@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QApplication, QLabel
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QLabel
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 from dotenv import load_dotenv
@@ -7,6 +7,12 @@ import sys
 sys.path.append('.')
 from openai import OpenAI
 import json
+from prompt_registry import get_prompt_registry
+from qt_jobs import submit_stage, submit_summary
+from song_stages import load_documents
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
 
 class CritiqueTab(QWidget):
     critique_updated = pyqtSignal(str)
@@ -15,8 +21,11 @@ class CritiqueTab(QWidget):
         super().__init__()
         self.initUI()
         self.load_api_key()
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('critique')
+        self.load_fan_count()
         self.client = None
+        self.current_stream = None
 
     def initUI(self):
         self.layout = QHBoxLayout()
@@ -24,10 +33,8 @@ class CritiqueTab(QWidget):
 
         # Chat area
         chat_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.textChanged.connect(lambda: self.chat_area.ensureCursorVisible())
-        self.chat_area.append("Greetings! I'm Prism, your discerning critic. Welcome to the Critique Tab! Here you can receive feedback on your song from a music critic. Enter the details of your song in the input field below to get a comprehensive critique.")
+        self.chat_area = ChatView('critique')
+        self.chat_area.greet("Greetings! I'm Prism, your discerning critic. Welcome to the Critique Tab! Here you can receive feedback on your song from a music critic. Enter the details of your song in the input field below to get a comprehensive critique.")
         chat_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -39,6 +46,11 @@ class CritiqueTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        input_layout.addWidget(self.stop_button)
+
         chat_layout.addLayout(input_layout)
         self.layout.addLayout(chat_layout)
 
@@ -53,16 +65,12 @@ class CritiqueTab(QWidget):
         self.critique_layout.addWidget(self.critic_name_label)
 
         self.result_area = QTextEdit()
-        self.result_area.textChanged.connect(self.save_critique)
+        self.result_file = DocumentFile(self.result_area, 'critique.md')
         self.result_area.textChanged.connect(lambda: self.result_area.ensureCursorVisible())
         self.critique_layout.addWidget(self.result_area)
 
         self.layout.addLayout(self.critique_layout)
 
-    def save_critique(self):
-        with open('critique.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -77,14 +85,7 @@ class CritiqueTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            with open('prompts/critique.md', 'r', encoding='utf-8') as f:
-                self.system_prompt = f.read()
-        except FileNotFoundError:
-            self.system_prompt = "You are a music critic providing feedback on songs."
-            self.chat_area.append("Warning: prompts/critique.md not found. Using default prompt.")
-        
+    def load_fan_count(self):
         # Load the current fan count
         try:
             with open('band.json', 'r') as f:
@@ -95,10 +96,6 @@ class CritiqueTab(QWidget):
         
         # Set the critic name
         self.set_critic_name()
-        
-        # Append fan count and instructions to the system prompt
-        self.system_prompt += f"\n\nCurrent fan count: {self.fan_count}\n\n"
-        self.system_prompt += "Please provide your critique in a natural, conversational format. Include ratings out of 10 for each aspect (concept, lyrics, composition, visual design, production) and an overall rating. Explain your ratings and provide constructive feedback for each aspect. Conclude with an overall assessment of the song."
 
     def read_file(self, filepath):
         try:
@@ -126,6 +123,9 @@ class CritiqueTab(QWidget):
         self.critic_name_label.setText(critic_name)
 
     def send_message(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
+
         user_message = self.input_field.text()
         self.chat_area.append(f"You: {user_message}")
         self.input_field.clear()
@@ -158,40 +158,43 @@ class CritiqueTab(QWidget):
 
             self.chat_area.append("Assistant: Generating critique...")
             # Read content from relevant files
-            management_content = self.read_file('management.md')
-            concept_content = self.read_file('concept.md')
-            lyrics_content = self.read_file('lyrics.md')
-            composition_content = self.read_file('composition.md')
-            visual_design_content = self.read_file('visual_design.md')
-            production_content = self.read_file('production.md')
-
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "system", "content": f"Management:\n{management_content}"},
-                    {"role": "system", "content": f"Concept:\n{concept_content}"},
-                    {"role": "system", "content": f"Lyrics:\n{lyrics_content}"},
-                    {"role": "system", "content": f"Composition:\n{composition_content}"},
-                    {"role": "system", "content": f"Visual Design:\n{visual_design_content}"},
-                    {"role": "system", "content": f"Production:\n{production_content}"},
-                    {"role": "user", "content": f"Generate a critique for the following: {user_message}"}
-                ],
-                stream=True
+            documents = load_documents()
+
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_stage(
+                self, 'critique', self.client, self.prompts, documents, user_message,
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=self.on_stream_done,
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                history=self.memory.messages(),
+                fan_count=self.fan_count
             )
-            
-            critique_response = ""
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    critique_response += content
-                    self.chat_area.insertPlainText(content)
-                    QApplication.processEvents()
-            
-            self.update_critique(critique_response)
         except Exception as e:
-            self.chat_area.append(f"Error generating critique: {str(e)}")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        self.update_critique(result.text)
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Error generating critique: {error}")
 
     def update_critique(self, critique_text):
-        self.result_area.setPlainText(critique_text)
+        self.result_file.replace(critique_text)
         self.critique_updated.emit(critique_text)
@@ -0,0 +1,109 @@
+"""Keeps a tab's result editor and its markdown file in sync without rewriting either on every change.
+
+Generated content is inserted at the end of the editor with a QTextCursor and appended to the file,
+so each generation costs only its own length. Manual edits mark the file dirty and it is compacted,
+rewritten whole from the editor, once typing pauses, the editor loses focus or the app quits, and
+after every COMPACT_EVERY appends.
+"""
+import logging
+from PyQt5.QtCore import QObject, QTimer, QEvent, QCoreApplication
+from PyQt5.QtGui import QTextCursor
+
+logger = logging.getLogger(__name__)
+
+SAVE_DELAY_MS = 1000
+# Rewrite the file whole after this many appends, so it cannot drift from the editor for long
+COMPACT_EVERY = 20
+
+
+class DocumentFile(QObject):
+    def __init__(self, editor, path, delay_ms=SAVE_DELAY_MS):
+        super().__init__(editor)
+        self.editor = editor
+        self.path = path
+        self.dirty = False
+        # Whether the file is known to hold exactly the editor's text, so appending to it is safe
+        self.in_sync = False
+        self.appends = 0
+        self._syncing = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.flush)
+        editor.textChanged.connect(self.on_edited)
+        editor.installEventFilter(self)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.flush)
+
+    def load(self):
+        """Show the file in the editor; raises FileNotFoundError like open()."""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self._syncing = True
+        try:
+            self.editor.setPlainText(text)
+        finally:
+            self._syncing = False
+        self.dirty = False
+        self.in_sync = True
+
+    def append(self, text, separator="\n\n"):
+        # Pending manual edits go to disk first so the file and the editor agree before appending
+        self.flush()
+        self._syncing = True
+        try:
+            cursor = QTextCursor(self.editor.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(separator + text)
+        finally:
+            self._syncing = False
+        self.appends += 1
+        if not self.in_sync or self.appends >= COMPACT_EVERY:
+            self.dirty = True
+            self.flush()
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(separator + text)
+        except OSError as e:
+            logger.warning(f"Could not append to {self.path}: {str(e)}")
+            self.in_sync = False
+            self.dirty = True
+            self._timer.start()
+
+    def replace(self, text):
+        self._timer.stop()
+        self._syncing = True
+        try:
+            self.editor.setPlainText(text)
+        finally:
+            self._syncing = False
+        self.dirty = True
+        self.flush()
+
+    def on_edited(self):
+        if self._syncing:
+            return
+        self.dirty = True
+        self._timer.start()
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.FocusOut and self.dirty:
+            self.flush()
+        return False
+
+    def flush(self):
+        """Compact: rewrite the file from the editor if it has unsaved edits."""
+        self._timer.stop()
+        if not self.dirty:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(self.editor.toPlainText())
+            self.dirty = False
+            self.in_sync = True
+            self.appends = 0
+        except OSError as e:
+            logger.warning(f"Could not save {self.path}: {str(e)}")
+            self.in_sync = False
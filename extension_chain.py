@@ -0,0 +1,230 @@
+"""Generates a full song as a chain of UdioPro jobs: the initial clip, each extension, then the outro.
+
+Every job continues the clip before it, so it is submitted the moment its parent completes; the
+parent's audio downloads while the next job renders. Once the last clip is in, the segments are
+stitched into one track: a clip that continues its parent where it ended joins it with only a
+de-clicking fade, and the full crossfade is kept for clips that do not.
+
+With a JobJournal, every field, submission and completed clip is recorded as it happens, and a
+chain interrupted by a restart resumes from the journal without submitting any job twice.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+import requests
+from audio_stitch import stitch, CROSSFADE_MS, CONTINUATION_CROSSFADE_MS
+from generation_scheduler import JobCancelled
+from paths import safe_filename
+from telemetry import request_context
+from tracing import span
+from udiopro_client import UdioProTimeout
+from udiopro_journal import SUBMITTING, SUBMITTED
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_DIR = os.path.join('generated_songs', 'segments')
+
+
+@dataclass
+class Segment:
+    kind: str                   # 'short', 'extend' or 'outro'
+    index: int
+    prompt: str
+    lyrics: str = ""
+    work_id: str = None
+    clip: dict = None
+    path: str = None
+
+
+def plan_segments(field):
+    """Yield one segment per job, in order; extend prompts and lyrics repeat if there are fewer than num_extensions.
+
+    field(name) returns a SongResponse field. It is only asked for a segment's fields when that segment
+    is due, so with SongResponseStream.wait the chain can start while the reply is still streaming.
+    """
+    yield Segment('short', 0, field('short_prompt'), field('custom_lyrics_short'))
+    # Everything else is read as soon as the first clip is done, so a journaled chain has it all recorded
+    count = field('num_extensions')
+    prompts = field('extend_prompts')
+    lyrics = field('custom_lyrics_extend')
+    outro = Segment('outro', 0, field('outro_prompt'), field('custom_lyrics_outro'))
+    if count and not prompts:
+        logger.warning(f"num_extensions is {count} but there are no extend prompts; skipping the extensions")
+        count = 0
+    for i in range(count):
+        yield Segment('extend', i + 1, prompts[i % len(prompts)], lyrics[i % len(lyrics)] if lyrics else "")
+    if outro.prompt:
+        outro.index = count + 1
+        yield outro
+
+
+class FieldUnavailable(ValueError):
+    pass
+
+
+def journaled_fields(name, should_stop=None):
+    # A resumed chain only has the fields its first run recorded
+    raise ValueError(f"{name} was not received before the app closed")
+
+
+class ExtensionChain:
+    """Runs plan_segments(field) on one scheduler job: chain.run(job) returns the stitched file's path.
+
+    field(name, should_stop) looks up SongResponse fields; on_segment(segment) is called as each clip
+    completes, from the job's thread. Pass chain_id to resume a chain recorded in the journal.
+    """
+
+    def __init__(self, client, field, title="Generated Song", on_segment=None, crossfade_ms=CROSSFADE_MS,
+                 journal=None, chain_id=None, song_title=None):
+        self.client = client
+        self.field = field
+        self.title = title
+        self.song_title = song_title
+        self.on_segment = on_segment
+        self.crossfade_ms = crossfade_ms
+        self.journal = journal
+        self.chain_id = chain_id
+        self.fields = {}
+        self.segments = []
+        # Set when the journal gives up on the chain after repeated interruptions
+        self.abandoned = False
+
+    def lookup(self, name, job):
+        if name not in self.fields:
+            try:
+                self.fields[name] = self.field(name, job.check_cancelled)
+            except ValueError as e:
+                raise FieldUnavailable(str(e))
+            if self.journal is not None:
+                self.journal.save_field(self.chain_id, name, self.fields[name])
+        return self.fields[name]
+
+    def submit(self, segment, parent):
+        extra = {}
+        if parent is not None:
+            extra['continue_clip_id'] = parent.clip['id']
+            extra['continue_at'] = parent.clip.get('duration')
+        if segment.lyrics:
+            # Custom mode sings the given lyrics in the style of the prompt
+            return self.client.generate(segment.lyrics, title=self.title, custom_mode=True, tags=segment.prompt,
+                                        **extra)
+        return self.client.generate(segment.prompt, title=self.title, **extra)
+
+    def download(self, segment, folder):
+        if segment.path and os.path.exists(segment.path):
+            return
+        url = segment.clip['audio_url']
+        extension = os.path.splitext(url.split('?')[0])[1] or '.mp3'
+        segment.path = os.path.join(folder, f"{segment.index:02d}_{segment.kind}{extension}")
+        with open(segment.path, 'wb') as f:
+            f.write(self.client.download(url))
+        if self.journal is not None:
+            self.journal.downloaded(self.chain_id, segment.index, segment.path)
+
+    def start(self):
+        """Return (folder, stamp), creating the chain's journal entry or reloading it when resuming."""
+        if self.journal is not None and self.chain_id is not None:
+            chain = self.journal.chain(self.chain_id)
+            self.title = chain['title']
+            self.song_title = chain['song_title']
+            self.fields = chain['fields']
+            return chain['folder'], chain['stamp']
+        stamp = int(time.time())
+        folder = os.path.join(SEGMENT_DIR, f"{safe_filename(self.title).replace(' ', '_')}_{stamp}")
+        if self.journal is not None:
+            self.chain_id = self.journal.start_chain(self.title, folder, stamp, self.song_title)
+        return folder, stamp
+
+    def generate(self, segment, parent, folder, job):
+        """Submit the segment unless the journal shows it already was, then wait for its clip."""
+        record = self.journal.job(self.chain_id, segment.index) if self.journal is not None else None
+        if record is not None and record['clip'] is not None:
+            segment.work_id, segment.clip, segment.path = record['work_id'], record['clip'], record['path']
+            if parent is not None:
+                self.download(parent, folder)
+            return
+        if record is not None and record['state'] == SUBMITTED:
+            logger.info(f"Resuming UdioPro job {record['work_id']} ({segment.kind} {segment.index})")
+            segment.work_id = record['work_id']
+        else:
+            if record is not None and record['state'] == SUBMITTING:
+                # The app stopped between sending the request and recording its workId
+                logger.warning(f"Resubmitting {segment.kind} {segment.index}; its first submission has no workId")
+            if self.journal is not None:
+                self.journal.submitting(self.chain_id, segment)
+            segment.work_id = self.submit(segment, parent)
+            if self.journal is not None:
+                self.journal.submitted(self.chain_id, segment.index, segment.work_id)
+
+        # The new job renders while the parent's audio downloads
+        if parent is not None:
+            self.download(parent, folder)
+
+        def on_status(status):
+            job.check_cancelled()
+            if self.journal is not None:
+                self.journal.polled(self.chain_id, segment.index)
+
+        result = self.client.wait_for_result(segment.work_id, sleep=job.sleep, on_status=on_status)
+        # UdioPro returns two takes per job; the chain always continues the first
+        segment.clip = result['response_data'][0]
+        if self.journal is not None:
+            self.journal.completed(self.chain_id, segment.index, segment.clip)
+
+    def run(self, job):
+        folder, stamp = self.start()
+        os.makedirs(folder, exist_ok=True)
+        try:
+            path = self._run(job, folder, stamp)
+        except (requests.RequestException, UdioProTimeout) as e:
+            # Still running remotely; the chain stays unfinished in the journal and resumes on the next start,
+            # until it has been interrupted too often
+            if self.journal is not None and self.journal.interrupted(self.chain_id, str(e)):
+                self.abandoned = True
+                logger.error(f"Giving up on UdioPro chain {self.chain_id} ({self.title}): {str(e)}")
+            raise
+        except JobCancelled:
+            self.finish(error="cancelled")
+            raise
+        except Exception as e:
+            self.finish(error=str(e))
+            raise
+        self.finish(path)
+        return path
+
+    def finish(self, path=None, error=None):
+        if self.journal is not None:
+            self.journal.finish_chain(self.chain_id, path, error)
+
+    def boundary_fades(self):
+        # submit() continues each clip at its parent's duration when UdioPro reported one
+        return [CONTINUATION_CROSSFADE_MS if previous.clip.get('duration') else self.crossfade_ms
+                for previous in self.segments[:-1]]
+
+    def _run(self, job, folder, stamp):
+        with request_context(tab='ProductionTab'):
+            parent = None
+            try:
+                for segment in plan_segments(lambda name: self.lookup(name, job)):
+                    job.check_cancelled()
+                    self.segments.append(segment)
+                    with span('udiopro_segment', kind=segment.kind, index=segment.index):
+                        self.generate(segment, parent, folder, job)
+                    if self.on_segment:
+                        self.on_segment(segment)
+                    parent = segment
+            except FieldUnavailable as e:
+                # The reply ended early; the clips already paid for still make a (shorter) song
+                if parent is None:
+                    raise
+                logger.warning(f"Stopping the UdioPro chain after {len(self.segments)} segments: {str(e)}")
+            self.download(parent, folder)
+
+            job.check_cancelled()
+            path = os.path.join('generated_songs', f"{safe_filename(self.title).replace(' ', '_')}_{stamp}.wav")
+            with span('stitch', segments=len(self.segments)) as current:
+                seconds = stitch([segment.path for segment in self.segments], path, self.boundary_fades())
+                current.set(seconds=round(seconds, 1))
+        logger.info(f"Stitched {len(self.segments)} UdioPro segments into {path} ({seconds:.1f}s)")
+        return path
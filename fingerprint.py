@@ -0,0 +1,96 @@
+"""Compact acoustic fingerprints for spotting near-duplicate tracks.
+
+A fingerprint is one 32-bit word per 11.6 ms step over 186 ms frames: bit m says whether the energy difference
+between bands m and m+1 rose or fell since the previous frame (Haitsma and Kalker). Re-encoded or
+regenerated audio keeps most words intact, so candidates are found by looking up exact words in
+an inverted index, then confirmed by aligning the two fingerprints and counting differing bits.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BANDS = 33
+LOW_HZ = 300
+HIGH_HZ = 2000
+FRAME = 4096
+# Frames overlap heavily so words barely change when the audio starts a few samples later
+HOP = 256
+# Only every INDEX_STRIDE-th word is indexed; a query looks up all of its words, so it still hits
+INDEX_STRIDE = 8
+# Mean fraction of differing bits below which two aligned fingerprints are the same audio
+MATCH_BER = 0.35
+# Part of the longer track that must overlap for a match, so an excerpt is not a duplicate
+MIN_OVERLAP = 0.8
+
+
+def band_energies(mono, rate, chunk=1024):
+    """(frames, BANDS) energy in log-spaced bands, computed chunk by chunk so no full spectrogram is held."""
+    if len(mono) < FRAME:
+        mono = np.pad(mono, (0, FRAME - len(mono)))
+    frames = sliding_window_view(mono, FRAME)[::HOP]
+    window = np.hanning(FRAME).astype(np.float32)
+    edges = np.geomspace(LOW_HZ, HIGH_HZ, BANDS + 1)
+    band_of_bin = np.searchsorted(edges, np.fft.rfftfreq(FRAME, 1 / rate)) - 1
+    # Summing bins into bands is a product with a (bins, BANDS) 0/1 matrix
+    bands = np.zeros((len(band_of_bin), BANDS), dtype=np.float32)
+    usable = np.flatnonzero((band_of_bin >= 0) & (band_of_bin < BANDS))
+    bands[usable, band_of_bin[usable]] = 1
+    return np.concatenate([(np.abs(np.fft.rfft(frames[i:i + chunk] * window, axis=1)) ** 2) @ bands
+                           for i in range(0, len(frames), chunk)]).astype(np.float64)
+
+
+def compute(mono, rate):
+    """uint32 fingerprint of a mono signal."""
+    energy = band_energies(mono, rate)
+    if len(energy) < 2:
+        return np.zeros(0, dtype=np.uint32)
+    difference = energy[:, :-1] - energy[:, 1:]
+    bits = (difference[1:] - difference[:-1]) > 0
+    return (bits.astype(np.uint32) << np.arange(31, -1, -1, dtype=np.uint32)).sum(axis=1, dtype=np.uint32)
+
+
+def index_words(fingerprint):
+    """The distinct words to index for a stored fingerprint; silence fingerprints as zeros and is left out."""
+    return sorted({int(word) for word in fingerprint[::INDEX_STRIDE].tolist() if word})
+
+
+def query_words(fingerprint):
+    return sorted({int(word) for word in fingerprint.tolist() if word})
+
+
+def to_bytes(fingerprint):
+    return fingerprint.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<u4')
+
+
+def bit_error_rate(a, b):
+    """Mean fraction of differing bits between two equally long fingerprints."""
+    return float(np.unpackbits((a ^ b).view(np.uint8)).mean())
+
+
+def similarity(a, b):
+    """1 - bit error rate at the best alignment, or 0.0 if the fingerprints do not overlap enough.
+
+    The alignment is the offset most exact words agree on, so no offset search is needed.
+    """
+    if not len(a) or not len(b):
+        return 0.0
+    positions = {}
+    for index, word in enumerate(b.tolist()):
+        positions.setdefault(word, []).append(index)
+    offsets = [i - j for i, word in enumerate(a.tolist()) for j in positions.get(word, ())[:4]]
+    if not offsets:
+        return 0.0
+    values, counts = np.unique(offsets, return_counts=True)
+    offset = int(values[np.argmax(counts)])
+    start_a, start_b = max(0, offset), max(0, -offset)
+    length = min(len(a) - start_a, len(b) - start_b)
+    if length < MIN_OVERLAP * max(len(a), len(b)):
+        return 0.0
+    return 1.0 - bit_error_rate(a[start_a:start_a + length], b[start_b:start_b + length])
+
+
+def is_duplicate(a, b):
+    return similarity(a, b) >= 1.0 - MATCH_BER
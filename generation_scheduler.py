@@ -0,0 +1,267 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from enum import IntEnum
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Providers every LLM, image and audio job is routed through
+OPENAI_CHAT = 'openai-chat'
+OPENAI_IMAGE = 'openai-image'
+UDIOPRO = 'udiopro'
+# Disk and CPU work on this machine, such as cataloging audio files
+LOCAL = 'local'
+
+DEFAULT_LIMITS = {
+    OPENAI_CHAT: 4,
+    OPENAI_IMAGE: 2,
+    UDIOPRO: 3,
+    LOCAL: 2,
+}
+
+# Slots per provider that only interactive jobs may use
+DEFAULT_RESERVED = {
+    OPENAI_CHAT: 1,
+    OPENAI_IMAGE: 0,
+    UDIOPRO: 0,
+    LOCAL: 0,
+}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    _ids = itertools.count(1)
+
+    def __init__(self, scheduler, provider, fn, priority, label, context=None):
+        self.id = next(self._ids)
+        self.scheduler = scheduler
+        self.provider = provider
+        self.fn = fn
+        self.priority = Priority(priority)
+        self.label = label
+        self.state = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Runs in the submitter's context so trace spans and telemetry labels carry over to the worker thread
+        self.context = context.copy() if context is not None else contextvars.copy_context()
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self._done_event.is_set()
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+    def check_cancelled(self):
+        """Called by long-running job functions between steps."""
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} ({self.label}) was cancelled")
+
+    def sleep(self, seconds):
+        """Sleep between polls, waking up early if the job is cancelled."""
+        if self._cancel_event.wait(seconds):
+            self.check_cancelled()
+
+    def wait(self, timeout=None):
+        if not self._done_event.wait(timeout):
+            raise TimeoutError(f"Job {self.id} ({self.label}) did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done_event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, state, result=None, error=None):
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self._done_event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception(f"Error in done callback of job {self.id} ({self.label})")
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'priority': self.priority.name.lower(),
+            'label': self.label,
+            'state': self.state,
+            'waited': (self.started_at or now) - self.submitted_at,
+            'running_for': (self.finished_at or now) - self.started_at if self.started_at else 0.0,
+        }
+
+
+class GenerationScheduler:
+    """Runs generation jobs under per-provider concurrency caps, highest priority first."""
+
+    def __init__(self, limits=None, reserved=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.reserved = dict(DEFAULT_RESERVED, **(reserved or {}))
+        self._queues = {}
+        self._running = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def submit(self, provider, fn, priority=Priority.NORMAL, label='', context=None):
+        """Queue fn(job) on provider's slots and return the Job handle."""
+        job = Job(self, provider, fn, priority, label or getattr(fn, '__name__', 'job'), context)
+        with self._lock:
+            heapq.heappush(self._queues.setdefault(provider, []), (job.priority, next(self._order), job))
+        logger.debug(f"Job {job.id} queued on {provider} ({job.priority.name}): {job.label}")
+        self._dispatch(provider)
+        self._notify()
+        return job
+
+    def cancel(self, job):
+        job._cancel_event.set()
+        removed = False
+        with self._lock:
+            queue = self._queues.get(job.provider, [])
+            for i, entry in enumerate(queue):
+                if entry[2] is job:
+                    queue.pop(i)
+                    heapq.heapify(queue)
+                    removed = True
+                    break
+        if removed:
+            job._finish(Job.CANCELLED)
+            self._notify()
+
+    def cancel_all(self, label_prefix=''):
+        for job in self.jobs():
+            if job.label.startswith(label_prefix) and not job.finished:
+                job.cancel()
+
+    def _capacity(self, provider, priority):
+        limit = self.limits.get(provider, 1)
+        if priority == Priority.INTERACTIVE:
+            return limit
+        return max(1, limit - self.reserved.get(provider, 0))
+
+    def _dispatch(self, provider):
+        to_start = []
+        with self._lock:
+            queue = self._queues.get(provider, [])
+            running = self._running.setdefault(provider, set())
+            while queue:
+                job = queue[0][2]
+                if len(running) >= self._capacity(provider, job.priority):
+                    break
+                heapq.heappop(queue)
+                job.state = Job.RUNNING
+                job.started_at = time.time()
+                running.add(job)
+                to_start.append(job)
+        for job in to_start:
+            thread = threading.Thread(target=self._run, args=(job,), name=f"{provider}-job-{job.id}", daemon=True)
+            thread.start()
+
+    def _run(self, job):
+        self._notify()
+        try:
+            result = job.context.run(self._call, job)
+        except JobCancelled:
+            job._finish(Job.CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.label}) failed: {str(e)}")
+            job._finish(Job.FAILED, error=e)
+        else:
+            job._finish(Job.CANCELLED if job.cancelled else Job.DONE, result=result)
+        finally:
+            with self._lock:
+                self._running.get(job.provider, set()).discard(job)
+            self._dispatch(job.provider)
+            self._notify()
+
+    def _call(self, job):
+        with span('job', provider=job.provider, priority=job.priority.name.lower(), label=job.label,
+                  queued=job.started_at - job.submitted_at):
+            return job.fn(job)
+
+    def jobs(self):
+        with self._lock:
+            queued = [entry[2] for queue in self._queues.values() for entry in sorted(queue)]
+            running = [job for jobs in self._running.values() for job in jobs]
+        return running + queued
+
+    def snapshot(self):
+        """Queue visibility: one dict per pending or running job, plus per-provider counts."""
+        with self._lock:
+            providers = {
+                provider: {
+                    'limit': self.limits.get(provider, 1),
+                    'running': len(self._running.get(provider, ())),
+                    'queued': len(self._queues.get(provider, ())),
+                }
+                for provider in set(self.limits) | set(self._queues) | set(self._running)
+            }
+        return {'providers': providers, 'jobs': [job.to_dict() for job in self.jobs()]}
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception:
+                logger.exception("Error in scheduler listener")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+        return _scheduler
@@ -0,0 +1,159 @@
+"""Logging that never writes from the calling thread.
+
+Every record goes through a QueueHandler; a QueueListener thread formats it into a size-rotated
+JSON-lines file (and the console). Hot call sites are sampled so a per-chunk debug line cannot
+flood the queue.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_DIR = 'logs'
+LOG_FILE = 'band_manager.jsonl'
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Chatty third-party loggers stay quiet unless asked for
+DEFAULT_MODULE_LEVELS = {
+    'httpx': logging.WARNING,
+    'httpcore': logging.WARNING,
+    'openai': logging.WARNING,
+    'urllib3': logging.WARNING,
+    'PyQt5': logging.WARNING,
+}
+
+# Records per call site allowed in a burst, then per second, below ERROR
+SAMPLE_BURST = 20
+SAMPLE_RATE = 5.0
+
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': record.created,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Token bucket per call site; the next record let through carries how many were dropped."""
+
+    def __init__(self, burst=SAMPLE_BURST, rate=SAMPLE_RATE, below=logging.ERROR):
+        super().__init__()
+        self.burst = burst
+        self.rate = rate
+        self.below = below
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.below:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, dropped = self._sites.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._sites[key] = (tokens, now, dropped + 1)
+                return False
+            self._sites[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Keep extra attributes for the JSON formatter; only resolve the message and traceback here
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_module_levels(spec):
+    """'rate_limiter=DEBUG,httpx=INFO' -> {'rate_limiter': 10, 'httpx': 20}."""
+    levels = {}
+    for part in (spec or '').split(','):
+        if '=' in part:
+            name, level = part.split('=', 1)
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def setup_logging(level=logging.INFO, log_dir=LOG_DIR, log_file=LOG_FILE, console=True, module_levels=None,
+                  max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, sampling=True):
+    """Route all logging through a background listener; returns the path of the JSON-lines log."""
+    global _listener
+    stop_logging()
+
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, log_file)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    if sampling:
+        queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(parse_module_levels(os.getenv('BANDMANAGER_LOG_LEVELS')))
+    levels.update(module_levels or {})
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return path
+
+
+@atexit.register
+def stop_logging():
+    """Flush whatever is still queued; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
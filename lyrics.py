@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QApplication, QMenuBar, QAction, QFileDialog
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QMenuBar, QAction, QFileDialog
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QObject, pyqtSlot
 import json
 from dotenv import load_dotenv
@@ -6,7 +6,12 @@ import os
 import sys
 sys.path.append('.')  # Ajoute le dossier courant au chemin de recherche
 from openai import OpenAI
-from main import resource_path
+from prompt_registry import get_prompt_registry
+from qt_jobs import submit_stage, submit_summary
+from song_stages import load_documents
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
 
 class LyricsTab(QWidget):
     lyrics_updated = pyqtSignal(str)
@@ -17,15 +22,14 @@ class LyricsTab(QWidget):
         self.load_api_key()
         self.current_stream = None
         self.stream_buffer = ""
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('lyrics')
         self.client = None
         self.load_initial_lyrics()
 
     def load_initial_lyrics(self):
         try:
-            with open('lyrics.md', 'r', encoding='utf-8') as f:
-                initial_lyrics = f.read()
-            self.result_area.setPlainText(initial_lyrics)
+            self.result_file.load()
         except FileNotFoundError:
             self.chat_area.append("Warning: lyrics.md file not found. Starting with empty lyrics.")
 
@@ -35,10 +39,8 @@ class LyricsTab(QWidget):
 
         # Chat area
         chat_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.textChanged.connect(lambda: self.chat_area.ensureCursorVisible())
-        self.chat_area.append("Hello! I'm Vox, your lyrical guide. Welcome to the Lyrics Tab! Here you can create and edit your song lyrics. Start by entering your ideas for lyrics or ask for suggestions in the input field below.")
+        self.chat_area = ChatView('lyrics')
+        self.chat_area.greet("Hello! I'm Vox, your lyrical guide. Welcome to the Lyrics Tab! Here you can create and edit your song lyrics. Start by entering your ideas for lyrics or ask for suggestions in the input field below.")
         chat_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -50,19 +52,20 @@ class LyricsTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        input_layout.addWidget(self.stop_button)
+
         chat_layout.addLayout(input_layout)
         layout.addLayout(chat_layout)
 
         # Lyrics display area
         self.result_area = QTextEdit()
-        self.result_area.textChanged.connect(self.save_lyrics)
+        self.result_file = DocumentFile(self.result_area, 'lyrics.md')
         self.result_area.textChanged.connect(lambda: self.result_area.ensureCursorVisible())
         layout.addWidget(self.result_area)
 
-    def save_lyrics(self):
-        with open('lyrics.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -78,17 +81,6 @@ class LyricsTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            lyrics_prompt = self.read_file(resource_path('prompts/lyrics.md'))
-            concept_content = self.read_file(resource_path('concept.md'))
-            composition_content = self.read_file(resource_path('composition.md'))
-            
-            self.system_prompt = f"{lyrics_prompt}\n\nContext from concept.md:\n{concept_content}\n\nContext from composition.md:\n{composition_content}"
-        except Exception as e:
-            self.system_prompt = "You are a creative assistant to help write song lyrics."
-            self.chat_area.append(f"Warning: Error loading prompts: {str(e)}. Using a default prompt.")
-
     def read_file(self, filepath):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
@@ -97,12 +89,9 @@ class LyricsTab(QWidget):
             return f"File {filepath} not found."
 
     def send_message(self):
-        # Update the system prompt with the latest content
-        self.load_system_prompt()
-        
-        user_message = self.input_field.text()
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
 
-    def send_message(self):
         user_message = self.input_field.text()
         self.chat_area.append(f"You: {user_message}")
         self.input_field.clear()
@@ -121,65 +110,44 @@ class LyricsTab(QWidget):
 
         try:
             # Read content from relevant files
-            lyrics_prompt = self.read_file(resource_path('prompts/lyrics.md'))
-            concept_content = self.read_file(resource_path('concept.md'))
-            composition_content = self.read_file(resource_path('composition.md'))
-            management_content = self.read_file(resource_path('management.md'))
+            documents = load_documents()
 
-            self.stream_buffer = ""
             self.chat_area.append("Assistant : ")
-            
-            # Generate title
-            title_stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": lyrics_prompt},
-                    {"role": "system", "content": f"Concept:\n{concept_content}"},
-                    {"role": "system", "content": f"Composition:\n{composition_content}"},
-                    {"role": "system", "content": f"Management:\n{management_content}"},
-                    {"role": "user", "content": f"Generate a title for a song based on this prompt: {user_message}"}
-                ],
-                stream=True
-            )
-            
-            title = ""
-            for chunk in title_stream:
-                if chunk.choices[0].delta.content is not None:
-                    title += chunk.choices[0].delta.content
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
-            
-            self.chat_area.append("\n\nGenerating lyrics...")
-            
-            # Generate lyrics
-            lyrics_stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": lyrics_prompt},
-                    {"role": "system", "content": f"Concept:\n{concept_content}"},
-                    {"role": "system", "content": f"Composition:\n{composition_content}"},
-                    {"role": "system", "content": f"Management:\n{management_content}"},
-                    {"role": "user", "content": f"Generate lyrics for a song titled '{title}' based on this prompt: {user_message}"}
-                ],
-                stream=True
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_stage(
+                self, 'lyrics', self.client, self.prompts, documents, user_message,
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=self.on_stream_done,
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                history=self.memory.messages()
             )
-            
-            lyrics = ""
-            for chunk in lyrics_stream:
-                if chunk.choices[0].delta.content is not None:
-                    lyrics += chunk.choices[0].delta.content
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
-            
-            self.update_lyrics(f"Title: {title}\n\n{lyrics}")
         except Exception as e:
-            self.chat_area.append(f"Error sending message: {str(e)}")
-            self.chat_area.append("Please check your internet connection and the validity of your API key.")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        self.update_lyrics(result.text)
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Error sending message: {error}")
+        self.chat_area.append("Please check your internet connection and the validity of your API key.")
 
     def update_lyrics(self, new_content):
-        self.result_area.setPlainText(new_content)
+        self.result_file.replace(new_content)
         self.lyrics_updated.emit(new_content)
-        
-        # Sauvegarder les paroles dans lyrics.md
-        with open('lyrics.md', 'w', encoding='utf-8') as f:
-            f.write(new_content)
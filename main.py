@@ -4,84 +4,52 @@ import os
 import logging
 import traceback
 import argparse
+import multiprocessing
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.info("Démarrage du programme")
-
-current_dir = os.getcwd()
-logging.info(f"Répertoire de travail actuel: {current_dir}")
-logging.info(f"Contenu du répertoire: {os.listdir(current_dir)}")
-
-# Print Python path
-logging.info(f"Python path: {sys.path}")
-
+from log_setup import setup_logging, parse_module_levels
+from paths import resource_path
 from PyQt5.QtWidgets import QApplication, QMessageBox, QSplashScreen
 from PyQt5.QtGui import QPixmap, QPainter, QFont
 from PyQt5.QtCore import Qt, QTimer, QPoint
 from welcome_screen import WelcomeScreen
 from style import set_dark_theme
-
-# Parse command-line arguments
-parser = argparse.ArgumentParser(description='Band Manager Application')
-parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
-args = parser.parse_args()
-
-# Configure logging
-log_file = 'band_manager.log'
-logging.basicConfig(
-    level=logging.DEBUG if args.verbose else logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename=log_file,
-    filemode='w'
-)
-
-# Add a console handler to see logs in console as well
-console = logging.StreamHandler()
-console.setLevel(logging.DEBUG if args.verbose else logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console.setFormatter(formatter)
-logging.getLogger('').addHandler(console)
-
-logging.info("Program started")
-print("Program started. Check the log file at:", log_file)
-if args.verbose:
-    print("Verbose logging enabled")
-
-# Log system information
-logging.info(f"Python version: {sys.version}")
-logging.info(f"Operating system: {sys.platform}")
-
-def resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
-
-# Load .env file
-env_path = resource_path('.env')
-if os.path.exists(env_path):
-    load_dotenv(env_path)
-    logging.info(f".env file loaded from {env_path}")
-else:
-    logging.warning(f".env file not found at {env_path}")
-    logging.info("Attempting to use environment variables")
-    for key in ['OPENAI_API_KEY', 'UDIOPRO_API_KEY']:
-        if os.environ.get(key):
-            logging.info(f"{key} found in environment variables")
-        else:
-            logging.warning(f"{key} not found in environment variables")
+from stall_watchdog import get_stall_watchdog
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Band Manager Application')
+    parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
+    parser.add_argument('--log-levels', help='Per-module levels, e.g. rate_limiter=DEBUG,httpx=INFO')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this localhost port')
+    parser.add_argument('--stall-threshold', type=int, default=50,
+                        help='Log the GUI thread stack when the event loop stalls longer than this many ms (0 disables)')
+    return parser.parse_args(argv)
+
+
+def load_environment():
+    env_path = resource_path('.env')
+    if os.path.exists(env_path):
+        load_dotenv(env_path)
+        logging.info(f".env file loaded from {env_path}")
+    else:
+        logging.warning(f".env file not found at {env_path}")
+        logging.info("Attempting to use environment variables")
+        for key in ['OPENAI_API_KEY', 'UDIOPRO_API_KEY']:
+            if os.environ.get(key):
+                logging.info(f"{key} found in environment variables")
+            else:
+                logging.warning(f"{key} not found in environment variables")
 
 class BandManager:
-    def __init__(self):
+    def __init__(self, stall_threshold=50):
         logging.info("Initializing BandManager")
         self.app = QApplication(sys.argv)
         logging.info("QApplication created")
         set_dark_theme(self.app)
         logging.info("Dark theme set")
+        if stall_threshold > 0:
+            get_stall_watchdog(stall_threshold).start()
         self.welcome_screen = None
         self.main_interface = None
         splash_pixmap = QPixmap(resource_path("splash.png"))
@@ -158,14 +126,52 @@ def exception_hook(exctype, value, traceback):
     logging.error("Uncaught exception", exc_info=(exctype, value, traceback))
     sys.__excepthook__(exctype, value, traceback)
 
-if __name__ == "__main__":
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Configure logging: records are queued and written by a background thread, never by the GUI thread
+    log_file = setup_logging(level=logging.DEBUG if args.verbose else logging.INFO,
+                             module_levels=parse_module_levels(args.log_levels))
+    logging.info("Démarrage du programme")
+
+    current_dir = os.getcwd()
+    logging.info(f"Répertoire de travail actuel: {current_dir}")
+    logging.info(f"Contenu du répertoire: {os.listdir(current_dir)}")
+
+    # Print Python path
+    logging.info(f"Python path: {sys.path}")
+
+    logging.info("Program started")
+    print("Program started. Check the log file at:", log_file)
+    if args.verbose:
+        print("Verbose logging enabled")
+
+    if args.metrics_port:
+        from telemetry import get_telemetry
+        get_telemetry().serve(args.metrics_port)
+
+    # Log system information
+    logging.info(f"Python version: {sys.version}")
+    logging.info(f"Operating system: {sys.platform}")
+
+    load_environment()
+
     sys.excepthook = exception_hook
     try:
         logging.info("Création de l'instance BandManager")
-        manager = BandManager()
+        manager = BandManager(args.stall_threshold)
         logging.info("Lancement de l'application")
         manager.run()
     except Exception as e:
         logging.exception("Erreur fatale dans la boucle principale")
         print(f"Une erreur fatale s'est produite : {str(e)}")
         input("Appuyez sur Entrée pour quitter...")
+
+if __name__ == "__main__":
+    # Frozen builds start the audio analysis worker processes by running this executable again
+    multiprocessing.freeze_support()
+    # `python main.py batch spec.json` runs the headless pipeline instead of the GUI
+    if sys.argv[1:2] == ['batch']:
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    main()
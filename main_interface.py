@@ -11,6 +11,11 @@ from visual_design import VisualDesignTab
 from concert import ConcertTab
 from song_management import SongManagementTab
 from critique import CritiqueTab
+from performance import PerformanceTab
+from chat_view import session_transcript, song_transcript
+from conversation_memory import song_memory
+from audio_library import get_library
+from paths import song_folder as folder_for
 import os
 import sys
 from dotenv import load_dotenv
@@ -89,6 +94,7 @@ class MainInterface(QWidget):
         self.visual_design_tab = VisualDesignTab()
         self.concert_tab = ConcertTab()
         self.critique_tab = CritiqueTab()
+        self.performance_tab = PerformanceTab()
 
         self.tabs.addTab(self.song_management_tab, "Song Management")
         self.tabs.addTab(self.management_tab, "Management")
@@ -99,6 +105,7 @@ class MainInterface(QWidget):
         self.tabs.addTab(self.visual_design_tab, "Visual Design")
         self.tabs.addTab(self.critique_tab, "Critique")
         self.tabs.addTab(self.concert_tab, "Concert")
+        self.tabs.addTab(self.performance_tab, "Performance")
 
         self.song_management_tab.song_selected.connect(self.load_song)
         self.song_management_tab.song_deleted.connect(self.on_song_deleted)
@@ -107,12 +114,21 @@ class MainInterface(QWidget):
 
         main_layout.addWidget(self.tabs)
 
+    def song_chats(self):
+        return [self.concept_tab.chat_area, self.lyrics_tab.chat_area, self.composition_tab.chat_area,
+                self.production_tab.chat_area, self.visual_design_tab.chat_area, self.critique_tab.chat_area,
+                self.concert_tab.chat_area]
+
+    def song_memories(self):
+        return [self.concept_tab.memory, self.lyrics_tab.memory, self.composition_tab.memory,
+                self.production_tab.memory, self.visual_design_tab.memory, self.critique_tab.memory]
+
     def reset_chats(self):
-        self.concept_tab.chat_area.clear()
-        self.lyrics_tab.chat_area.clear()
-        self.composition_tab.chat_area.clear()
-        self.production_tab.chat_area.clear()
-        self.visual_design_tab.chat_area.clear()
+        # Back to the unsaved-session transcripts, starting from an empty view
+        for chat in self.song_chats():
+            chat.set_transcript(session_transcript(chat.name), show_history=False)
+        for memory in self.song_memories():
+            memory.switch(None)
 
     def get_band_name(self):
         import json
@@ -125,10 +141,11 @@ class MainInterface(QWidget):
 
     def new_song(self):
         self.reset_chats()
+        self.production_tab.song_title = None
         self.new_song_signal.emit()
 
     def load_song(self, song_title):
-        song_folder = os.path.join('songs', song_title)
+        song_folder = folder_for(song_title)
         if os.path.exists(song_folder):
             try:
                 # Load concept
@@ -147,6 +164,14 @@ class MainInterface(QWidget):
                 with open(os.path.join(song_folder, 'visual_design.md'), 'r', encoding='utf-8') as f:
                     self.visual_design_tab.result_area.setPlainText(f.read())
 
+                # Show each chat's history for this song
+                for chat in self.song_chats():
+                    chat.set_transcript(song_transcript(song_title, chat.name))
+                for memory in self.song_memories():
+                    memory.switch(song_memory(song_title, memory.name))
+                # Tracks generated from here on are cataloged under this song
+                self.production_tab.song_title = song_title
+
                 # Switch to the Concept tab
                 self.tabs.setCurrentWidget(self.concept_tab)
             except Exception as e:
@@ -172,11 +197,27 @@ class MainInterface(QWidget):
         self.lyrics_tab.result_area.clear()
         self.composition_tab.result_area.clear()
         self.visual_design_tab.result_area.clear()
+        self.reset_chats()
+        if self.production_tab.song_title == song_title:
+            self.production_tab.song_title = None
 
     def on_song_saved(self, song_title):
         QMessageBox.information(self, "Save Successful", f"Song '{song_title}' has been saved.")
 
     def on_song_renamed(self, old_title, new_title):
+        # The song folder moved with its transcripts; keep appending to them at the new path
+        for chat in self.song_chats():
+            if chat.transcript.path == song_transcript(old_title, chat.name):
+                chat.transcript.path = song_transcript(new_title, chat.name)
+        for memory in self.song_memories():
+            if memory.path == song_memory(old_title, memory.name):
+                memory.path = song_memory(new_title, memory.name)
+        if self.production_tab.song_title == old_title:
+            self.production_tab.song_title = new_title
+        library = get_library()
+        if library is not None:
+            library.rename_song(old_title, new_title)
+            self.production_tab.refresh_library()
         QMessageBox.information(self, "Rename Successful", f"Song '{old_title}' has been renamed to '{new_title}'.")
 
 
@@ -1,14 +1,21 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QApplication
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QLineEdit, QPushButton
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
 import os
 from openai import OpenAI
+from prompt_registry import get_prompt_registry
+from qt_jobs import submit_chat_stream, submit_summary
+from chat_view import ChatView
+from conversation_memory import ConversationMemory, session_memory
 
 class ManagementTab(QWidget):
     def __init__(self):
         super().__init__()
         self.initUI()
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        # Management is about the band rather than one song, so its memory is kept across songs
+        self.memory = ConversationMemory('management', session_memory('management'))
+        self.current_stream = None
         self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
     def initUI(self):
@@ -21,9 +28,8 @@ class ManagementTab(QWidget):
         layout.addWidget(self.info_area)
 
         # Zone de chat
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.append("Hey! I'm the band manager. Welcome to the Management Tab! Here you can manage your band's information and strategy. Use the input field below to ask questions or make decisions about your band's management.")
+        self.chat_area = ChatView('management')
+        self.chat_area.greet("Hey! I'm the band manager. Welcome to the Management Tab! Here you can manage your band's information and strategy. Use the input field below to ask questions or make decisions about your band's management.")
         layout.addWidget(self.chat_area)
 
         # Champ de saisie pour les nouvelles informations
@@ -36,6 +42,12 @@ class ManagementTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         layout.addWidget(self.send_button)
 
+        # Bouton pour interrompre la réponse en cours
+        self.stop_button = QPushButton("Arrêter")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        layout.addWidget(self.stop_button)
+
         # Bouton pour mettre à jour les informations du groupe
         self.update_button = QPushButton("Mettre à jour les informations du groupe")
         self.update_button.clicked.connect(self.update_info)
@@ -44,13 +56,6 @@ class ManagementTab(QWidget):
         # Charger les informations existantes
         self.load_info()
 
-    def load_system_prompt(self):
-        try:
-            with open('prompts/management.md', 'r', encoding='utf-8') as f:
-                self.system_prompt = f.read().strip()
-        except FileNotFoundError:
-            self.system_prompt = "You are a helpful assistant for band management."
-
     def load_info(self):
         try:
             with open('band_info.txt', 'r', encoding='utf-8') as f:
@@ -61,25 +66,52 @@ class ManagementTab(QWidget):
             self.info_area.setPlainText(info)
 
     def send_message(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
+
         user_message = self.input_field.text()
         self.chat_area.append(f"Vous : {user_message}")
         self.input_field.clear()
 
         try:
             self.chat_area.append("Assistant : ")
-            for chunk in self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_chat_stream(
+                self, self.client,
+                [
+                    {"role": "system", "content": self.prompts.text('management')},
+                    *self.memory.messages(),
                     {"role": "user", "content": user_message}
                 ],
-                stream=True
-            ):
-                if chunk.choices[0].delta.content is not None:
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=lambda response: self.on_stream_done(user_message, response),
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                label='management'
+            )
         except Exception as e:
-            self.chat_area.append(f"Erreur : {str(e)}")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, user_message, response):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(user_message, response)
+        submit_summary(self, self.memory, self.client, self.prompts)
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Erreur : {error}")
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Interrompu)")
 
     def save_info(self):
         current_info = self.info_area.toPlainText()
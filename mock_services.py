@@ -0,0 +1,394 @@
+"""Local stand-in for the OpenAI and UdioPro APIs, for offline latency and throughput measurements.
+
+Start it with `python mock_services.py --port 8765`, then point the app or the batch command at it:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 UDIOPRO_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import random
+import struct
+import threading
+import time
+import urllib.request
+import uuid
+import wave
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("neon static signal bloom midnight circuit echo chorus verse bridge synth drum guitar pulse "
+         "dream machine heart voice shadow light city rain wire ghost rhythm melody fade rise").split()
+
+# Smallest valid PNG (1x1 black pixel), served as every generated image
+PNG_PIXEL = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+@dataclass
+class MockConfig:
+    ttft: float = 0.3                 # seconds before the first streamed token
+    tokens_per_second: float = 80.0   # streaming rate after the first token
+    completion_tokens: int = 200      # tokens per chat completion
+    image_latency: float = 2.0
+    job_duration: float = 20.0        # seconds from UdioPro submit to 'complete'
+    audio_seconds: float = 30.0       # length of the generated audio
+    error_rate: float = 0.0           # probability of a 500 on any API call
+    rate_limit_rate: float = 0.0      # probability of a 429 on any API call
+    rpm: int = 0                      # hard requests-per-minute limit, 0 for none
+    seed: int = 0
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.jobs = {}
+        self.request_times = []
+        self.counters = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'callbacks': 0}
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Return the status code to fail this request with, or None to serve it."""
+        with self.lock:
+            self.counters['requests'] += 1
+            now = time.time()
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if self.config.rpm and len(self.request_times) >= self.config.rpm:
+                self.counters['rate_limited'] += 1
+                return 429
+            self.request_times.append(now)
+            roll = self.random.random()
+            if roll < self.config.rate_limit_rate:
+                self.counters['rate_limited'] += 1
+                return 429
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                self.counters['errors'] += 1
+                return 500
+        return None
+
+    def rate_limit_headers(self):
+        with self.lock:
+            used = len(self.request_times)
+        limit = self.config.rpm or 10000
+        return {
+            'x-ratelimit-limit-requests': str(limit),
+            'x-ratelimit-remaining-requests': str(max(0, limit - used)),
+            'x-ratelimit-reset-requests': '60s' if used else '0s',
+            'x-ratelimit-limit-tokens': '2000000',
+            'x-ratelimit-remaining-tokens': '2000000',
+            'x-ratelimit-reset-tokens': '0s',
+        }
+
+    def words(self, count):
+        with self.lock:
+            return [self.random.choice(WORDS) for _ in range(count)]
+
+
+def song_response_json(words):
+    return json.dumps({
+        "short_prompt": " ".join(words[:8]),
+        "extend_prompts": [" ".join(words[8:14]), " ".join(words[14:20])],
+        "outro_prompt": " ".join(words[20:26]),
+        "num_extensions": 2,
+        "custom_lyrics_short": " ".join(words[26:40]),
+        "custom_lyrics_extend": [" ".join(words[40:52]), " ".join(words[52:64])],
+        "custom_lyrics_outro": " ".join(words[64:72]),
+    })
+
+
+def sine_wav(seconds, frequency=220.0, rate=22050):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        frames = int(seconds * rate)
+        samples = bytearray()
+        for i in range(frames):
+            value = int(12000 * math.sin(2 * math.pi * frequency * i / rate))
+            samples += struct.pack('<hh', value, value)
+        wav.writeframes(bytes(samples))
+    return buffer.getvalue()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'BandManagerMock/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else {}
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_bytes(self, data, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def fail_if_unlucky(self):
+        status = self.state.admit()
+        if status is None:
+            return False
+        headers = self.state.rate_limit_headers()
+        if status == 429:
+            headers['retry-after'] = '1'
+        message = 'Rate limit reached' if status == 429 else 'Mock server error'
+        self.send_json({'error': {'message': message, 'type': 'mock_error', 'code': status}}, status, headers)
+        return True
+
+    def base_url(self):
+        host = self.headers.get('Host') or f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+        return f"http://{host}"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/v1/models':
+            self.send_json({'object': 'list', 'data': [{'id': 'gpt-4o-mini', 'object': 'model', 'created': 0, 'owned_by': 'mock'}]})
+        elif url.path == '/api/feed':
+            if self.fail_if_unlucky():
+                return
+            work_id = parse_qs(url.query).get('workId', [''])[0]
+            self.send_json(self.feed(work_id))
+        elif url.path.startswith('/mock/audio/'):
+            self.send_bytes(sine_wav(self.state.config.audio_seconds), 'audio/wav')
+        elif url.path.startswith('/mock/image/'):
+            self.send_bytes(PNG_PIXEL, 'image/png')
+        elif url.path == '/mock/stats':
+            with self.state.lock:
+                self.send_json({'config': asdict(self.state.config), 'counters': dict(self.state.counters),
+                                'jobs': len(self.state.jobs)})
+        else:
+            self.send_json({'error': {'message': f'Unknown path {url.path}'}}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        payload = self.read_json()
+        if url.path == '/v1/chat/completions':
+            if self.fail_if_unlucky():
+                return
+            self.chat_completion(payload)
+        elif url.path == '/v1/images/generations':
+            if self.fail_if_unlucky():
+                return
+            time.sleep(self.state.config.image_latency)
+            self.send_json({'created': int(time.time()),
+                            'data': [{'url': f"{self.base_url()}/mock/image/{uuid.uuid4().hex}.png", 'revised_prompt': payload.get('prompt', '')}]},
+                           headers=self.state.rate_limit_headers())
+        elif url.path == '/api/generate':
+            if self.fail_if_unlucky():
+                return
+            work_id = uuid.uuid4().hex
+            job = {'submitted_at': time.time(), 'request': payload, 'base_url': self.base_url()}
+            with self.state.lock:
+                self.state.jobs[work_id] = job
+            self.send_json({'message': 'success', 'workId': work_id})
+            if payload.get('callback_url') and not payload.get('disable_callback'):
+                timer = threading.Timer(self.state.config.job_duration, self.push_callback,
+                                        (payload['callback_url'], self.result_for(work_id, job, 'complete')))
+                timer.daemon = True
+                timer.start()
+        else:
+            self.send_json({'error': {'message': f'Unknown path {url.path}'}}, 404)
+
+    def chat_completion(self, payload):
+        config = self.state.config
+        words = self.state.words(max(72, config.completion_tokens))
+        if (payload.get('response_format') or {}).get('type') == 'json_object':
+            text = song_response_json(words)
+            pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        else:
+            pieces = [word + ' ' for word in words[:config.completion_tokens]]
+        prompt_tokens = sum(len(str(m.get('content', ''))) // 4 for m in payload.get('messages', []))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+                 'total_tokens': prompt_tokens + len(pieces)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = payload.get('model', 'gpt-4o-mini')
+        created = int(time.time())
+
+        time.sleep(config.ttft)
+        if not payload.get('stream'):
+            self.send_json({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(pieces)}}],
+                'usage': usage,
+            }, headers=self.state.rate_limit_headers())
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        for name, value in self.state.rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None, chunk_usage=None, choices=True):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if choices else [],
+                     'usage': chunk_usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for piece in pieces:
+                event({'content': piece})
+                if interval:
+                    time.sleep(interval)
+            event({}, finish_reason='stop')
+            if (payload.get('stream_options') or {}).get('include_usage'):
+                event(None, chunk_usage=usage, choices=False)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client closed the stream early")
+
+    def feed(self, work_id):
+        with self.state.lock:
+            job = self.state.jobs.get(work_id)
+        if job is None:
+            return {'type': 'error', 'message': f'Unknown workId {work_id}'}
+        elapsed = time.time() - job['submitted_at']
+        duration = self.state.config.job_duration
+        if elapsed < duration * 0.2:
+            status = 'new'
+        elif elapsed < duration * 0.6:
+            status = 'text'
+        elif elapsed < duration:
+            status = 'first'
+        else:
+            status = 'complete'
+        return self.result_for(work_id, job, status)
+
+    def push_callback(self, url, result):
+        request = urllib.request.Request(url, data=json.dumps(result).encode('utf-8'), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+            with self.state.lock:
+                self.state.counters['callbacks'] += 1
+        except OSError as e:
+            logger.warning(f"Callback to {url} failed: {str(e)}")
+
+    def result_for(self, work_id, job, status):
+        request = job['request']
+        result = {'type': status, 'workId': work_id,
+                  'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['submitted_at'])),
+                  'response_data': []}
+        if status == 'complete':
+            for i in range(2):
+                clip_id = f"{work_id}-{i}"
+                result['response_data'].append({
+                    'id': clip_id,
+                    'title': request.get('title', 'Generated Song'),
+                    'audio_url': f"{job['base_url']}/mock/audio/{clip_id}.wav",
+                    'image_url': f"{job['base_url']}/mock/image/{clip_id}.png",
+                    'duration': self.state.config.audio_seconds,
+                    'tags': 'mock',
+                    'prompt': request.get('prompt', ''),
+                    'model_name': request.get('model', 'chirp-v3.5'),
+                    'createTime': int(job['submitted_at'] * 1000),
+                })
+        return result
+
+
+class MockServices:
+    """Runs the stand-in server on a background thread: `with MockServices() as mock: mock.openai_base_url`."""
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or MockConfig()
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.state = MockState(self.config)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self):
+        return f"{self.base_url}/v1"
+
+    @property
+    def udiopro_base_url(self):
+        return self.base_url
+
+    @property
+    def counters(self):
+        with self.server.state.lock:
+            return dict(self.server.state.counters)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-services', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local OpenAI and UdioPro stand-in for benchmarking')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    defaults = MockConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = MockConfig(**{name: getattr(args, name) for name in asdict(defaults)})
+    services = MockServices(config, args.host, args.port)
+    print(f"Mock services listening on {services.base_url}")
+    print(f"  OPENAI_BASE_URL={services.openai_base_url}")
+    print(f"  UDIOPRO_BASE_URL={services.udiopro_base_url}")
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        services.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
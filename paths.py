@@ -0,0 +1,32 @@
+import os
+import re
+import sys
+
+# Characters Windows refuses in file names, plus control characters; '/' and '\' would nest folders
+_UNSAFE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+_RESERVED = {'CON', 'PRN', 'AUX', 'NUL', *(f'COM{i}' for i in range(1, 10)), *(f'LPT{i}' for i in range(1, 10))}
+MAX_NAME = 100
+
+
+def safe_filename(title, default='untitled'):
+    """title as a single file or folder name; ordinary titles come back unchanged."""
+    name = _UNSAFE.sub('_', str(title)).strip().rstrip('.')[:MAX_NAME].strip()
+    if not name or set(name) == {'.'}:
+        return default
+    if name.split('.')[0].upper() in _RESERVED:
+        name = '_' + name
+    return name
+
+
+def song_folder(title, songs_dir='songs'):
+    return os.path.join(songs_dir, safe_filename(title))
+
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
@@ -0,0 +1,284 @@
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QGroupBox, QTableWidget,
+                             QTableWidgetItem, QLabel, QCheckBox, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPainter, QColor
+import os
+import sys
+import time
+import tracemalloc
+from generation_scheduler import get_scheduler
+from rate_limiter import get_rate_limiter
+from stall_watchdog import get_stall_watchdog
+from telemetry import get_telemetry
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REFRESH_MS = 1000
+# tracemalloc snapshots walk every live allocation, so they are taken far less often
+HEAP_REFRESH_SECONDS = 10
+HISTOGRAM_BINS = 20
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def process_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def subsystem(filename):
+    """Group allocations by our own module, or by the third-party package they came from."""
+    if filename.startswith(REPO_DIR):
+        return os.path.splitext(os.path.relpath(filename, REPO_DIR))[0]
+    parts = filename.replace('\\', '/').split('/')
+    if 'site-packages' in parts:
+        return parts[parts.index('site-packages') + 1].split('.')[0]
+    return 'stdlib' if filename.startswith(sys.prefix) or filename.startswith(sys.base_prefix) else filename
+
+
+def heap_by_subsystem(limit=15):
+    snapshot = tracemalloc.take_snapshot()
+    totals = {}
+    for stat in snapshot.statistics('filename'):
+        name = subsystem(stat.traceback[0].filename)
+        size, count = totals.get(name, (0, 0))
+        totals[name] = (size + stat.size, count + stat.count)
+    return sorted(((name, size, count) for name, (size, count) in totals.items()), key=lambda t: -t[1])[:limit]
+
+
+def format_bytes(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value is not None and value < 1 else (f"{value:.2f} s" if value is not None else '-')
+
+
+class HistogramWidget(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.values = []
+        self.title = ''
+        self.setMinimumHeight(120)
+
+    def set_values(self, title, values):
+        self.title = title
+        self.values = values
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(25, 25, 25))
+        painter.setPen(QColor(200, 200, 200))
+        if not self.values:
+            painter.drawText(self.rect(), Qt.AlignCenter, "Select a latency row to see its distribution")
+            return
+        low, high = min(self.values), max(self.values)
+        span = (high - low) or 1.0
+        counts = [0] * HISTOGRAM_BINS
+        for value in self.values:
+            counts[min(HISTOGRAM_BINS - 1, int((value - low) / span * HISTOGRAM_BINS))] += 1
+        top = max(counts)
+        width = self.width() / HISTOGRAM_BINS
+        height = self.height() - 36
+        painter.drawText(4, 14, f"{self.title}  ({len(self.values)} samples)")
+        painter.drawText(4, self.height() - 4, format_seconds(low))
+        painter.drawText(self.rect().adjusted(0, 0, -4, -4), Qt.AlignRight | Qt.AlignBottom, format_seconds(high))
+        for i, count in enumerate(counts):
+            bar = int(count / top * height)
+            painter.fillRect(int(i * width) + 1, 20 + height - bar, max(1, int(width) - 2), bar, QColor(150, 0, 0))
+
+
+class PerformanceTab(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.telemetry = get_telemetry()
+        self.latency_series = []
+        self.heap_updated_at = 0.0
+        self.initUI()
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def initUI(self):
+        layout = QGridLayout()
+        self.setLayout(layout)
+
+        latency_box = QGroupBox("Request latency by tab")
+        latency_layout = QVBoxLayout()
+        latency_box.setLayout(latency_layout)
+        self.latency_table = self.make_table(["Tab", "Stage", "Kind", "Model", "Requests", "TTFT p50", "TTFT p95",
+                                              "Duration p50", "Duration p95", "Duration p99"])
+        self.latency_table.itemSelectionChanged.connect(self.show_selected_histogram)
+        latency_layout.addWidget(self.latency_table)
+        self.histogram = HistogramWidget()
+        latency_layout.addWidget(self.histogram)
+        layout.addWidget(latency_box, 0, 0, 2, 1)
+
+        streams_box = QGroupBox("Active requests")
+        streams_layout = QVBoxLayout()
+        streams_box.setLayout(streams_layout)
+        self.streams_table = self.make_table(["Tab", "Stage", "Kind", "Elapsed", "Tokens", "Tokens/s", "UdioPro status"])
+        streams_layout.addWidget(self.streams_table)
+        layout.addWidget(streams_box, 0, 1)
+
+        queue_box = QGroupBox("Generation queue")
+        queue_layout = QVBoxLayout()
+        queue_box.setLayout(queue_layout)
+        self.providers_label = QLabel()
+        queue_layout.addWidget(self.providers_label)
+        self.jobs_table = self.make_table(["Job", "Provider", "Priority", "Label", "State", "Waited", "Running"])
+        queue_layout.addWidget(self.jobs_table)
+        layout.addWidget(queue_box, 1, 1)
+
+        memory_box = QGroupBox("Memory")
+        memory_layout = QVBoxLayout()
+        memory_box.setLayout(memory_layout)
+        memory_header = QHBoxLayout()
+        self.rss_label = QLabel()
+        memory_header.addWidget(self.rss_label)
+        self.heap_checkbox = QCheckBox("Trace Python heap (slows allocations)")
+        self.heap_checkbox.toggled.connect(self.toggle_heap_tracing)
+        memory_header.addWidget(self.heap_checkbox)
+        memory_layout.addLayout(memory_header)
+        self.heap_table = self.make_table(["Subsystem", "Size", "Blocks"])
+        memory_layout.addWidget(self.heap_table)
+        layout.addWidget(memory_box, 2, 0)
+
+        stalls_box = QGroupBox("Event-loop stalls")
+        stalls_layout = QVBoxLayout()
+        stalls_box.setLayout(stalls_layout)
+        self.stalls_label = QLabel()
+        stalls_layout.addWidget(self.stalls_label)
+        self.stalls_table = self.make_table(["Call site", "Count", "Total", "Max"])
+        stalls_layout.addWidget(self.stalls_table)
+        layout.addWidget(stalls_box, 2, 1)
+
+    def make_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    def fill_table(self, table, rows):
+        # Only touch cells whose text changed, so an idle dashboard does no layout work
+        table.setUpdatesEnabled(False)
+        table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                text = str(value)
+                item = table.item(r, c)
+                if item is None:
+                    table.setItem(r, c, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+        table.setUpdatesEnabled(True)
+
+    # Sampling only runs while the tab is on screen
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def refresh(self):
+        self.refresh_latency()
+        self.refresh_streams()
+        self.refresh_queue()
+        self.refresh_memory()
+        self.refresh_stalls()
+
+    def refresh_latency(self):
+        summary = self.telemetry.summary()
+        ttft = {self.series_key(entry): entry for entry in summary.get('ttft_seconds', [])}
+        rows = []
+        self.latency_series = []
+        for entry in summary.get('duration_seconds', []):
+            key = self.series_key(entry)
+            first = ttft.get(key, {})
+            self.latency_series.append(key)
+            rows.append([entry['tab'] or '-', entry['stage'] or '-', entry['kind'], entry['model'] or '-',
+                         entry['count'], format_seconds(first.get('p50')), format_seconds(first.get('p95')),
+                         format_seconds(entry['p50']), format_seconds(entry['p95']), format_seconds(entry['p99'])])
+        self.fill_table(self.latency_table, rows)
+        self.show_selected_histogram()
+
+    def series_key(self, entry):
+        return tuple((name, entry[name]) for name in ('kind', 'model', 'stage', 'tab'))
+
+    def show_selected_histogram(self):
+        row = self.latency_table.currentRow()
+        if row < 0 or row >= len(self.latency_series):
+            self.histogram.set_values('', [])
+            return
+        labels = dict(self.latency_series[row])
+        title = f"{labels['tab'] or labels['kind']} / {labels['stage'] or labels['model']} duration"
+        self.histogram.set_values(title, self.telemetry.values('duration_seconds', labels))
+
+    def refresh_streams(self):
+        rows = []
+        for request in sorted(self.telemetry.active_requests(), key=lambda r: -r['elapsed']):
+            rate = request['tokens_per_second']
+            rows.append([request['tab'] or '-', request['stage'] or '-', request['kind'],
+                         format_seconds(request['elapsed']), request['tokens'] or '-',
+                         f"{rate:.1f}" if rate else '-', request['status'] or '-'])
+        self.fill_table(self.streams_table, rows)
+
+    def refresh_queue(self):
+        snapshot = get_scheduler().snapshot()
+        self.providers_label.setText("   ".join(
+            f"{provider}: {counts['running']}/{counts['limit']} running, {counts['queued']} queued"
+            for provider, counts in sorted(snapshot['providers'].items())))
+        throttled = sum(stats['throttled'] for stats in get_rate_limiter().stats().values())
+        if throttled:
+            self.providers_label.setText(self.providers_label.text() + f"   throttled: {throttled}")
+        rows = [[job['id'], job['provider'], job['priority'], job['label'], job['state'],
+                 format_seconds(job['waited']), format_seconds(job['running_for'])] for job in snapshot['jobs']]
+        self.fill_table(self.jobs_table, rows)
+
+    def toggle_heap_tracing(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.fill_table(self.heap_table, [])
+        self.heap_updated_at = 0.0
+
+    def refresh_memory(self):
+        text = f"Process RSS: {format_bytes(process_rss())}"
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            text += f"   Python heap: {format_bytes(current)} (peak {format_bytes(peak)})"
+            if time.time() - self.heap_updated_at >= HEAP_REFRESH_SECONDS:
+                self.heap_updated_at = time.time()
+                self.fill_table(self.heap_table, [[name, format_bytes(size), count]
+                                                  for name, size, count in heap_by_subsystem()])
+        self.rss_label.setText(text)
+
+    def refresh_stalls(self):
+        watchdog = get_stall_watchdog()
+        sites = watchdog.report()
+        self.stalls_label.setText(f"{watchdog.stalls} stalls over {watchdog.threshold * 1000:.0f} ms")
+        self.fill_table(self.stalls_table, [[site['site'], site['count'], f"{site['total_ms']:.0f} ms",
+                                             f"{site['max_ms']:.0f} ms"] for site in sites[:20]])
@@ -0,0 +1,293 @@
+"""Gapless playback for the production player, with the next queued track decoded ahead of time.
+
+Each track is decoded to 44.1 kHz stereo int16 by audio_stitch's block decoder (WAV directly,
+anything else through ffmpeg) on a thread of its own, a bounded few seconds ahead of playback, and
+its waveform peaks are built into the shared peak cache alongside. The next queued track is
+prepared as soon as the current one starts, so when the current one runs out the engine keeps
+writing to the same QAudioOutput from the next one's buffers: no device reopen, no decoder start
+and no silence between takes.
+
+Decoding threads are plain daemon threads rather than scheduler jobs: one lives as long as its
+track plays and would otherwise hold a LOCAL slot for minutes.
+"""
+import logging
+import os
+import queue
+import threading
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtMultimedia import QAudio, QAudioFormat, QAudioOutput, QMediaPlayer
+from audio_stitch import pcm_blocks, SAMPLE_RATE, CHANNELS
+from waveform_peaks import get_peak_cache
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = CHANNELS * 2
+# 186 ms per decoded block, so the first audio of a track is ready almost at once
+DECODE_FRAMES = 8192
+# Decoded audio held ahead of playback per track, which is also what a preloaded track has ready
+BUFFER_SECONDS = 4
+OUTPUT_BUFFER_SECONDS = 0.5
+FEED_INTERVAL_MS = 20
+
+
+class PreparedTrack:
+    """A track decoding on its own thread into a bounded queue of int16 blocks."""
+
+    def __init__(self, path, on_peaks=None):
+        self.path = path
+        self._on_peaks = on_peaks
+        self.error = None
+        self._blocks = queue.Queue(maxsize=max(1, int(BUFFER_SECONDS * SAMPLE_RATE / DECODE_FRAMES)))
+        self._pending = b''
+        self._decoded = threading.Event()
+        self._stop = threading.Event()
+        name = os.path.basename(path)
+        threading.Thread(target=self._decode, name=f'decode-{name}', daemon=True).start()
+        # Peaks come from their own thread, so decoding an MP3 for them never starves playback
+        threading.Thread(target=self._load_peaks, name=f'peaks-{name}', daemon=True).start()
+
+    def _decode(self):
+        blocks = pcm_blocks(self.path, SAMPLE_RATE, CHANNELS, DECODE_FRAMES)
+        try:
+            for block in blocks:
+                data = np.clip(block, -32768, 32767).astype('<i2').tobytes()
+                while not self._stop.is_set():
+                    try:
+                        self._blocks.put(data, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            self.error = str(e)
+            logger.warning(f"Could not decode {self.path}: {str(e)}")
+        finally:
+            try:
+                # Stops ffmpeg when the track is closed early
+                blocks.close()
+            except Exception as e:
+                if not self._stop.is_set():
+                    self.error = self.error or str(e)
+            self._decoded.set()
+
+    def _load_peaks(self):
+        try:
+            get_peak_cache().get(self.path)
+        except Exception as e:
+            logger.info(f"No waveform peaks for {self.path}: {str(e)}")
+            return
+        if self._on_peaks is not None and not self._stop.is_set():
+            self._on_peaks(self.path)
+
+    @property
+    def duration(self):
+        peaks = get_peak_cache().cached(self.path)
+        return peaks.duration if peaks is not None else None
+
+    def read(self, size):
+        """Up to size bytes of whole frames that are already decoded; never waits for the decoder."""
+        chunks, length = [self._pending], len(self._pending)
+        while length < size:
+            try:
+                block = self._blocks.get_nowait()
+            except queue.Empty:
+                break
+            chunks.append(block)
+            length += len(block)
+        data = b''.join(chunks)
+        size = min(size, len(data))
+        size -= size % FRAME_BYTES
+        self._pending = data[size:]
+        return data[:size]
+
+    def unread(self, data):
+        self._pending = data + self._pending
+
+    @property
+    def exhausted(self):
+        return self._decoded.is_set() and self._blocks.empty() and not self._pending
+
+    def close(self):
+        self._stop.set()
+
+
+class PlaybackEngine(QObject):
+    """Plays a queue of files as one continuous stream; state() and stateChanged use QMediaPlayer's states.
+
+    positionChanged and durationChanged are in milliseconds of the track being heard, which
+    trackChanged announces as it starts. peaksReady names a prepared track whose peaks are now in
+    the shared peak cache.
+    """
+    positionChanged = pyqtSignal(int)
+    durationChanged = pyqtSignal(int)
+    stateChanged = pyqtSignal(int)
+    trackChanged = pyqtSignal(str)
+    peaksReady = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(SAMPLE_RATE)
+        audio_format.setChannelCount(CHANNELS)
+        audio_format.setSampleSize(16)
+        audio_format.setCodec("audio/pcm")
+        audio_format.setByteOrder(QAudioFormat.LittleEndian)
+        audio_format.setSampleType(QAudioFormat.SignedInt)
+        self.output = QAudioOutput(audio_format, self)
+        self.output.setBufferSize(int(OUTPUT_BUFFER_SECONDS * SAMPLE_RATE) * FRAME_BYTES)
+        self.device = None
+        # Paths to play after the current track; the first of them is prepared as self._next
+        self.queue = []
+        self.last_path = None
+        self._current = None
+        self._next = None
+        # (first frame in the output stream, track) for every track written since the stream started
+        self._timeline = []
+        self._heard = None
+        self._duration_sent = False
+        self._written = 0
+        self._state = QMediaPlayer.StoppedState
+        self.timer = QTimer(self)
+        self.timer.setInterval(FEED_INTERVAL_MS)
+        self.timer.timeout.connect(self._feed)
+
+    def state(self):
+        return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            self.stateChanged.emit(state)
+
+    def setVolume(self, volume):
+        self.output.setVolume(volume / 100)
+
+    def play_now(self, path, following=()):
+        """Play path at once, then the paths in following without gaps."""
+        if self._next is not None and self._next.path == path:
+            # Preloaded already: its decoder is open and its first seconds are buffered
+            track, self._next = self._next, None
+        else:
+            track = self._prepare(path)
+        self._close_all()
+        self.queue = list(following)
+        self._start(track)
+
+    def enqueue(self, path):
+        """Add path to the end of the queue, starting playback if nothing is playing."""
+        if self._current is None and self._state == QMediaPlayer.StoppedState:
+            self.play_now(path)
+            return
+        self.queue.append(path)
+        if self._current is None and self.device is not None:
+            # The last track is still draining from the output: carry straight on into this one
+            self._current = self._prepare(self.queue.pop(0))
+            self._timeline.append((self._written, self._current))
+        self._prepare_next()
+
+    def play(self):
+        if self._state == QMediaPlayer.PausedState:
+            self.output.resume()
+            self.timer.start()
+            self._set_state(QMediaPlayer.PlayingState)
+        elif self._state == QMediaPlayer.StoppedState and self.last_path:
+            self.play_now(self.last_path, self.queue)
+
+    def pause(self):
+        if self._state == QMediaPlayer.PlayingState:
+            self.output.suspend()
+            self.timer.stop()
+            self._set_state(QMediaPlayer.PausedState)
+
+    def stop(self):
+        self.timer.stop()
+        self.output.stop()
+        self.device = None
+        self._close_all()
+        self._set_state(QMediaPlayer.StoppedState)
+        self.positionChanged.emit(0)
+
+    def _close_all(self):
+        tracks = {id(track): track for _, track in self._timeline}
+        for track in (self._current, self._next):
+            if track is not None:
+                tracks[id(track)] = track
+        for track in tracks.values():
+            track.close()
+        self._current = self._next = self._heard = None
+        self._timeline = []
+
+    def _start(self, track):
+        self.output.stop()
+        self._current = track
+        self._timeline = [(0, track)]
+        self._written = 0
+        self.device = self.output.start()
+        self._prepare_next()
+        self._set_state(QMediaPlayer.PlayingState)
+        self.timer.start()
+        self._feed()
+
+    def _prepare(self, path):
+        # Emitted from the peaks thread; Qt queues it to the GUI thread
+        return PreparedTrack(path, on_peaks=self.peaksReady.emit)
+
+    def _prepare_next(self):
+        if self._next is None and self.queue and self._current is not None:
+            self._next = self._prepare(self.queue.pop(0))
+
+    def _advance(self):
+        """Carry on writing from the next track, as part of the same output stream."""
+        if self._current.error:
+            self.error.emit(f"Could not play {self._current.path}: {self._current.error}")
+        self._prepare_next()
+        self._current, self._next = self._next, None
+        if self._current is not None:
+            self._timeline.append((self._written, self._current))
+            self._prepare_next()
+
+    def _feed(self):
+        if self.device is None:
+            return
+        free = self.output.bytesFree()
+        while self._current is not None and free >= FRAME_BYTES * 64:
+            data = self._current.read(free)
+            if data:
+                written = max(0, self.device.write(data))
+                written -= written % FRAME_BYTES
+                if written < len(data):
+                    self._current.unread(data[written:])
+                self._written += written // FRAME_BYTES
+                free -= written
+                if not written:
+                    break
+            elif self._current.exhausted:
+                self._advance()
+            else:
+                # The decoder is behind; the output's buffer covers the wait
+                break
+        self._update_position()
+
+    def _update_position(self):
+        # processedUSecs counts what the audio system has taken from the output buffer since start()
+        played = int(self.output.processedUSecs() * SAMPLE_RATE / 1000000)
+        while len(self._timeline) > 1 and self._timeline[1][0] <= played:
+            self._timeline.pop(0)
+        if not self._timeline:
+            return
+        start, track = self._timeline[0]
+        if track is not self._heard:
+            self._heard = track
+            self._duration_sent = False
+            self.last_path = track.path
+            self.trackChanged.emit(track.path)
+        if not self._duration_sent and track.duration is not None:
+            self._duration_sent = True
+            self.durationChanged.emit(int(track.duration * 1000))
+        self.positionChanged.emit(int((played - start) * 1000 / SAMPLE_RATE))
+        if self._current is None and (played >= self._written or self.output.state() == QAudio.IdleState):
+            # Everything queued has been heard
+            self.stop()
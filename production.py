@@ -1,36 +1,59 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QPushButton, QHBoxLayout, QLineEdit, QApplication, QMessageBox, QSplitter, QSlider, QFrame, QListWidget
-from PyQt5.QtCore import pyqtSignal, Qt, QUrl, QTimer, QDir
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent, QMediaPlaylist, QAudio
-from PyQt5.QtMultimediaWidgets import QVideoWidget
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QPushButton, QHBoxLayout, QLineEdit, QMessageBox, QSplitter, QSlider, QFrame, QListWidget, QListWidgetItem, QComboBox, QCheckBox, QLabel
+from PyQt5.QtCore import pyqtSignal, Qt, QTimer, QDir, QPoint
+from PyQt5.QtMultimedia import QMediaPlayer
 from PyQt5.QtGui import QPainter, QColor, QPen, QIcon
 from waveform_widget import WaveformWidget
+from spectrogram_widget import SpectrogramWidget
+from playback_engine import PlaybackEngine
+from waveform_peaks import get_peak_cache
 import time
 import logging
 import os
 from openai import OpenAI
-import os
 from dotenv import load_dotenv
-from main import resource_path
+from prompt_registry import get_prompt_registry
+from generation_scheduler import get_scheduler, Job, Priority, UDIOPRO, LOCAL
+from qt_jobs import submit_job, submit_stage, submit_summary
+from udiopro_client import UdioProClient, UdioProError, UdioProTimeout
+from tracing import get_tracer, current_context, resume
+from song_stages import load_documents
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
+from song_response import SongResponseStream
+from extension_chain import ExtensionChain, journaled_fields
+from udiopro_journal import get_journal
+from udiopro_callbacks import get_callback_receiver
+from audio_stitch import AudioStitchError
+from audio_library import get_library
+from audio_analysis import schedule_analysis
 import requests
-from pydantic import BaseModel
-from typing import List
-import json
-from PyQt5.QtCore import QThread, pyqtSignal
+import sqlite3
+from PyQt5.QtCore import QObject, pyqtSignal
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Library rows loaded at once; more are loaded as the list is scrolled
+LIBRARY_PAGE = 200
+
 class ProductionTab(QWidget):
     production_updated = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
+        # Title of the song loaded in the main window, recorded with each generated track
+        self.song_title = None
         self.initUI()
         self.load_api_key()
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('production')
         self.check_udiopro_api_key()
-        self.playlist = QMediaPlaylist()
-        self.player.setPlaylist(self.playlist)
+        self.current_stream = None
+        self.request_span = None
+        self.song_stream = None
+        self.prefetch_job = None
+        self.resumed_workers = []
+        self.resume_udiopro_jobs()
 
     def check_udiopro_api_key(self):
         udiopro_api_key = os.getenv('UDIOPRO_API_KEY')
@@ -47,10 +70,9 @@ class ProductionTab(QWidget):
         left_layout = QVBoxLayout()
         self.left_widget.setLayout(left_layout)
 
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
+        self.chat_area = ChatView('production')
         self.chat_area.setStyleSheet("font-size: 14pt;")
-        self.chat_area.append("Hey there! I'm Nova, your production pro. Welcome to the Production Tab! Here you can work on the production aspects of your song. Start by describing your ideas for the sound, effects, or overall production style in the input field below.")
+        self.chat_area.greet("Hey there! I'm Nova, your production pro. Welcome to the Production Tab! Here you can work on the production aspects of your song. Start by describing your ideas for the sound, effects, or overall production style in the input field below.")
         left_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -59,14 +81,19 @@ class ProductionTab(QWidget):
         self.send_button = QPushButton("Send")
         self.send_button.setStyleSheet("font-size: 14pt;")
         self.send_button.clicked.connect(self.send_message)
+        self.stop_stream_button = QPushButton("Stop")
+        self.stop_stream_button.setStyleSheet("font-size: 14pt;")
+        self.stop_stream_button.setEnabled(False)
+        self.stop_stream_button.clicked.connect(self.stop_stream)
         input_layout.addWidget(self.input_field)
         input_layout.addWidget(self.send_button)
+        input_layout.addWidget(self.stop_stream_button)
 
         left_layout.addLayout(input_layout)
 
         self.result_area = QTextEdit()
         self.result_area.setStyleSheet("font-size: 14pt;")
-        self.result_area.textChanged.connect(self.save_production)
+        self.result_file = DocumentFile(self.result_area, 'production.md')
         left_layout.addWidget(self.result_area)
 
         # Right part
@@ -74,10 +101,43 @@ class ProductionTab(QWidget):
         right_layout = QVBoxLayout()
         self.right_widget.setLayout(right_layout)
 
+        # Library filter and sort
+        library_bar = QHBoxLayout()
+        self.library_search = QLineEdit()
+        self.library_search.setPlaceholderText("Filter by title, song, tags or prompt")
+        self.library_sort = QComboBox()
+        for label, sort, descending in LIBRARY_SORTS:
+            self.library_sort.addItem(label, (sort, descending))
+        self.hide_duplicates = QCheckBox("Hide duplicates")
+        self.hide_duplicates.setChecked(True)
+        library_bar.addWidget(self.library_search)
+        library_bar.addWidget(self.library_sort)
+        library_bar.addWidget(self.hide_duplicates)
+        right_layout.addLayout(library_bar)
+        self.duplicates_label = QLabel()
+        self.duplicates_label.hide()
+        right_layout.addWidget(self.duplicates_label)
+        self.library_timer = QTimer(self)
+        self.library_timer.setSingleShot(True)
+        self.library_timer.setInterval(200)
+        self.library_timer.timeout.connect(self.refresh_library)
+        self.library_search.textChanged.connect(self.library_timer.start)
+        self.library_sort.currentIndexChanged.connect(self.refresh_library)
+        self.hide_duplicates.toggled.connect(self.refresh_library)
+
         # Song list
         self.song_list = QListWidget()
         self.song_list.itemClicked.connect(self.play_selected_song)
         right_layout.addWidget(self.song_list)
+        # Peaks of the rows in view are loaded in the background, once scrolling settles
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(300)
+        self.prefetch_timer.timeout.connect(self.prefetch_visible_peaks)
+        self.song_list.verticalScrollBar().valueChanged.connect(lambda value: self.prefetch_timer.start())
+        # Rows are loaded a page at a time, the next page once the list is scrolled near its end
+        self.library_more = False
+        self.song_list.verticalScrollBar().valueChanged.connect(self.on_song_list_scrolled)
 
         # Player frame
         player_frame = QFrame()
@@ -85,15 +145,18 @@ class ProductionTab(QWidget):
         player_layout = QVBoxLayout()
         player_frame.setLayout(player_layout)
 
-        self.player = QMediaPlayer()
-        self.video_widget = QVideoWidget()
-        self.player.setVideoOutput(self.video_widget)
-        player_layout.addWidget(self.video_widget)
+        self.player = PlaybackEngine(self)
+        self.player.error.connect(self.handle_player_error)
 
         # Waveform widget
         self.waveform_widget = WaveformWidget()
         player_layout.addWidget(self.waveform_widget)
-        self.player.mediaChanged.connect(self.load_waveform)
+        self.spectrogram_widget = SpectrogramWidget()
+        self.spectrogram_widget.hide()
+        player_layout.addWidget(self.spectrogram_widget)
+        self.current_audio_path = None
+        self.player.trackChanged.connect(self.load_track_view)
+        self.player.peaksReady.connect(self.waveform_widget.peaks_ready)
 
         # Audio controls
         controls_layout = QHBoxLayout()
@@ -104,10 +167,13 @@ class ProductionTab(QWidget):
         self.volume_slider = QSlider(Qt.Horizontal)
         self.volume_slider.setRange(0, 100)
         self.volume_slider.setValue(50)
+        self.spectrogram_button = QPushButton("Spectrogram")
+        self.spectrogram_button.setCheckable(True)
 
         controls_layout.addWidget(self.play_pause_button)
         controls_layout.addWidget(self.stop_button)
         controls_layout.addWidget(self.volume_slider)
+        controls_layout.addWidget(self.spectrogram_button)
 
         player_layout.addLayout(controls_layout)
 
@@ -117,6 +183,7 @@ class ProductionTab(QWidget):
         self.play_pause_button.clicked.connect(self.toggle_play_pause)
         self.stop_button.clicked.connect(self.player.stop)
         self.volume_slider.valueChanged.connect(self.set_volume)
+        self.spectrogram_button.toggled.connect(self.toggle_spectrogram)
 
         # Connect player state changed signal
         self.player.stateChanged.connect(self.update_play_pause_button)
@@ -124,6 +191,8 @@ class ProductionTab(QWidget):
         # Connect player signals for waveform update
         self.player.positionChanged.connect(self.waveform_widget.update_position)
         self.player.durationChanged.connect(self.waveform_widget.set_duration)
+        self.player.positionChanged.connect(self.spectrogram_widget.update_position)
+        self.player.durationChanged.connect(self.spectrogram_widget.set_duration)
 
         # Load existing songs
         self.load_existing_songs()
@@ -136,10 +205,6 @@ class ProductionTab(QWidget):
 
         self.main_layout.addWidget(splitter)
 
-    def save_production(self):
-        with open('production.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -155,19 +220,6 @@ class ProductionTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            production_prompt = self.read_file(resource_path('prompts/production.md'))
-            concept_content = self.read_file(resource_path('concept.md'))
-            lyrics_content = self.read_file(resource_path('lyrics.md'))
-            composition_content = self.read_file(resource_path('composition.md'))
-            visual_design_content = self.read_file(resource_path('visual_design.md'))
-            
-            self.system_prompt = f"{production_prompt}\n\nContext from concept.md:\n{concept_content}\n\nContext from lyrics.md:\n{lyrics_content}\n\nContext from composition.md:\n{composition_content}\n\nContext from visual_design.md:\n{visual_design_content}"
-        except Exception as e:
-            self.system_prompt = "You are a creative assistant to help with music production."
-            self.chat_area.append(f"Warning: Error loading prompts: {str(e)}. Using a default prompt.")
-
     def read_file(self, filepath):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
@@ -175,19 +227,10 @@ class ProductionTab(QWidget):
         except FileNotFoundError:
             return f"File {filepath} not found."
 
-    class SongResponse(BaseModel):
-        short_prompt: str
-        extend_prompts: List[str]
-        outro_prompt: str
-        num_extensions: int
-        custom_lyrics_short: str
-        custom_lyrics_extend: List[str]
-        custom_lyrics_outro: str
-
     def send_message(self):
-        # Update the system prompt with the latest content
-        self.load_system_prompt()
-        
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
+
         user_message = self.input_field.text()
         if not user_message:
             self.chat_area.append("Error: Empty input. Please enter a prompt.")
@@ -202,50 +245,110 @@ class ProductionTab(QWidget):
 
         try:
             # Read content from relevant files
-            concept_content = self.read_file(resource_path('concept.md'))
-            lyrics_content = self.read_file(resource_path('lyrics.md'))
-            composition_content = self.read_file(resource_path('composition.md'))
-            visual_design_content = self.read_file(resource_path('visual_design.md'))
-
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "system", "content": f"Concept:\n{concept_content}"},
-                    {"role": "system", "content": f"Lyrics:\n{lyrics_content}"},
-                    {"role": "system", "content": f"Composition:\n{composition_content}"},
-                    {"role": "system", "content": f"Visual Design:\n{visual_design_content}"},
-                    {"role": "user", "content": f"Generate a JSON response for the following request: {user_message}"}
-                ],
-                response_format={"type": "json_object"},
-                stream=True
-            )
-            
-            gpt_response = ""
+            documents = load_documents()
+
             self.chat_area.append("Assistant : ")
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    gpt_response += chunk.choices[0].delta.content
-                    self.chat_area.append(chunk.choices[0].delta.content)
-                    QApplication.processEvents()  # Update the UI
-            
-            # Parse the JSON response
-            import json
-            parsed_response = json.loads(gpt_response)
-            
-            self.update_production(gpt_response)
+            self.send_button.setEnabled(False)
+            self.stop_stream_button.setEnabled(True)
+            self.start_song_info()
+            # Spans the stage and the UdioPro job it starts mid-stream, which begins before the stage ends
+            self.request_span = get_tracer().start_span('production_request', message=user_message)
+            with resume(self.request_span.context):
+                self.current_stream = submit_stage(
+                    self, 'production', self.client, self.prompts, documents, user_message,
+                    on_chunk=self.on_stream_chunk,
+                    on_done=self.on_stream_done,
+                    on_error=self.on_stream_error,
+                    on_cancel=self.on_stream_cancelled,
+                    history=self.memory.messages()
+                )
+        except Exception as e:
+            self.on_stream_error(str(e))
+
+    def on_stream_chunk(self, content):
+        self.chat_area.insertPlainText(content)
+        self.song_stream.feed(content)
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_stream_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        try:
+            song_info = self.song_stream.finish(result.text)
             self.chat_area.append("Debug: Displaying song information (no audio generation)")
             logging.info("Displaying song information in production tab (no audio generation)")
-            self.display_song_info(parsed_response)
-            
+            if self.song_stream.prompts_ready:
+                self.result_area.append("Debug: Finished displaying song information")
+            else:
+                # Nothing usable arrived while streaming; show and submit the complete reply instead
+                with resume(self.request_span.context):
+                    self.display_song_info(song_info.model_dump())
+            if self.receivers(self.production_updated):
+                self.production_updated.emit(self.result_area.toPlainText())
         except Exception as e:
-            self.chat_area.append(f"Error sending message: {str(e)}")
-
-    def update_production(self, new_content):
-        current_content = self.result_area.toPlainText()
-        updated_content = current_content + "\n\n" + new_content
-        self.result_area.setPlainText(updated_content)
-        self.production_updated.emit(updated_content)
+            self.on_stream_error(str(e))
+        self.finish_request()
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_stream_button.setEnabled(False)
+        self.chat_area.append(f"Error sending message: {error}")
+        if self.song_stream is not None:
+            # A chain already running stops at the first field that never arrived
+            self.song_stream.close()
+        self.finish_request('error')
+
+    def stop_stream(self):
+        if self.current_stream is not None and not self.current_stream.finished:
+            self.current_stream.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_stream_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+        if self.song_stream is not None:
+            self.song_stream.close()
+        self.finish_request('cancelled')
+
+    def finish_request(self, status=None):
+        if self.request_span is not None:
+            get_tracer().finish(self.request_span, status)
+            self.request_span = None
+
+    def start_song_info(self):
+        self.result_area.clear()
+        self.result_area.append("Song Information (Conceptual Only):")
+        self.result_area.append("Note: This is a conceptual representation. No audio is generated.")
+        self.result_area.append("Debug: Starting to display song information")
+        self.song_stream = SongResponseStream(on_field=self.show_song_field, on_prompts=self.on_song_prompts)
+
+    def show_song_field(self, name, value):
+        # Each field is shown the moment it closes in the stream
+        if name == 'short_prompt':
+            self.result_area.append(f"Short Prompt: {value}")
+        elif name == 'num_extensions':
+            self.result_area.append(f"Number of Extensions: {value}")
+        elif name == 'outro_prompt':
+            self.result_area.append(f"Outro Prompt: {value}")
+        elif name == 'extend_prompts':
+            self.result_area.append("\nExtend Prompts:")
+            for i, prompt in enumerate(value, 1):
+                self.result_area.append(f"{i}. {prompt}")
+        elif name == 'custom_lyrics_short':
+            self.result_area.append(f"\nCustom Lyrics (short): {value}")
+        elif name == 'custom_lyrics_extend':
+            self.result_area.append("\nCustom Lyrics (extended):")
+            for i, lyric in enumerate(value, 1):
+                self.result_area.append(f"{i}. {lyric}")
+        elif name == 'custom_lyrics_outro':
+            self.result_area.append(f"\nCustom Lyrics (outro): {value}")
+
+    def on_song_prompts(self, song_info):
+        # The first clip only needs its own fields; the chain waits for the rest as it reaches them
+        logging.info("First clip's fields complete; starting UdioPro before the stream ends")
+        with resume(self.request_span.context if self.request_span is not None else None):
+            self.call_udiopro_api(self.song_stream.wait)
 
     def display_song_info(self, song_info):
         self.result_area.clear()
@@ -268,172 +371,98 @@ class ProductionTab(QWidget):
         logging.info("Song information displayed in the production tab")
         
         # Call UdioPro API
-        self.call_udiopro_api(song_info)
+        self.call_udiopro_api(lambda name, should_stop=None: song_info[name])
 
-    def call_udiopro_api(self, song_info):
+    def call_udiopro_api(self, field):
         self.result_area.append("\nDebug: Calling UdioPro API")
         logging.info("Calling UdioPro API")
 
-        # Construct the prompt for UdioPro
-        prompt = f"{song_info['short_prompt']} "
-        prompt += " ".join(song_info['extend_prompts'])
-        prompt += f" {song_info['outro_prompt']}"
-
         if not os.getenv('UDIOPRO_API_KEY'):
             error_msg = "Error: UdioPro API key not found. Please check your .env file."
             self.result_area.append(error_msg)
             logging.error(error_msg)
             return
 
-        self.worker = UdioProWorker(prompt, os.getenv('UDIOPRO_API_KEY'))
-        self.worker.result_ready.connect(self.display_udiopro_result)
+        self.worker = UdioProWorker(field, os.getenv('UDIOPRO_API_KEY'), song_title=self.song_title)
+        self.worker.segment_ready.connect(self.display_udiopro_result)
+        self.worker.result_ready.connect(self.play_generated_song)
+        self.worker.result_ready.connect(self.refresh_library)
+        self.worker.result_ready.connect(self.analyze_library)
         self.worker.error_occurred.connect(self.handle_udiopro_error)
         self.worker.start()
 
         self.result_area.append("\nNote: UdioPro API call initiated. Please wait for the result.")
         logging.info("UdioPro API call initiated")
 
+    def resume_udiopro_jobs(self):
+        # Chains still running when the app last closed keep generating remotely; pick them up without resubmitting
+        journal = get_journal()
+        if journal is None or not os.getenv('UDIOPRO_API_KEY'):
+            return
+        for chain in journal.unfinished_chains():
+            self.result_area.append(f"\nResuming UdioPro generation of {chain['title']} from the job journal")
+            logging.info(f"Resuming UdioPro chain {chain['id']} ({chain['title']})")
+            worker = UdioProWorker(journaled_fields, os.getenv('UDIOPRO_API_KEY'), Priority.BACKGROUND,
+                                   chain_id=chain['id'], song_title=chain['song_title'])
+            worker.segment_ready.connect(self.display_udiopro_result)
+            worker.result_ready.connect(self.play_generated_song)
+            worker.result_ready.connect(self.refresh_library)
+            worker.result_ready.connect(self.analyze_library)
+            worker.error_occurred.connect(self.handle_udiopro_error)
+            worker.start()
+            self.resumed_workers.append(worker)
+
     def handle_udiopro_error(self, error_message):
         error_msg = f"Error in UdioPro API call: {error_message}"
         self.result_area.append(error_msg)
         logging.error(error_msg)
         QMessageBox.warning(self, "UdioPro API Error", error_msg)
 
-    def fetch_udiopro_result(self, work_id):
-        self.result_area.append("\nDebug: Fetching result from UdioPro API")
-        logging.info("Fetching result from UdioPro API")
-
-        url = f"https://udioapi.pro/api/feed"
-        params = {
-            "workId": work_id
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {os.getenv('UDIOPRO_API_KEY')}"
-        }
-
-        max_attempts = 30
-        attempt = 0
-
-        while attempt < max_attempts:
-            try:
-                response = requests.get(url, params=params, headers=headers)
-                response.raise_for_status()
-                result = response.json()
-
-                if result['type'] == 'complete':
-                    self.display_udiopro_result(result)
-                    break
-                elif result['type'] in ['new', 'text', 'first']:
-                    self.result_area.append(f"Debug: UdioPro generation in progress. Status: {result['type']}")
-                    time.sleep(10)  # Wait for 10 seconds before next attempt
-                else:
-                    self.result_area.append(f"Debug: Unexpected result type: {result['type']}")
-                    break
-
-            except requests.RequestException as e:
-                self.result_area.append(f"Error fetching UdioPro result: {str(e)}")
-                logging.error(f"Error fetching UdioPro result: {str(e)}")
-                break
-
-            attempt += 1
-
-        if attempt == max_attempts:
-            self.result_area.append("Error: Maximum attempts reached while fetching UdioPro result")
-            logging.error("Maximum attempts reached while fetching UdioPro result")
-
-    def download_and_play_audio(self, audio_url, song_title):
+    def play_generated_song(self, filename):
         try:
-            response = requests.get(audio_url)
-            response.raise_for_status()
-
-            # Create a 'generated_songs' directory if it doesn't exist
-            os.makedirs('generated_songs', exist_ok=True)
-
-            # Generate a filename based on the song title
-            filename = os.path.join('generated_songs', f"{song_title.replace(' ', '_')}_{int(time.time())}.mp3")
-
-            # Save the audio file
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-
-            # Add the audio to the playlist
-            self.playlist.addMedia(QMediaContent(QUrl.fromLocalFile(filename)))
-
-            # If this is the first song, start playing
-            if self.playlist.mediaCount() == 1:
-                self.player.setPlaylist(self.playlist)
-                self.player.play()
+            # Plays at once if nothing is playing; otherwise it is queued and decoded ahead of its turn
+            self.player.enqueue(filename)
 
             self.result_area.append(f"Audio saved and added to playlist: {filename}")
             logging.info(f"Audio saved and added to playlist: {filename}")
             
-            # Load the waveform
-            self.waveform_widget.load_audio(filename)
-            
             # Open the folder containing the saved file
             os.startfile(os.path.dirname(filename))
         except Exception as e:
-            self.result_area.append(f"Error downloading audio: {str(e)}")
-            logging.error(f"Error downloading audio: {str(e)}")
-
-    def load_waveform(self, media):
-        if media.isNull():
-            return
-        file_path = media.canonicalUrl().toLocalFile()
-        if file_path and os.path.exists(file_path):
-            self.waveform_widget.load_audio(file_path)
-        else:
-            logging.warning(f"Audio file not found or path is empty: {file_path}")
-
-    def display_udiopro_result(self, result):
-        self.result_area.append("\nUdioPro Generation Result:")
-        self.result_area.append(f"Type: {result['type']}")
-        self.result_area.append(f"Created at: {result['created_at']}")
-        
-        for song in result['response_data']:
-            self.result_area.append(f"\nTitle: {song['title']}")
-            self.result_area.append(f"Audio URL: {song['audio_url']}")
-            self.result_area.append(f"Image URL: {song['image_url']}")
-            self.result_area.append(f"Duration: {song['duration']} seconds")
-            self.result_area.append(f"Tags: {song['tags']}")
-            self.result_area.append(f"Prompt: {song['prompt']}")
-            self.result_area.append(f"Model: {song['model_name']}")
-            self.result_area.append(f"Creation Time: {song['createTime']}")
-            
-            # Download and play the audio
-            self.download_and_play_audio(song['audio_url'], song['title'])
-
-        self.result_area.append("\nDebug: UdioPro result displayed")
-        logging.info("UdioPro result displayed")
-
-    def handle_player_error(self, error):
-        error_msg = f"Media player error: {error}"
-        if error == QMediaPlayer.FormatError:
-            error_msg += " (Format Error: The media format is not supported.)"
-        elif error == QMediaPlayer.NetworkError:
-            error_msg += " (Network Error: A network error occurred.)"
-        elif error == QMediaPlayer.AccessDeniedError:
-            error_msg += " (Access Denied Error: There was a permissions issue.)"
-        elif error == QMediaPlayer.ServiceMissingError:
-            error_msg += " (Service Missing Error: A required media service is missing.)"
-        elif error == QMediaPlayer.ResourceError:
-            error_msg += " (Resource Error: The media resource could not be resolved.)"
-        else:
-            error_msg += f" (Error code: {error})"
-        
-        self.chat_area.append(error_msg)
-        logger.error(error_msg)
-
-        # Try to get more information about the media
-        media_status = self.player.mediaStatus()
-        self.chat_area.append(f"Media status: {media_status}")
-        logger.info(f"Media status: {media_status}")
-
-        # Check supported audio formats
-        supported_formats = QMediaPlayer.supportedMimeTypes()
-        self.chat_area.append(f"Supported audio formats: {', '.join(supported_formats)}")
-        logger.info(f"Supported audio formats: {', '.join(supported_formats)}")
+            self.result_area.append(f"Error playing audio: {str(e)}")
+            logging.error(f"Error playing audio: {str(e)}")
+
+    def load_track_view(self, file_path):
+        self.current_audio_path = file_path
+        # Peaks the engine already built show at once; otherwise the widget waits for them off the GUI thread
+        self.waveform_widget.load_audio(file_path)
+        # The spectrogram is only computed while it is shown
+        if self.spectrogram_button.isChecked():
+            self.spectrogram_widget.load_audio(file_path)
+
+    def toggle_spectrogram(self, checked):
+        self.waveform_widget.setVisible(not checked)
+        self.spectrogram_widget.setVisible(checked)
+        if checked and self.current_audio_path:
+            self.spectrogram_widget.load_audio(self.current_audio_path)
+
+    def display_udiopro_result(self, segment):
+        # One call per clip in the chain, as soon as it completes; the stitched song follows at the end
+        clip = segment['clip']
+        self.result_area.append(f"\nUdioPro Segment {segment['index'] + 1} ({segment['kind']}):")
+        self.result_area.append(f"Title: {clip['title']}")
+        self.result_area.append(f"Audio URL: {clip['audio_url']}")
+        self.result_area.append(f"Image URL: {clip['image_url']}")
+        self.result_area.append(f"Duration: {clip['duration']} seconds")
+        self.result_area.append(f"Tags: {clip['tags']}")
+        self.result_area.append(f"Prompt: {clip['prompt']}")
+        self.result_area.append(f"Model: {clip['model_name']}")
+        self.result_area.append(f"Creation Time: {clip['createTime']}")
+        logging.info(f"UdioPro segment {segment['index'] + 1} ({segment['kind']}) displayed")
+
+    def handle_player_error(self, message):
+        self.chat_area.append(f"Media player error: {message}")
+        logger.error(f"Media player error: {message}")
 
     def handle_user_prompt(self):
         user_prompt = self.input_field.text()
@@ -460,88 +489,183 @@ class ProductionTab(QWidget):
             self.play_pause_button.setIcon(QIcon("play_icon.png"))
 
     def load_existing_songs(self):
-        generated_songs_dir = QDir("generated_songs")
-        if generated_songs_dir.exists():
-            song_files = generated_songs_dir.entryList(["*.mp3"], QDir.Files)
-            for song_file in song_files:
-                self.song_list.addItem(song_file)
+        library = get_library()
+        if library is None:
+            generated_songs_dir = QDir("generated_songs")
+            if generated_songs_dir.exists():
+                song_files = generated_songs_dir.entryList(["*.mp3", "*.wav"], QDir.Files)
+                for song_file in song_files:
+                    item = QListWidgetItem(song_file)
+                    item.setData(Qt.UserRole, os.path.join("generated_songs", song_file))
+                    self.song_list.addItem(item)
+            return
+        # The catalog lists at once; files added outside the app are cataloged in the background
+        self.refresh_library()
+        submit_job(self, LOCAL, lambda job, emit_chunk: library.sync(), on_done=self.on_library_synced,
+                   priority=Priority.BACKGROUND, label='library_sync')
+
+    def on_library_synced(self, counts):
+        self.refresh_library()
+        self.analyze_library()
+
+    def analyze_library(self):
+        library = get_library()
+        if library is not None:
+            # Results show up as they land; the timer batches refreshes while a long backlog is analyzed
+            schedule_analysis(self, library, on_progress=lambda done: self.library_timer.start())
+
+    def refresh_library(self):
+        library = get_library()
+        if library is None:
+            return
+        # As many rows as were loaded come back, so a refresh keeps the place of someone scrolled down
+        scrollbar = self.song_list.verticalScrollBar()
+        position, shown = scrollbar.value(), self.song_list.count()
+        self.library_more = False
+        self.song_list.clear()
+        self.load_library_page(library, max(shown, LIBRARY_PAGE))
+        scrollbar.setValue(position)
+        summary = library.duplicate_summary()
+        if summary['groups']:
+            self.duplicates_label.setText(f"{summary['duplicates']} duplicate tracks of {summary['groups']} songs; "
+                                          f"deleting them would free {summary['reclaimable'] / (1024 * 1024):.1f} MB")
+        self.duplicates_label.setVisible(bool(summary['groups']))
+        self.prefetch_timer.start()
+
+    def load_library_page(self, library, count=LIBRARY_PAGE):
+        sort, descending = self.library_sort.currentData()
+        tracks = library.query(search=self.library_search.text().strip() or None, sort=sort, descending=descending,
+                               collapse_duplicates=self.hide_duplicates.isChecked(), limit=count,
+                               offset=self.song_list.count())
+        for track in tracks:
+            self.song_list.addItem(library_item(track))
+        self.library_more = len(tracks) == count
+
+    def on_song_list_scrolled(self, value):
+        scrollbar = self.song_list.verticalScrollBar()
+        library = get_library()
+        if self.library_more and library is not None and value >= scrollbar.maximum() - scrollbar.pageStep():
+            self.load_library_page(library)
 
     def play_selected_song(self, item):
-        song_path = os.path.join("generated_songs", item.text())
-        self.player.setMedia(QMediaContent(QUrl.fromLocalFile(QDir.toNativeSeparators(song_path))))
-        self.player.play()
-
-class UdioProWorker(QThread):
-    result_ready = pyqtSignal(dict)
+        # The rows below play on without gaps, so a batch of takes can be auditioned in one go
+        row = self.song_list.row(item)
+        following = [self.song_list.item(i).data(Qt.UserRole) for i in range(row + 1, self.song_list.count())]
+        self.player.play_now(item.data(Qt.UserRole), following)
+
+    def visible_song_paths(self):
+        viewport = self.song_list.viewport()
+        first = self.song_list.indexAt(QPoint(0, 0)).row()
+        last = self.song_list.indexAt(QPoint(0, viewport.height() - 1)).row()
+        if first < 0:
+            return []
+        if last < 0:
+            last = self.song_list.count() - 1
+        return [self.song_list.item(i).data(Qt.UserRole) for i in range(first, last + 1)]
+
+    def prefetch_visible_peaks(self):
+        if self.prefetch_job is not None and not self.prefetch_job.finished:
+            self.prefetch_job.cancel()
+        paths = self.visible_song_paths()
+        if paths:
+            self.prefetch_job = submit_job(
+                self, LOCAL, lambda job, emit_chunk: get_peak_cache().prefetch(paths, should_stop=job.check_cancelled),
+                priority=Priority.BACKGROUND, label='peak_prefetch')
+
+
+LIBRARY_SORTS = [
+    ("Newest", 'created', True),
+    ("Oldest", 'created', False),
+    ("Title", 'title', False),
+    ("Song", 'song', False),
+    ("Longest", 'duration', True),
+    ("Loudest", 'loudness', True),
+    ("Quietest", 'loudness', False),
+    ("Fastest", 'tempo', True),
+    ("Slowest", 'tempo', False),
+    ("Key", 'key', False),
+]
+
+
+def library_item(track):
+    duration = track['duration']
+    length = f"{int(duration // 60)}:{int(duration % 60):02d}" if duration else "?:??"
+    created = time.strftime('%Y-%m-%d %H:%M', time.localtime(track['created_at']))
+    song = f" ({track['song_title']})" if track['song_title'] else ""
+    analysis = ""
+    if track['tempo'] is not None:
+        analysis += f"  {track['tempo']:.0f} BPM"
+    if track['key']:
+        analysis += f"  {track['key']}"
+    if track['loudness'] is not None:
+        analysis += f"  {track['loudness']:.1f} LUFS"
+    duplicate = f"  (duplicate, {track['similarity']:.0%} similar)" if track['duplicate_of'] else ""
+    item = QListWidgetItem(f"{track['title']}{song}  {length}  {created}{analysis}{duplicate}")
+    item.setData(Qt.UserRole, track['path'])
+    item.setToolTip(f"Tags: {track['tags']}\nModel: {track['model_name']}\nPrompt: {track['prompt']}")
+    return item
+
+
+class UdioProWorker(QObject):
+    segment_ready = pyqtSignal(dict)
+    result_ready = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, prompt, api_key):
+    def __init__(self, field, api_key, priority=Priority.NORMAL, chain_id=None, song_title=None):
         super().__init__()
-        self.prompt = prompt
+        self.field = field
+        self.chain_id = chain_id
+        self.song_title = song_title
         self.api_key = api_key
+        self.priority = priority
+        self.job = None
+        self.trace = None
 
-    def run(self):
-        try:
-            url = "https://udioapi.pro/api/generate"
-            headers = {
-                "Content-Type": "application/json"
-            }
-            data = {
-                "prompt": self.prompt,
-                "title": "Generated Song",
-                "custom_mode": False,
-                "make_instrumental": False,
-                "model": "chirp-v3.5",
-                "disable_callback": True,
-                "token": self.api_key
-            }
-
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            response_json = response.json()
-
-            work_id = response_json.get('workId')
-            if work_id:
-                self.fetch_result(work_id)
-            else:
-                self.error_occurred.emit(f"Failed to get Work ID from UdioPro API. Response: {response_json}")
-
-        except requests.RequestException as e:
-            self.error_occurred.emit(f"Error calling UdioPro API: {str(e)}")
+    def start(self):
+        self.job = get_scheduler().submit(UDIOPRO, self.run, self.priority, label='udiopro')
+        self.job.add_done_callback(self.on_job_finished)
 
-    def fetch_result(self, work_id):
-        url = f"https://udioapi.pro/api/feed"
-        params = {
-            "workId": work_id
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
 
-        max_attempts = 30
-        attempt = 0
+    def on_job_finished(self, job):
+        if job.state == Job.FAILED:
+            self.error_occurred.emit(f"Error calling UdioPro API: {str(job.error)}")
 
-        while attempt < max_attempts:
-            try:
-                response = requests.get(url, params=params, headers=headers)
-                response.raise_for_status()
-                result = response.json()
-
-                if result['type'] == 'complete':
-                    self.result_ready.emit(result)
-                    break
-                elif result['type'] in ['new', 'text', 'first']:
-                    time.sleep(10)  # Wait for 10 seconds before next attempt
-                else:
-                    self.error_occurred.emit(f"Unexpected result type: {result['type']}")
-                    break
-
-            except requests.RequestException as e:
-                self.error_occurred.emit(f"Error fetching UdioPro result: {str(e)}")
-                break
-
-            attempt += 1
-
-        if attempt == max_attempts:
-            self.error_occurred.emit("Maximum attempts reached while fetching UdioPro result")
+    def catalog(self, chain, path):
+        library = get_library()
+        if library is None:
+            return
+        try:
+            library.add(path, song_title=chain.song_title, chain_id=chain.chain_id, clip=chain.segments[0].clip,
+                        song_response=chain.fields)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Could not add {path} to the audio library: {str(e)}")
+
+    def on_segment(self, segment):
+        self.segment_ready.emit({'kind': segment.kind, 'index': segment.index, 'clip': segment.clip})
+
+    def run(self, job):
+        client = UdioProClient(self.api_key, callbacks=get_callback_receiver())
+        chain = ExtensionChain(client, self.field, title=self.song_title or "Generated Song",
+                               on_segment=self.on_segment, journal=get_journal(), chain_id=self.chain_id,
+                               song_title=self.song_title)
+        try:
+            self.trace = current_context()
+            path = chain.run(job)
+            self.catalog(chain, path)
+            self.result_ready.emit(path)
+        except requests.RequestException as e:
+            self.error_occurred.emit(f"Error calling UdioPro API: {str(e)}")
+        except UdioProTimeout as e:
+            if chain.abandoned:
+                self.error_occurred.emit(f"{str(e)}; giving up after repeated attempts")
+            else:
+                self.error_occurred.emit(f"{str(e)}; the generation resumes from the job journal on the next start")
+        except UdioProError as e:
+            self.error_occurred.emit(str(e))
+        except ValueError as e:
+            self.error_occurred.emit(f"Cannot continue the UdioPro chain: {str(e)}")
+        except (AudioStitchError, OSError) as e:
+            self.error_occurred.emit(f"Error stitching UdioPro segments: {str(e)}")
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import logging
+from dataclasses import dataclass
+from PyQt5.QtCore import QObject, QFileSystemWatcher, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = 'prompts'
+
+DEFAULT_PROMPTS = {
+    'concept': "You are a creative assistant to help develop song concepts.",
+    'lyrics': "You are a creative assistant to help write song lyrics.",
+    'composition': "You are a creative assistant to help compose music.",
+    'production': "You are a creative assistant to help with music production.",
+    'visual_design': "You are a creative assistant to help develop visual designs for songs.",
+    'critique': "You are a music critic providing feedback on songs.",
+    'concert': "You are an AI assistant helping with concert simulations.",
+    'management': "You are a helpful assistant for band management.",
+    'summary': "Summarize the conversation so far for your own later reference.",
+}
+
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+@dataclass(frozen=True)
+class Prompt:
+    name: str
+    text: str
+    path: str
+    version: int
+    loaded_at: float
+    is_default: bool = False
+
+    def __str__(self):
+        return self.text
+
+
+class PromptRegistry(QObject):
+    """Keeps every prompt template in memory and reloads a template only when its file changes."""
+    prompt_reloaded = pyqtSignal(str)
+
+    def __init__(self, prompts_dir=None, parent=None):
+        super().__init__(parent)
+        self.prompts_dir = prompts_dir or resource_path(PROMPTS_DIR)
+        self._prompts = {}
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.load_all()
+
+    def load_all(self):
+        names = set(DEFAULT_PROMPTS)
+        if os.path.isdir(self.prompts_dir):
+            self.watcher.addPath(self.prompts_dir)
+            names.update(os.path.splitext(f)[0] for f in os.listdir(self.prompts_dir) if f.endswith('.md'))
+        for name in sorted(names):
+            self.load(name)
+
+    def path_for(self, name):
+        return os.path.join(self.prompts_dir, f"{name}.md")
+
+    def load(self, name):
+        path = self.path_for(name)
+        previous = self._prompts.get(name)
+        version = previous.version + 1 if previous else 1
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+            prompt = Prompt(name, text, path, version, time.time())
+            if path not in self.watcher.files():
+                self.watcher.addPath(path)
+        except FileNotFoundError:
+            logger.warning(f"Prompt file not found: {path}. Using default prompt.")
+            prompt = Prompt(name, DEFAULT_PROMPTS.get(name, ""), path, version, time.time(), is_default=True)
+        self._prompts[name] = prompt
+        return prompt
+
+    def get(self, name):
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            prompt = Prompt(name, DEFAULT_PROMPTS.get(name, ""), self.path_for(name), 0, time.time(), is_default=True)
+        return prompt
+
+    def text(self, name):
+        return self.get(name).text
+
+    def names(self):
+        return sorted(self._prompts)
+
+    def on_file_changed(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        # Editors often replace the file instead of writing in place, which drops the watch
+        if os.path.exists(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+        self.load(name)
+        logger.info(f"Prompt reloaded: {name}")
+        self.prompt_reloaded.emit(name)
+
+    def on_directory_changed(self, path):
+        for file_name in os.listdir(path):
+            if not file_name.endswith('.md'):
+                continue
+            name = os.path.splitext(file_name)[0]
+            prompt = self._prompts.get(name)
+            if prompt is None or prompt.is_default:
+                self.load(name)
+                self.prompt_reloaded.emit(name)
+
+
+_registry = None
+
+
+def get_prompt_registry():
+    global _registry
+    if _registry is None:
+        _registry = PromptRegistry()
+    return _registry
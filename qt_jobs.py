@@ -0,0 +1,100 @@
+import logging
+from PyQt5.QtCore import QObject, pyqtSignal
+from generation_scheduler import get_scheduler, Job, Priority, OPENAI_CHAT
+from rate_limiter import RateLimitedClient
+from song_stages import run_stage
+from telemetry import request_context
+from conversation_memory import summarize_turns
+
+logger = logging.getLogger(__name__)
+
+
+class JobRelay(QObject):
+    """Carries a scheduler job's output from its worker thread back to the GUI thread."""
+    chunk = pyqtSignal(str)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+def submit_job(parent, provider, fn, on_done=None, on_error=None, on_chunk=None,
+               priority=Priority.NORMAL, label='', on_cancel=None):
+    """Run fn(job, emit_chunk) on the scheduler and deliver callbacks on the GUI thread."""
+    relay = JobRelay(parent)
+    if on_chunk:
+        relay.chunk.connect(on_chunk)
+    if on_done:
+        relay.done.connect(on_done)
+    if on_error:
+        relay.failed.connect(on_error)
+    if on_cancel:
+        relay.cancelled.connect(on_cancel)
+    for signal in (relay.done, relay.failed, relay.cancelled):
+        signal.connect(relay.deleteLater)
+
+    tab = type(parent).__name__ if parent is not None else ''
+
+    def run(job):
+        with request_context(tab=tab):
+            return fn(job, relay.chunk.emit)
+
+    def finished(job):
+        if job.state == Job.DONE:
+            relay.done.emit(job.result)
+        elif job.state == Job.FAILED:
+            relay.failed.emit(str(job.error))
+        else:
+            relay.cancelled.emit()
+
+    job = get_scheduler().submit(provider, run, priority, label)
+    job.add_done_callback(finished)
+    return job
+
+
+def stream_chat(client, messages, job, emit_chunk, model="gpt-4o-mini", **create_kwargs):
+    return RateLimitedClient(client, sleep=job.sleep).stream_chat(
+        messages, emit_chunk, model=model, should_stop=job.check_cancelled, **create_kwargs
+    )
+
+
+def submit_chat_stream(parent, client, messages, on_chunk, on_done, on_error,
+                       priority=Priority.INTERACTIVE, label='', on_cancel=None, **create_kwargs):
+    def run(job, emit_chunk):
+        return stream_chat(client, messages, job, emit_chunk, **create_kwargs)
+
+    return submit_job(parent, OPENAI_CHAT, run, on_done=on_done, on_error=on_error, on_chunk=on_chunk,
+                      priority=priority, label=label, on_cancel=on_cancel)
+
+
+def submit_stage(parent, stage, client, prompts, documents, user_message, on_chunk, on_done, on_error,
+                 priority=Priority.INTERACTIVE, on_cancel=None, **stage_kwargs):
+    """Run a song stage exactly as the headless batch does; on_done receives the StageResult."""
+    def run(job, emit_chunk):
+        return run_stage(stage, client, prompts, documents, user_message, emit_chunk, job, **stage_kwargs)
+
+    return submit_job(parent, OPENAI_CHAT, run, on_done=on_done, on_error=on_error, on_chunk=on_chunk,
+                      priority=priority, label=stage, on_cancel=on_cancel)
+
+
+def submit_summary(parent, memory, client, prompts):
+    """Fold the turns that left memory's verbatim window into its summary, in the background."""
+    turns = memory.evicted()
+    if not turns or memory.summarizing or client is None:
+        return None
+    version, previous = memory.version, memory.summary
+    memory.summarizing = True
+
+    def run(job, emit_chunk):
+        return summarize_turns(client, prompts, previous, turns, job)
+
+    def done(summary):
+        memory.summarizing = False
+        memory.fold(version, len(turns), summary)
+
+    def failed(error=None):
+        memory.summarizing = False
+        if error:
+            logger.warning(f"Could not summarize the {memory.name} conversation: {error}")
+
+    return submit_job(parent, OPENAI_CHAT, run, on_done=done, on_error=failed, on_cancel=failed,
+                      priority=Priority.BACKGROUND, label=f"{memory.name} summary")
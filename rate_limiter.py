@@ -0,0 +1,327 @@
+import logging
+import random
+import re
+import threading
+import time
+import httpx
+import openai
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Requests and tokens per minute used until the API reports its own limits
+DEFAULT_MODEL_LIMITS = {
+    'gpt-4o-mini': {'rpm': 500, 'tpm': 200000},
+    'dall-e-3': {'rpm': 5, 'tpm': None},
+}
+FALLBACK_LIMITS = {'rpm': 60, 'tpm': 60000}
+
+# Completion tokens reserved up front when the request does not say how many it wants
+DEFAULT_COMPLETION_ESTIMATE = 800
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Raised while reading a stream: the SDK's own errors, and transport errors httpx raises mid-body
+STREAM_ERRORS = (openai.APIError, httpx.TransportError)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+class StreamInterrupted(Exception):
+    """A chat stream broke after content was delivered, so it cannot be retried transparently.
+
+    partial holds the text delivered so far; the whole request can safely be sent again.
+    """
+    retryable = True
+
+    def __init__(self, message, partial=''):
+        super().__init__(message)
+        self.partial = partial
+
+
+def parse_reset(value):
+    """Parse OpenAI reset durations such as '6m0s', '1s' or '20ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def estimate_tokens(messages):
+    # Roughly four characters per token, plus the per-message overhead of the chat format
+    return sum(len(str(message.get('content', ''))) // 4 + 4 for message in messages)
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount):
+        """Take amount from the bucket and return how long the caller must wait before using it."""
+        with self._lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, limit=None, remaining=None, reset_seconds=None):
+        """Align the bucket with the limit the server reports in its rate-limit headers."""
+        with self._lock:
+            self._refill()
+            if limit:
+                self.capacity = float(limit)
+                self.rate = self.capacity / 60.0
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if reset_seconds and self.capacity > remaining:
+                    # The server refills (capacity - remaining) within reset_seconds
+                    self.rate = max(self.rate, (self.capacity - remaining) / reset_seconds)
+
+
+class ModelLimiter:
+    def __init__(self, model, rpm, tpm):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.stats = {'requests': 0, 'throttled': 0, 'throttled_seconds': 0.0, 'retried': 0,
+                      'rate_limited': 0, 'failed': 0, 'tokens': 0}
+        self._lock = threading.Lock()
+
+    def admission_delay(self, estimated_tokens):
+        delay = self.requests.reserve(1)
+        if self.tokens is not None and estimated_tokens:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        return delay
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        if actual_tokens is None:
+            return
+        self.count('tokens', actual_tokens)
+        if self.tokens is not None and estimated_tokens > actual_tokens:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def release(self, estimated_tokens):
+        """Give back the tokens reserved for a request the server never served."""
+        if self.tokens is not None and estimated_tokens:
+            self.tokens.refund(estimated_tokens)
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+        try:
+            self.requests.sync(
+                limit=_header_float(headers, 'x-ratelimit-limit-requests'),
+                remaining=_header_float(headers, 'x-ratelimit-remaining-requests'),
+                reset_seconds=parse_reset(headers.get('x-ratelimit-reset-requests')),
+            )
+            if self.tokens is not None:
+                self.tokens.sync(
+                    limit=_header_float(headers, 'x-ratelimit-limit-tokens'),
+                    remaining=_header_float(headers, 'x-ratelimit-remaining-tokens'),
+                    reset_seconds=parse_reset(headers.get('x-ratelimit-reset-tokens')),
+                )
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Ignoring malformed rate-limit headers for {self.model}: {str(e)}")
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+def _header_float(headers, name):
+    value = headers.get(name)
+    return float(value) if value not in (None, '') else None
+
+
+class RateLimiter:
+    def __init__(self, model_limits=None):
+        self.model_limits = dict(DEFAULT_MODEL_LIMITS, **(model_limits or {}))
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model):
+        with self._lock:
+            if model not in self._models:
+                limits = self.model_limits.get(model, FALLBACK_LIMITS)
+                self._models[model] = ModelLimiter(model, limits['rpm'], limits.get('tpm'))
+            return self._models[model]
+
+    def stats(self):
+        with self._lock:
+            return {model: dict(limiter.stats) for model, limiter in self._models.items()}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+class RateLimitedClient:
+    """Wraps an OpenAI client: delays admission to stay under per-model limits and retries 429/5xx."""
+
+    def __init__(self, client, limiter=None, sleep=time.sleep, max_retries=5, base_delay=1.0, max_delay=60.0):
+        # Retries are handled here, with shared buckets, rather than inside the SDK
+        self.client = client.with_options(max_retries=0)
+        self.limiter = limiter or get_rate_limiter()
+        self.sleep = sleep
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after:
+            return retry_after + random.uniform(0, self.base_delay)
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def admit(self, model_limiter, estimated_tokens):
+        delay = model_limiter.admission_delay(estimated_tokens)
+        if delay > 0:
+            model_limiter.count('throttled')
+            model_limiter.count('throttled_seconds', delay)
+            logger.info(f"Throttling {model_limiter.model} request for {delay:.2f}s")
+            self.sleep(delay)
+        return delay
+
+    def call(self, model, estimated_tokens, request, record=None):
+        """Run request() under admission control, retrying transient failures with backoff.
+
+        Returns with estimated_tokens still reserved, for the caller to reconcile; a failed attempt
+        releases its own reservation.
+        """
+        model_limiter = self.limiter.for_model(model)
+        attempt = 0
+        waited = 0.0
+        while True:
+            waited += self.admit(model_limiter, estimated_tokens)
+            if record is not None:
+                record.restart(waited)
+                waited = 0.0
+            model_limiter.count('requests')
+            try:
+                raw = request()
+                model_limiter.update_from_headers(raw.headers)
+                return raw.parse()
+            except BaseException as e:
+                model_limiter.release(estimated_tokens)
+                if not isinstance(e, (openai.APIConnectionError, openai.APIStatusError)):
+                    raise
+                status = getattr(e, 'status_code', None)
+                response = getattr(e, 'response', None)
+                if response is not None:
+                    model_limiter.update_from_headers(response.headers)
+                if status == 429:
+                    model_limiter.count('rate_limited')
+                retryable = status is None or status in RETRYABLE_STATUS
+                if not retryable or attempt >= self.max_retries:
+                    model_limiter.count('failed')
+                    raise
+                retry_after = None
+                if response is not None:
+                    retry_after = parse_reset(response.headers.get('retry-after'))
+                delay = self.backoff(attempt, retry_after)
+                attempt += 1
+                waited += delay
+                self.retrying(model_limiter, record, attempt, delay, status or str(e))
+
+    def retrying(self, model_limiter, record, attempt, delay, reason):
+        model_limiter.count('retried')
+        if record is not None:
+            record.extra['retries'] = record.extra.get('retries', 0) + 1
+        logger.warning(f"{model_limiter.model} request failed ({reason}), retry {attempt}/{self.max_retries} "
+                       f"in {delay:.2f}s")
+        self.sleep(delay)
+
+    def stream_chat(self, messages, on_chunk, model="gpt-4o-mini", should_stop=None, on_usage=None, **create_kwargs):
+        """Stream a chat completion, calling on_chunk for each piece of content, and return the full text.
+
+        A stream that breaks before its first content is retried like a failed request; one that breaks
+        later raises StreamInterrupted. Tokens reserved but not used are given back however it ends.
+        """
+        prompt_tokens = estimate_tokens(messages)
+        estimated = prompt_tokens + create_kwargs.get('max_tokens', DEFAULT_COMPLETION_ESTIMATE)
+        model_limiter = self.limiter.for_model(model)
+        parts = []
+        usage = None
+        reserved = False
+        attempt = 0
+        try:
+            with get_telemetry().track('chat', 'openai', model) as record:
+                while True:
+                    stream = self.call(model, estimated, lambda: self.client.chat.completions.with_raw_response.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **create_kwargs
+                    ), record)
+                    reserved = True
+                    try:
+                        for chunk in stream:
+                            if should_stop:
+                                should_stop()
+                            if chunk.usage is not None:
+                                usage = chunk.usage
+                            if chunk.choices and chunk.choices[0].delta.content is not None:
+                                content = chunk.choices[0].delta.content
+                                record.token()
+                                parts.append(content)
+                                on_chunk(content)
+                        break
+                    except STREAM_ERRORS as e:
+                        if parts or attempt >= self.max_retries:
+                            model_limiter.count('failed')
+                            raise StreamInterrupted(f"{model} stream broke after {len(parts)} chunks: {str(e)}",
+                                                    "".join(parts)) from e
+                        # Nothing was delivered yet, so asking again is invisible to the caller
+                        model_limiter.reconcile(estimated, prompt_tokens)
+                        reserved = False
+                        attempt += 1
+                        self.retrying(model_limiter, record, attempt, self.backoff(attempt), str(e))
+                if usage is not None:
+                    record.usage(usage.prompt_tokens, usage.completion_tokens)
+        finally:
+            if reserved:
+                # Without the final usage chunk (cancelled or broken streams), count what was sent and received
+                model_limiter.reconcile(estimated, usage.total_tokens if usage else prompt_tokens + len(parts))
+        if usage is not None and on_usage:
+            on_usage(usage)
+        return "".join(parts)
+
+    def generate_image(self, prompt, model="dall-e-3", **generate_kwargs):
+        with get_telemetry().track('image', 'openai', model) as record:
+            return self.call(model, 0, lambda: self.client.images.with_raw_response.generate(
+                model=model,
+                prompt=prompt,
+                **generate_kwargs
+            ), record)
@@ -4,6 +4,7 @@ from PyQt5.QtGui import QIcon
 import json
 import os
 import shutil
+from paths import song_folder as folder_for
 
 class SongManagementTab(QWidget):
     song_selected = pyqtSignal(str)
@@ -71,7 +72,7 @@ class SongManagementTab(QWidget):
                 self.save_songs(songs)
                 
                 # Create the song folder
-                song_folder = os.path.join('songs', title)
+                song_folder = folder_for(title)
                 os.makedirs(song_folder, exist_ok=True)
                 
                 # Create empty files for each component
@@ -99,7 +100,7 @@ class SongManagementTab(QWidget):
                     self.song_deleted.emit(current_item.text())
 
                     # Delete the song folder if it exists
-                    song_folder = os.path.join('songs', current_item.text())
+                    song_folder = folder_for(current_item.text())
                     if os.path.exists(song_folder):
                         shutil.rmtree(song_folder)
                 except Exception as e:
@@ -123,8 +124,8 @@ class SongManagementTab(QWidget):
                     self.save_songs(songs)
                     
                     # Rename the song folder if it exists
-                    old_folder = os.path.join('songs', old_title)
-                    new_folder = os.path.join('songs', new_title)
+                    old_folder = folder_for(old_title)
+                    new_folder = folder_for(new_title)
                     if os.path.exists(old_folder):
                         os.rename(old_folder, new_folder)
                     
@@ -176,7 +177,7 @@ class SongManagementTab(QWidget):
         current_song = self.get_current_song()
         if current_song:
             try:
-                song_folder = os.path.join('songs', current_song['title'])
+                song_folder = folder_for(current_song['title'])
                 os.makedirs(song_folder, exist_ok=True)
 
                 # Save concept
@@ -0,0 +1,195 @@
+"""The production stage's JSON reply, parsed while it streams.
+
+The model answers with one JSON object (response_format json_object). Each top-level member is
+validated against SongResponse as soon as its value closes, so the tab can show it and start
+UdioPro once the first clip's fields are in, instead of waiting for the end of the stream.
+"""
+import json
+import logging
+import threading
+from typing import List
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# What the first UdioPro job of the extension chain needs; later jobs wait() for their own fields
+PROMPT_FIELDS = ('short_prompt', 'custom_lyrics_short')
+
+
+class SongResponse(BaseModel):
+    short_prompt: str
+    extend_prompts: List[str]
+    outro_prompt: str
+    num_extensions: int
+    custom_lyrics_short: str
+    custom_lyrics_extend: List[str]
+    custom_lyrics_outro: str
+
+
+_FIELD_ADAPTERS = {name: TypeAdapter(field.annotation) for name, field in SongResponse.model_fields.items()}
+
+
+class IncrementalJSONObject:
+    """Scans a JSON object fed in pieces and calls on_member(key, value) as each top-level member closes.
+
+    Only the object's own structure is tracked (nesting depth, strings and escapes); each member's
+    text is handed to json.loads once it is complete.
+    """
+
+    def __init__(self, on_member):
+        self.on_member = on_member
+        self.buffer = []
+        self.started = False
+        self.closed = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key = None
+        # 'key', 'colon', 'value' or 'next' while inside the top-level object
+        self.expect = 'key'
+        self.token = []
+
+    def feed(self, text):
+        for char in text:
+            if self.closed:
+                return
+            if not self.started:
+                if char == '{':
+                    self.started = True
+                    self.depth = 1
+                continue
+            self._scan(char)
+
+    def _scan(self, char):
+        if self.in_string:
+            self.token.append(char)
+            if self.escaped:
+                self.escaped = False
+            elif char == '\\':
+                self.escaped = True
+            elif char == '"':
+                self.in_string = False
+                if self.depth == 1:
+                    self._string_closed()
+            return
+
+        if self.expect in ('key', 'colon', 'next') and self.depth == 1:
+            if char == '"' and self.expect == 'key':
+                self.token = [char]
+                self.in_string = True
+            elif char == ':' and self.expect == 'colon':
+                self.expect = 'value'
+                self.token = []
+            elif char == ',' and self.expect == 'next':
+                self.expect = 'key'
+            elif char == '}':
+                self.closed = True
+            return
+
+        # Inside a value
+        if char.isspace() and self.depth == 1 and not self.token:
+            return
+        if char in ',}' and self.depth == 1:
+            # End of a number, true, false or null
+            self._member_closed()
+            if char == '}':
+                self.closed = True
+            else:
+                self.expect = 'key'
+            return
+        self.token.append(char)
+        if char == '"':
+            self.in_string = True
+        elif char in '{[':
+            self.depth += 1
+        elif char in '}]':
+            self.depth -= 1
+            if self.depth == 1:
+                self._member_closed()
+
+    def _string_closed(self):
+        if self.expect == 'key':
+            self.key = json.loads(''.join(self.token))
+            self.token = []
+            self.expect = 'colon'
+        else:
+            self._member_closed()
+
+    def _member_closed(self):
+        text = ''.join(self.token)
+        self.token = []
+        self.expect = 'next'
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not parse streamed JSON member {self.key}: {str(e)}")
+            return
+        self.on_member(self.key, value)
+
+
+class SongResponseStream:
+    """Feeds the production stream through IncrementalJSONObject and validates each SongResponse field.
+
+    on_field(name, value) gets every valid field as it completes; on_prompts(fields) fires once, as
+    soon as all PROMPT_FIELDS are valid. Other threads can wait() for a field that is still streaming.
+    """
+
+    def __init__(self, on_field=None, on_prompts=None):
+        self.on_field = on_field
+        self.on_prompts = on_prompts
+        self.fields = {}
+        self.errors = {}
+        self.prompts_ready = False
+        self.ended = False
+        self.parser = IncrementalJSONObject(self._member)
+        self._changed = threading.Condition()
+
+    def feed(self, text):
+        self.parser.feed(text)
+
+    def _member(self, name, value):
+        adapter = _FIELD_ADAPTERS.get(name)
+        if adapter is None:
+            logger.debug(f"Ignoring unexpected SongResponse field {name}")
+            return
+        try:
+            value = adapter.validate_python(value)
+        except ValidationError as e:
+            self.errors[name] = str(e)
+            logger.warning(f"Invalid SongResponse field {name}: {str(e)}")
+            return
+        with self._changed:
+            self.fields[name] = value
+            self._changed.notify_all()
+        if self.on_field:
+            self.on_field(name, value)
+        if not self.prompts_ready and all(field in self.fields for field in PROMPT_FIELDS):
+            self.prompts_ready = True
+            if self.on_prompts:
+                self.on_prompts(dict(self.fields))
+
+    def wait(self, name, should_stop=None, poll=0.5):
+        """Block until the field has streamed in; raises ValueError if the stream ended without it."""
+        with self._changed:
+            while name not in self.fields and not self.ended:
+                self._changed.wait(poll)
+                if should_stop:
+                    should_stop()
+            if name not in self.fields:
+                raise ValueError(f"The production reply has no valid {name}")
+            return self.fields[name]
+
+    def close(self):
+        with self._changed:
+            self.ended = True
+            self._changed.notify_all()
+
+    def finish(self, text):
+        """Validate the complete reply; raises pydantic's ValidationError like model_validate_json."""
+        try:
+            response = SongResponse.model_validate_json(text)
+            with self._changed:
+                self.fields.update(response.model_dump())
+            return response
+        finally:
+            self.close()
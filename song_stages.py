@@ -0,0 +1,203 @@
+import os
+import time
+from dataclasses import dataclass, field
+from rate_limiter import RateLimitedClient
+from telemetry import request_context
+from tracing import span
+
+# Stage order of a full song, as the tabs are laid out
+STAGES = ['concept', 'lyrics', 'composition', 'production', 'visual_design', 'critique']
+
+# Every document a stage can read; band_info and management are shared by all songs
+DOCUMENTS = ['band_info', 'management', 'concept', 'lyrics', 'composition', 'production', 'visual_design', 'critique']
+
+DOCUMENT_FILES = {
+    'band_info': 'band_info.txt',
+    'management': 'management.md',
+    'concept': 'concept.md',
+    'lyrics': 'lyrics.md',
+    'composition': 'composition.md',
+    'production': 'production.md',
+    'visual_design': 'visual_design.md',
+    'critique': 'critique.md',
+}
+
+# Stages whose new output is appended to the document instead of replacing it
+APPENDING_STAGES = {'concept', 'composition', 'production', 'visual_design'}
+
+CRITIQUE_INSTRUCTIONS = "Please provide your critique in a natural, conversational format. Include ratings out of 10 for each aspect (concept, lyrics, composition, visual design, production) and an overall rating. Explain your ratings and provide constructive feedback for each aspect. Conclude with an overall assessment of the song."
+
+
+@dataclass
+class StageResult:
+    stage: str
+    text: str
+    started_at: float
+    user_message: str = ""
+    finished_at: float = 0.0
+    first_token_at: float = None
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    extra: dict = field(default_factory=dict)
+    # SpanContext of the stage's trace span, so follow-up work (UdioPro, image download) can nest under it
+    trace: tuple = None
+
+    @property
+    def latency(self):
+        return self.finished_at - self.started_at
+
+    @property
+    def time_to_first_token(self):
+        return self.first_token_at - self.started_at if self.first_token_at else None
+
+
+def read_document(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return f"File {path} not found."
+
+
+def load_documents(folder='.', shared_folder='.'):
+    """Read every stage document of a song; band info and management come from shared_folder."""
+    documents = {}
+    for name in DOCUMENTS:
+        base = shared_folder if name in ('band_info', 'management') else folder
+        documents[name] = read_document(os.path.join(base, DOCUMENT_FILES[name]))
+    return documents
+
+
+def merge_document(stage, current, new_content):
+    if stage in APPENDING_STAGES and current.strip():
+        return current + "\n\n" + new_content
+    return new_content
+
+
+def critique_system_prompt(prompt, fan_count):
+    return f"{prompt}\n\nCurrent fan count: {fan_count}\n\n{CRITIQUE_INSTRUCTIONS}"
+
+
+def build_messages(stage, prompts, documents, user_message, fan_count=1, history=None):
+    """Return the chat messages a stage sends; lyrics returns the title request (see run_stage).
+
+    history (earlier turns of the conversation, see ConversationMemory) goes just before the request.
+    """
+    messages = stage_messages(stage, prompts, documents, user_message, fan_count)
+    return with_history(messages, history)
+
+
+def with_history(messages, history):
+    if not history:
+        return messages
+    return messages[:-1] + list(history) + messages[-1:]
+
+
+def stage_messages(stage, prompts, documents, user_message, fan_count=1):
+    prompt = prompts.text(stage)
+    if stage == 'concept':
+        context = ""
+        for name in ('band_info', 'concept', 'management'):
+            context += f"Content of {DOCUMENT_FILES[name]}:\n{documents[name].strip()}\n\n"
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "system", "content": f"Context Information:\n{context}"},
+            {"role": "user", "content": user_message}
+        ]
+    if stage == 'lyrics':
+        return lyrics_context(prompt, documents) + [
+            {"role": "user", "content": f"Generate a title for a song based on this prompt: {user_message}"}
+        ]
+    if stage == 'composition':
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "system", "content": f"Concept:\n{documents['concept']}"},
+            {"role": "system", "content": f"Lyrics:\n{documents['lyrics']}"},
+            {"role": "system", "content": f"Production:\n{documents['production']}"},
+            {"role": "user", "content": user_message}
+        ]
+    if stage == 'production':
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "system", "content": f"Concept:\n{documents['concept']}"},
+            {"role": "system", "content": f"Lyrics:\n{documents['lyrics']}"},
+            {"role": "system", "content": f"Composition:\n{documents['composition']}"},
+            {"role": "system", "content": f"Visual Design:\n{documents['visual_design']}"},
+            {"role": "user", "content": f"Generate a JSON response for the following request: {user_message}"}
+        ]
+    if stage == 'visual_design':
+        return [
+            {"role": "system", "content": f"{prompt}\n\nContext from concept.md:\n{documents['concept']}"},
+            {"role": "user", "content": user_message}
+        ]
+    if stage == 'critique':
+        return [
+            {"role": "system", "content": critique_system_prompt(prompt, fan_count)},
+            {"role": "system", "content": f"Management:\n{documents['management']}"},
+            {"role": "system", "content": f"Concept:\n{documents['concept']}"},
+            {"role": "system", "content": f"Lyrics:\n{documents['lyrics']}"},
+            {"role": "system", "content": f"Composition:\n{documents['composition']}"},
+            {"role": "system", "content": f"Visual Design:\n{documents['visual_design']}"},
+            {"role": "system", "content": f"Production:\n{documents['production']}"},
+            {"role": "user", "content": f"Generate a critique for the following: {user_message}"}
+        ]
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def lyrics_context(prompt, documents):
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "system", "content": f"Concept:\n{documents['concept']}"},
+        {"role": "system", "content": f"Composition:\n{documents['composition']}"},
+        {"role": "system", "content": f"Management:\n{documents['management']}"},
+    ]
+
+
+def request_options(stage):
+    if stage == 'production':
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def run_stage(stage, client, prompts, documents, user_message, on_chunk=None, job=None, fan_count=1,
+              model="gpt-4o-mini", history=None):
+    """Generate one stage's text with the same prompts and context the tab uses."""
+    result = StageResult(stage, "", time.time(), user_message)
+    sleep = job.sleep if job is not None else time.sleep
+    should_stop = job.check_cancelled if job is not None else None
+    gateway = RateLimitedClient(client, sleep=sleep)
+
+    def emit(content):
+        if result.first_token_at is None:
+            result.first_token_at = time.time()
+        if on_chunk:
+            on_chunk(content)
+
+    def count_usage(usage):
+        result.prompt_tokens += usage.prompt_tokens
+        result.completion_tokens += usage.completion_tokens
+
+    def stream(messages, **options):
+        result.requests += 1
+        with request_context(stage=stage):
+            return gateway.stream_chat(messages, emit, model=model, should_stop=should_stop,
+                                       on_usage=count_usage, **options)
+
+    with span('stage', stage=stage) as current:
+        result.trace = current.context
+        if stage == 'lyrics':
+            title = stream(build_messages(stage, prompts, documents, user_message, history=history))
+            emit("\n\nGenerating lyrics...\n")
+            lyrics = stream(with_history(lyrics_context(prompts.text(stage), documents) + [
+                {"role": "user", "content": f"Generate lyrics for a song titled '{title}' based on this prompt: {user_message}"}
+            ], history))
+            result.text = f"Title: {title}\n\n{lyrics}"
+            result.extra['title'] = title
+        else:
+            result.text = stream(build_messages(stage, prompts, documents, user_message, fan_count, history),
+                                 **request_options(stage))
+        result.finished_at = time.time()
+        current.set(requests=result.requests, prompt_tokens=result.prompt_tokens,
+                    completion_tokens=result.completion_tokens, ttft=result.time_to_first_token)
+    return result
@@ -0,0 +1,174 @@
+"""Spectrogram tiles for the production player, computed once per file and cached on disk.
+
+A track is decoded and run through a vectorized NumPy STFT once; magnitudes are stored as uint8
+decibels on log-spaced frequency rows. Each zoom level halves the columns of the one below it,
+keeping the louder of each pair so transients stay visible at any zoom, and every level is cut
+into TILE_COLUMNS-wide tiles. The cache is keyed by file hash, so renamed or re-cataloged files
+reuse it, and levels are memory-mapped, so opening a long track reads only the tiles on screen.
+The hash of each file seen is remembered under its path, size and mtime, so opening a file that
+has not changed since does not read the audio to hash it again.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_library import LIBRARY_DIR, file_hash as hash_file
+
+logger = logging.getLogger(__name__)
+
+SPECTROGRAM_DIR = os.path.join(LIBRARY_DIR, 'spectrograms')
+# Bumped whenever the tile format or parameters change, so stale caches are rebuilt
+CACHE_VERSION = 1
+RATE = 22050
+FFT_SIZE = 2048
+# 11.6 ms per column at the finest level
+HOP = 256
+ROWS = 256
+LOW_HZ = 30
+FLOOR_DB = -96.0
+TILE_COLUMNS = 512
+
+
+def row_weights(rate=RATE, size=FFT_SIZE, rows=ROWS):
+    """(bins, rows) matrix averaging FFT bins into log-spaced rows; rows narrower than a bin take the nearest one."""
+    frequencies = np.fft.rfftfreq(size, 1 / rate)
+    edges = np.geomspace(LOW_HZ, rate / 2, rows + 1)
+    weights = np.zeros((len(frequencies), rows), dtype=np.float32)
+    for row in range(rows):
+        inside = np.flatnonzero((frequencies >= edges[row]) & (frequencies < edges[row + 1]))
+        if not len(inside):
+            inside = [int(np.argmin(np.abs(frequencies - np.sqrt(edges[row] * edges[row + 1]))))]
+        weights[inside, row] = 1.0 / len(inside)
+    return weights
+
+
+def compute(mono, rate=RATE, should_stop=None, chunk=1024):
+    """The finest level: (ROWS, frames) uint8, lowest frequency first, 0 at FLOOR_DB and 255 at full scale."""
+    if len(mono) < FFT_SIZE:
+        mono = np.pad(mono, (0, FFT_SIZE - len(mono)))
+    frames = sliding_window_view(mono, FFT_SIZE)[::HOP]
+    window = np.hanning(FFT_SIZE).astype(np.float32)
+    weights = row_weights(rate)
+    # Power of a full-scale sine through the window, so 0 dB means full scale
+    reference = (window.sum() / 2) ** 2
+    columns = []
+    for start in range(0, len(frames), chunk):
+        if should_stop:
+            should_stop()
+        power = np.abs(np.fft.rfft(frames[start:start + chunk] * window, axis=1)) ** 2 @ weights
+        decibels = 10 * np.log10(np.maximum(power / reference, 1e-12))
+        columns.append(np.clip((decibels - FLOOR_DB) * (255 / -FLOOR_DB), 0, 255).astype(np.uint8))
+    return np.ascontiguousarray(np.concatenate(columns).T)
+
+
+def build_levels(level):
+    """Zoom levels from the finest up to the first that fits in one tile."""
+    levels = [level]
+    while level.shape[1] > TILE_COLUMNS:
+        if level.shape[1] % 2:
+            level = np.concatenate([level, level[:, -1:]], axis=1)
+        level = np.maximum(level[:, 0::2], level[:, 1::2])
+        levels.append(level)
+    return levels
+
+
+def cache_dir(file_hash, root=SPECTROGRAM_DIR):
+    return os.path.join(root, file_hash)
+
+
+def stat_file(path, root=SPECTROGRAM_DIR):
+    """Where the hash of path is remembered while its size and mtime stay the same."""
+    stat = os.stat(path)
+    identity = f"{os.path.normcase(os.path.abspath(path))}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return os.path.join(root, 'paths', hashlib.sha1(identity.encode('utf-8')).hexdigest())
+
+
+def known_hash(path, root=SPECTROGRAM_DIR):
+    try:
+        with open(stat_file(path, root), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def remember_hash(path, file_hash, root=SPECTROGRAM_DIR):
+    try:
+        target = stat_file(path, root)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f"{target}.{os.getpid()}.partial"
+        with open(partial, 'w', encoding='utf-8') as f:
+            f.write(file_hash)
+        os.replace(partial, target)
+    except OSError as e:
+        logger.debug(f"Could not remember the hash of {path}: {str(e)}")
+
+
+class Spectrogram:
+    """Cached levels of one file, memory-mapped; tile(level, index) is a (ROWS, <= TILE_COLUMNS) uint8 view."""
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != CACHE_VERSION:
+            raise ValueError(f"Spectrogram cache {folder} is version {self.meta.get('version')}")
+        self.folder = folder
+        self.duration = self.meta['duration']
+        self.levels = [np.load(os.path.join(folder, f"level{n}.npy"), mmap_mode='r')
+                       for n in range(self.meta['levels'])]
+
+    def seconds_per_column(self, level):
+        return self.meta['hop'] / self.meta['rate'] * (1 << level)
+
+    def level_for(self, seconds_per_pixel):
+        """The coarsest level that still has at least one column per pixel."""
+        level = 0
+        while level + 1 < len(self.levels) and self.seconds_per_column(level + 1) <= seconds_per_pixel:
+            level += 1
+        return level
+
+    def tile_count(self, level):
+        return -(-self.levels[level].shape[1] // TILE_COLUMNS)
+
+    def tile(self, level, index):
+        return self.levels[level][:, index * TILE_COLUMNS:(index + 1) * TILE_COLUMNS]
+
+
+def load(path, file_hash=None, root=SPECTROGRAM_DIR, should_stop=None):
+    """The file's Spectrogram, computing and caching it first unless a current cache exists."""
+    # Imported here so opening a cached spectrogram does not load the analysis module
+    from audio_analysis import decode
+    remembered = file_hash is None and known_hash(path, root)
+    if remembered:
+        try:
+            return Spectrogram(cache_dir(remembered, root))
+        except (OSError, ValueError, KeyError):
+            # No usable cache under it; the file is hashed before one is built, in case the mtime missed a change
+            pass
+    file_hash = file_hash or hash_file(path)
+    if file_hash != remembered:
+        remember_hash(path, file_hash, root)
+    folder = cache_dir(file_hash, root)
+    try:
+        return Spectrogram(folder)
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(folder):
+            logger.info(f"Rebuilding the spectrogram cache for {path}: {str(e)}")
+    samples = decode(path, RATE)
+    mono = samples.mean(axis=1) if len(samples) else np.zeros(0, dtype=np.float32)
+    levels = build_levels(compute(mono, RATE, should_stop))
+    # Written next to the cache and swapped in, so a crash never leaves a partial cache behind
+    partial = folder + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    for n, level in enumerate(levels):
+        np.save(os.path.join(partial, f"level{n}.npy"), level)
+    with open(os.path.join(partial, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'rate': RATE, 'hop': HOP, 'fft_size': FFT_SIZE, 'rows': ROWS,
+                   'low_hz': LOW_HZ, 'floor_db': FLOOR_DB, 'duration': len(samples) / RATE,
+                   'levels': len(levels)}, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(partial, folder)
+    return Spectrogram(folder)
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import numpy as np
+from PyQt5.QtCore import Qt, QRectF
+from PyQt5.QtGui import QPainter, QColor, QImage
+from generation_scheduler import Priority, LOCAL
+from qt_jobs import submit_job
+from spectrogram import load, TILE_COLUMNS
+from track_view import TrackView
+
+
+def _colormap():
+    # Dark blue through purple and orange to pale yellow, as 0xAARRGGBB for QImage.Format_RGB32
+    anchors = np.array([[0, 0, 4], [40, 11, 84], [101, 21, 110], [159, 42, 99], [212, 72, 66],
+                        [245, 125, 21], [250, 193, 39], [252, 255, 164]], dtype=np.float64)
+    positions = np.linspace(0, 255, len(anchors))
+    rgb = np.stack([np.interp(np.arange(256), positions, anchors[:, c]) for c in range(3)], axis=1).astype(np.uint32)
+    return 0xFF000000 | (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+
+COLORMAP = _colormap()
+
+
+class SpectrogramWidget(TrackView):
+    """Spectrogram of the playing track, drawn from cached tiles at the level of detail of the zoom."""
+    MAX_CACHED_TILES = 96
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.spectrogram = None
+        self.file_path = None
+        self._job = None
+        # (level, tile) -> QImage, least recently drawn first
+        self._images = OrderedDict()
+
+    def load_audio(self, file_path):
+        if file_path == self.file_path and (self.spectrogram is not None or self._job is not None):
+            return
+        if self._job is not None and not self._job.finished:
+            self._job.cancel()
+        self.file_path = file_path
+        self.spectrogram = None
+        self._images.clear()
+        self.reset_view()
+
+        def run(job, emit_chunk):
+            return load(file_path, should_stop=job.check_cancelled)
+
+        self._job = submit_job(self, LOCAL, run, on_done=lambda spectrogram: self._loaded(file_path, spectrogram),
+                               on_error=lambda error: self._failed(file_path, error),
+                               priority=Priority.INTERACTIVE, label='spectrogram')
+        self.update()
+
+    def _loaded(self, file_path, spectrogram):
+        if file_path == self.file_path:
+            self.spectrogram = spectrogram
+            self._job = None
+            self.update()
+
+    def _failed(self, file_path, error):
+        if file_path == self.file_path:
+            self._job = None
+            self.setToolTip(f"Could not compute the spectrogram: {error}")
+            self.update()
+
+    def total_seconds(self):
+        if self.spectrogram is not None and self.spectrogram.duration:
+            return self.spectrogram.duration
+        return super().total_seconds()
+
+    def min_span(self):
+        # Four pixels per finest column
+        if self.spectrogram is None:
+            return super().min_span()
+        return self.spectrogram.seconds_per_column(0) * self.width() / 4
+
+    def _image(self, level, index):
+        key = (level, index)
+        image = self._images.get(key)
+        if image is None:
+            # Highest frequency on top
+            pixels = np.ascontiguousarray(COLORMAP[self.spectrogram.tile(level, index)[::-1]])
+            height, width = pixels.shape
+            image = QImage(pixels.data, width, height, width * 4, QImage.Format_RGB32).copy()
+            self._images[key] = image
+            if len(self._images) > self.MAX_CACHED_TILES:
+                self._images.popitem(last=False)
+        else:
+            self._images.move_to_end(key)
+        return image
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        width, height = self.width(), self.height()
+        if self.spectrogram is None:
+            if self._job is not None:
+                painter.setPen(QColor(160, 160, 160))
+                painter.drawText(self.rect(), Qt.AlignCenter, "Computing spectrogram...")
+            return
+        span = self.span()
+        if span <= 0 or width <= 0:
+            return
+        seconds_per_pixel = span / width
+        level = self.spectrogram.level_for(seconds_per_pixel)
+        column_seconds = self.spectrogram.seconds_per_column(level)
+        tile_seconds = TILE_COLUMNS * column_seconds
+        first = int(self.view_start // tile_seconds)
+        last = min(int((self.view_start + span) // tile_seconds), self.spectrogram.tile_count(level) - 1)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for index in range(first, last + 1):
+            image = self._image(level, index)
+            x = (index * tile_seconds - self.view_start) / seconds_per_pixel
+            painter.drawImage(QRectF(x, 0, image.width() * column_seconds / seconds_per_pixel, height), image)
+
+        self.draw_position(painter, seconds_per_pixel)
@@ -0,0 +1,194 @@
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from generation_scheduler import get_scheduler, Priority, OPENAI_CHAT
+from song_stages import STAGES, merge_document
+
+logger = logging.getLogger(__name__)
+
+# Documents each stage needs to be final before it can start
+STAGE_DEPENDENCIES = {
+    'concept': [],
+    'composition': ['concept'],
+    'visual_design': ['concept'],
+    'lyrics': ['concept', 'composition'],
+    'production': ['concept', 'lyrics', 'composition', 'visual_design'],
+    'critique': ['concept', 'lyrics', 'composition', 'production', 'visual_design'],
+}
+
+
+def input_hash(stage, documents, graph=None):
+    """Content hash of the documents a stage reads, to tell whether its inputs changed since it last ran."""
+    digest = hashlib.sha256()
+    for dep in (graph or StageGraph()).dependencies.get(stage, []):
+        text = documents.get(dep, '').encode('utf-8')
+        digest.update(f"{dep}:{len(text)}:".encode('utf-8') + text)
+    return digest.hexdigest()
+
+
+class StageGraph:
+    def __init__(self, dependencies=None):
+        self.dependencies = {stage: list(deps) for stage, deps in (dependencies or STAGE_DEPENDENCIES).items()}
+        self.dependents = {stage: [] for stage in self.dependencies}
+        for stage, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents.setdefault(dep, []).append(stage)
+        self.order = self.topological_order()
+
+    def topological_order(self):
+        remaining = {stage: set(deps) for stage, deps in self.dependencies.items()}
+        order = []
+        while remaining:
+            ready = sorted((stage for stage, deps in remaining.items() if not deps),
+                           key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+            if not ready:
+                raise ValueError(f"Stage dependencies contain a cycle: {sorted(remaining)}")
+            for stage in ready:
+                order.append(stage)
+                del remaining[stage]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def downstream(self, stage):
+        """Every stage that transitively reads the given stage's document, in execution order."""
+        seen = set()
+        pending = list(self.dependents.get(stage, []))
+        while pending:
+            current = pending.pop()
+            if current not in seen:
+                seen.add(current)
+                pending.extend(self.dependents.get(current, []))
+        return [s for s in self.order if s in seen]
+
+    def critical_path(self, durations):
+        """Longest chain of dependent stage durations: the best end-to-end latency the graph allows."""
+        finish = {}
+        for stage in self.order:
+            if stage not in durations:
+                continue
+            start = max((finish[dep] for dep in self.dependencies[stage] if dep in finish), default=0.0)
+            finish[stage] = start + durations[stage]
+        return max(finish.values(), default=0.0)
+
+
+class StageGraphExecutor:
+    """Starts each stage as soon as its inputs are final, running independent stages in parallel."""
+
+    def __init__(self, run_stage, documents, graph=None, priority=Priority.NORMAL, label='', on_stage_done=None,
+                 provider=OPENAI_CHAT, input_hashes=None):
+        # run_stage(stage, documents_snapshot, job) -> StageResult
+        self.run_stage = run_stage
+        # stage -> input_hash() of the documents it last ran on; updated as stages finish
+        self.input_hashes = input_hashes if input_hashes is not None else {}
+        self.documents = documents
+        self.graph = graph or StageGraph()
+        self.priority = priority
+        self.label = label
+        self.on_stage_done = on_stage_done
+        self.provider = provider
+        self.results = {}
+        self.errors = {}
+        self.unchanged = []
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+
+    def run(self, stages=None, only_changed=False):
+        """Run the given stages (all by default); stages outside the set are treated as already final.
+
+        With only_changed, a stage whose inputs hash the same as when it last ran is left as it is.
+        """
+        stages = [s for s in self.graph.order if stages is None or s in stages]
+        self._pending = set(stages)
+        self._running = set()
+        self._only_changed = only_changed
+        self._hashes = {}
+        self.errors = {}
+        self.unchanged = []
+        self._jobs = []
+        # Stages started from another stage's completion callback still belong to the caller's trace
+        self._context = contextvars.copy_context()
+        self.started_at = time.time()
+        with self._lock:
+            started = self._start_ready()
+        self._watch(started)
+        with self._lock:
+            while self._pending or self._running:
+                self._finished.wait()
+        self.finished_at = time.time()
+        return self.results
+
+    def rerun_from(self, changed_stage, stages=None):
+        """Re-run the stages downstream of changed_stage (limited to stages) whose inputs actually changed."""
+        downstream = [s for s in self.graph.downstream(changed_stage) if stages is None or s in stages]
+        return self.run(downstream, only_changed=True)
+
+    def cancel(self):
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def _ready(self, stage):
+        return all(dep not in self._pending and dep not in self._running and dep not in self.errors
+                   for dep in self.graph.dependencies.get(stage, []))
+
+    def _blocked(self, stage):
+        return any(dep in self.errors for dep in self.graph.dependencies.get(stage, []))
+
+    def _start_ready(self):
+        # Called with the lock held; callbacks are attached by _watch once it is released
+        started = []
+        for stage in [s for s in self.graph.order if s in self._pending]:
+            if self._blocked(stage):
+                self._pending.discard(stage)
+                self.errors[stage] = RuntimeError("Skipped because an upstream stage failed")
+            elif self._ready(stage):
+                self._pending.discard(stage)
+                snapshot = dict(self.documents)
+                self._hashes[stage] = input_hash(stage, snapshot, self.graph)
+                if self._only_changed and self.input_hashes.get(stage) == self._hashes[stage]:
+                    # Later stages in the order see it as final within this same pass
+                    self.unchanged.append(stage)
+                    continue
+                self._running.add(stage)
+                job = get_scheduler().submit(
+                    self.provider,
+                    lambda job, stage=stage, snapshot=snapshot: self.run_stage(stage, snapshot, job),
+                    self.priority,
+                    label=f"{self.label}:{stage}" if self.label else stage,
+                    context=self._context
+                )
+                self._jobs.append(job)
+                started.append((stage, job))
+        return started
+
+    def _watch(self, started):
+        for stage, job in started:
+            job.add_done_callback(lambda job, stage=stage: self._stage_finished(stage, job))
+
+    def _stage_finished(self, stage, job):
+        if job.state == job.DONE:
+            result = job.result
+            with self._lock:
+                self.documents[stage] = merge_document(stage, self.documents.get(stage, ''), result.text)
+                self.results[stage] = result
+                self.input_hashes[stage] = self._hashes[stage]
+            if self.on_stage_done:
+                try:
+                    self.on_stage_done(stage, result, self.documents[stage])
+                except Exception:
+                    logger.exception(f"Error handling the result of stage {stage}")
+        else:
+            with self._lock:
+                self.errors[stage] = job.error or RuntimeError(f"Stage {stage} was {job.state}")
+        with self._lock:
+            self._running.discard(stage)
+            started = self._start_ready()
+            self._finished.notify_all()
+        self._watch(started)
+
+    def critical_path(self):
+        return self.graph.critical_path({stage: result.latency for stage, result in self.results.items()})
@@ -0,0 +1,151 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from PyQt5.QtCore import QObject, QTimer, QCoreApplication
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_THRESHOLD_MS = 50
+HEARTBEAT_MS = 20
+# How often the aggregated table is logged while new stalls keep happening
+REPORT_INTERVAL = 60.0
+
+
+class StallSite:
+    def __init__(self, site, blocked_in, stack):
+        self.site = site
+        self.blocked_in = blocked_in
+        self.stack = stack
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def to_dict(self):
+        return {'site': self.site, 'blocked_in': self.blocked_in, 'count': self.count,
+                'total_ms': self.total_ms, 'max_ms': self.max_ms,
+                'mean_ms': self.total_ms / self.count if self.count else 0.0}
+
+
+def describe_frame(frame):
+    return f"{os.path.relpath(frame.filename, REPO_DIR) if frame.filename.startswith(REPO_DIR) else frame.filename}" \
+           f":{frame.lineno} in {frame.name}"
+
+
+def call_site(stack):
+    """(owner, blocked_in): the innermost frame in our own code, and the innermost frame overall."""
+    own = [frame for frame in stack if frame.filename.startswith(REPO_DIR) and frame.filename != __file__]
+    owner = describe_frame(own[-1]) if own else describe_frame(stack[-1])
+    return owner, describe_frame(stack[-1])
+
+
+class StallWatchdog(QObject):
+    """Heartbeats the GUI event loop from a timer and samples the main thread's stack when it stops beating."""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, heartbeat_ms=HEARTBEAT_MS, parent=None):
+        super().__init__(parent)
+        self.threshold = threshold_ms / 1000.0
+        self.heartbeat = heartbeat_ms / 1000.0
+        self.sites = {}
+        self.stalls = 0
+        self._main_thread = threading.main_thread().ident
+        self._last_beat = time.perf_counter()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reported_stalls = 0
+        self._last_report = time.time()
+        self._timer = QTimer(self)
+        self._timer.setInterval(heartbeat_ms)
+        self._timer.timeout.connect(self.beat)
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._last_beat = time.perf_counter()
+        self._timer.start()
+        self._thread = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._thread.start()
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+        logger.info(f"Stall watchdog running (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stop.set()
+        self._timer.stop()
+        self.log_report()
+
+    def beat(self):
+        now = time.perf_counter()
+        with self._lock:
+            stalled_for = now - self._last_beat - self.heartbeat
+            self._last_beat = now
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self._record(pending, max(stalled_for, self.threshold) * 1000)
+        if self.stalls > self._reported_stalls and time.time() - self._last_report > REPORT_INTERVAL:
+            self.log_report()
+
+    def _watch(self):
+        while not self._stop.wait(self.heartbeat / 2):
+            with self._lock:
+                overdue = time.perf_counter() - self._last_beat - self.heartbeat
+                capture = overdue > self.threshold and self._pending is None
+            if capture:
+                frame = sys._current_frames().get(self._main_thread)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame)
+                with self._lock:
+                    self._pending = stack
+
+    def _record(self, stack, duration_ms):
+        owner, blocked_in = call_site(stack)
+        key = (owner, blocked_in)
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None:
+                site = self.sites[key] = StallSite(owner, blocked_in, ''.join(traceback.format_list(stack)))
+            site.add(duration_ms)
+            self.stalls += 1
+        logger.warning(f"GUI thread stalled {duration_ms:.0f} ms at {owner} (blocked in {blocked_in})")
+        logger.debug(f"Stack of the stalled GUI thread:\n{site.stack}")
+
+    def report(self):
+        """Stall call sites, worst total time first."""
+        with self._lock:
+            sites = [site.to_dict() for site in self.sites.values()]
+        return sorted(sites, key=lambda site: site['total_ms'], reverse=True)
+
+    def log_report(self):
+        sites = self.report()
+        self._reported_stalls = self.stalls
+        self._last_report = time.time()
+        if not sites:
+            return
+        lines = [f"{'count':>6}{'total ms':>10}{'max ms':>9}  call site"]
+        for site in sites:
+            lines.append(f"{site['count']:>6}{site['total_ms']:>10.0f}{site['max_ms']:>9.0f}  "
+                         f"{site['site']} (blocked in {site['blocked_in']})")
+        logger.info("GUI stalls by call site:\n" + "\n".join(lines))
+
+
+_watchdog = None
+
+
+def get_stall_watchdog(threshold_ms=DEFAULT_THRESHOLD_MS):
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = StallWatchdog(threshold_ms)
+    return _watchdog
@@ -0,0 +1,352 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.getenv('BANDMANAGER_METRICS_FILE', 'metrics.jsonl')
+# The metrics file rolls over like the log: metrics.jsonl.1 ... .N, oldest dropped
+METRICS_MAX_BYTES = 5 * 1024 * 1024
+METRICS_BACKUP_COUNT = 3
+
+# Observations kept per series for the rolling percentiles
+WINDOW = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+
+# p95 targets in seconds by (kind, metric); slow requests are logged and series over target are
+# exported as violations. A render waits out the whole UdioPro job, so its target is the poll timeout.
+DEFAULT_SLOS = {
+    ('chat', 'ttft_seconds'): 3.0,
+    ('chat', 'inter_token_seconds'): 0.5,
+    ('chat', 'duration_seconds'): 60.0,
+    ('image', 'duration_seconds'): 90.0,
+    ('udiopro_submit', 'duration_seconds'): 30.0,
+    ('udiopro_render', 'duration_seconds'): 300.0,
+}
+
+_labels = contextvars.ContextVar('telemetry_labels', default={})
+
+
+@contextmanager
+def request_context(**labels):
+    """Label every call made inside the block, e.g. request_context(tab='ConceptTab', stage='concept')."""
+    token = _labels.set(dict(_labels.get(), **{k: v for k, v in labels.items() if v}))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels():
+    return dict(_labels.get())
+
+
+class Histogram:
+    """Rolling window of observations with all-time count and sum."""
+
+    def __init__(self, window=WINDOW):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q, ordered=None):
+        ordered = ordered if ordered is not None else sorted(self.values)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def summary(self):
+        ordered = sorted(self.values)
+        return {'count': self.count, 'sum': self.sum,
+                **{f"p{int(q * 100)}": self.quantile(q, ordered) for q in QUANTILES}}
+
+
+class RequestRecord:
+    """Timing and usage for one API call; created by Telemetry.track."""
+
+    def __init__(self, kind, provider, model, labels):
+        self.kind = kind
+        self.provider = provider
+        self.model = model
+        self.labels = labels
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._last_token = None
+        self.ttft = None
+        self.inter_token = []
+        self.duration = None
+        self.throttled = 0.0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.status = 'ok'
+        self.error = None
+        self.extra = {}
+
+    def restart(self, throttled=0.0):
+        # Admission delay and retries are not the provider's latency; time from the attempt that succeeded
+        self.throttled += throttled
+        self._started = time.perf_counter()
+        self._last_token = None
+
+    def token(self):
+        now = time.perf_counter()
+        if self._last_token is None:
+            self.ttft = now - self._started
+        else:
+            self.inter_token.append(now - self._last_token)
+        self._last_token = now
+
+    def usage(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        self.completion_tokens = (self.completion_tokens or 0) + completion_tokens
+
+    def to_dict(self):
+        inter = sorted(self.inter_token)
+        return {
+            'ts': self.started_at,
+            'kind': self.kind,
+            'provider': self.provider,
+            'model': self.model,
+            **self.labels,
+            'status': self.status,
+            'error': self.error,
+            'ttft': self.ttft,
+            'inter_token_p50': inter[len(inter) // 2] if inter else None,
+            'inter_token_max': inter[-1] if inter else None,
+            'tokens_streamed': len(self.inter_token) + (1 if self.ttft is not None else 0),
+            'duration': self.duration,
+            'throttled': self.throttled,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            **self.extra,
+        }
+
+
+class Telemetry:
+    def __init__(self, metrics_file=METRICS_FILE, slos=None, max_bytes=METRICS_MAX_BYTES,
+                 backup_count=METRICS_BACKUP_COUNT):
+        self.metrics_file = metrics_file
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.slos = dict(DEFAULT_SLOS, **(slos or {}))
+        self.histograms = {}
+        self.counters = {}
+        self.active = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._server = None
+
+    @contextmanager
+    def track(self, kind, provider, model=None):
+        """Time one call; the block receives the RequestRecord to mark tokens and usage on."""
+        record = RequestRecord(kind, provider, model, current_labels())
+        with self._lock:
+            self.active[id(record)] = record
+        with span(kind, provider=provider, model=model) as current:
+            try:
+                yield record
+            except BaseException as e:
+                record.status = 'cancelled' if type(e).__name__ == 'JobCancelled' else 'error'
+                record.error = str(e)
+                raise
+            finally:
+                with self._lock:
+                    self.active.pop(id(record), None)
+                record.duration = time.perf_counter() - record._started
+                current.set(**{key: value for key, value in record.to_dict().items()
+                               if value is not None and key not in ('ts', 'kind', 'provider', 'model', 'status', 'error')})
+                self.record(record)
+
+    def record(self, record):
+        labels = {'kind': record.kind, 'model': record.model or '', 'tab': record.labels.get('tab', ''),
+                  'stage': record.labels.get('stage', '')}
+        with self._lock:
+            self._count('requests_total', dict(labels, status=record.status))
+            if record.prompt_tokens:
+                self._count('prompt_tokens_total', labels, record.prompt_tokens)
+            if record.completion_tokens:
+                self._count('completion_tokens_total', labels, record.completion_tokens)
+            if record.status == 'ok':
+                self._observe('duration_seconds', labels, record.duration)
+                if record.ttft is not None:
+                    self._observe('ttft_seconds', labels, record.ttft)
+                for gap in record.inter_token:
+                    self._observe('inter_token_seconds', labels, gap)
+            if record.throttled:
+                self._observe('throttled_seconds', labels, record.throttled)
+        if record.status == 'ok':
+            for metric, value in (('ttft_seconds', record.ttft), ('duration_seconds', record.duration)):
+                target = self.slos.get((record.kind, metric))
+                if value is not None and target is not None and value > target:
+                    logger.warning(f"{labels['tab'] or labels['kind']}/{labels['stage'] or record.model}: "
+                                   f"{metric} {value:.2f}s is over the {target:.1f}s target")
+        self.append(record.to_dict())
+
+    def _observe(self, metric, labels, value):
+        key = (metric, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def _count(self, metric, labels, amount=1):
+        key = (metric, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def append(self, entry):
+        if not self.metrics_file:
+            return
+        line = json.dumps(entry, default=str)
+        with self._file_lock:
+            try:
+                with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+                    full = self.max_bytes and f.tell() >= self.max_bytes
+                if full:
+                    self._rotate()
+            except OSError as e:
+                logger.warning(f"Could not write to {self.metrics_file}: {str(e)}")
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            os.remove(self.metrics_file)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{self.metrics_file}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.metrics_file}.{index + 1}")
+        os.replace(self.metrics_file, f"{self.metrics_file}.1")
+
+    def summary(self):
+        """{metric: [{labels..., count, sum, p50, p95, p99}]} for every series recorded so far."""
+        with self._lock:
+            result = {}
+            for (metric, labels), histogram in sorted(self.histograms.items()):
+                result.setdefault(metric, []).append(dict(labels, **histogram.summary()))
+            return result
+
+    def values(self, metric, labels):
+        """The rolling window behind one series, for drawing its distribution."""
+        with self._lock:
+            histogram = self.histograms.get((metric, tuple(sorted(labels.items()))))
+            return list(histogram.values) if histogram else []
+
+    def active_requests(self):
+        """Calls still in flight, with their streaming rate so far."""
+        now = time.perf_counter()
+        with self._lock:
+            records = list(self.active.values())
+        active = []
+        for record in records:
+            tokens = len(record.inter_token) + (1 if record.ttft is not None else 0)
+            streaming_for = now - record._started - (record.ttft or 0)
+            active.append({
+                'kind': record.kind,
+                'model': record.model,
+                'tab': record.labels.get('tab', ''),
+                'stage': record.labels.get('stage', ''),
+                'elapsed': now - record._started,
+                'tokens': tokens,
+                'tokens_per_second': tokens / streaming_for if tokens > 1 and streaming_for > 0 else None,
+                'status': record.extra.get('poll_status', ''),
+            })
+        return active
+
+    def slo_violations(self):
+        violations = []
+        for metric, series in self.summary().items():
+            for entry in series:
+                target = self.slos.get((entry.get('kind'), metric))
+                if target is not None and entry['p95'] is not None and entry['p95'] > target:
+                    violations.append({'metric': metric, 'target': target, **entry})
+        return violations
+
+    def prometheus_text(self):
+        lines = []
+        summary = self.summary()
+        for metric, series in summary.items():
+            name = f"bandmanager_llm_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for entry in series:
+                labels = {k: v for k, v in entry.items() if k not in ('count', 'sum', 'p50', 'p95', 'p99')}
+                for q in QUANTILES:
+                    value = entry[f"p{int(q * 100)}"]
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(dict(labels, quantile=str(q)))} {value:.6f}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {entry['sum']:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {entry['count']}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (metric, labels), value in counters:
+            name = f"bandmanager_llm_{metric}"
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+        lines.append("# TYPE bandmanager_llm_slo_violation gauge")
+        for violation in self.slo_violations():
+            labels = {k: violation[k] for k in ('metric', 'kind', 'model', 'tab', 'stage') if k in violation}
+            lines.append(f"bandmanager_llm_slo_violation{_format_labels(labels)} {violation['p95']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, host='127.0.0.1'):
+        """Expose /metrics in Prometheus text format on a background thread."""
+        if self._server is not None:
+            return self._server
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
@@ -0,0 +1,311 @@
+"""Hierarchical trace spans for the song pipeline, exported as JSON lines.
+
+    with span('song', title=title):
+        with span('stage', stage='concept') as current:
+            current.set(tokens=120)
+
+Spans follow the context they were started in, including into scheduler jobs, so a song's
+stages, API calls and UdioPro polls nest under it. View a trace with:
+
+    python tracing.py traces.jsonl                  # waterfall of the latest trace
+    python tracing.py traces.jsonl --chrome out.json  # flame chart for chrome://tracing or Perfetto
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACES_FILE = os.getenv('BANDMANAGER_TRACES_FILE', 'traces.jsonl')
+# The span file is rolled over to traces.jsonl.1 .. .N past this size, like the metrics file
+TRACES_MAX_BYTES = 5 * 1024 * 1024
+TRACES_BACKUP_COUNT = 3
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Enough of a span to parent others to it after it has ended, e.g. across a GUI callback
+SpanContext = namedtuple('SpanContext', 'trace_id span_id')
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.start = time.time()
+        self.end = None
+        self.status = 'ok'
+        self.thread = threading.current_thread().name
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name, **attributes):
+        self.events.append({'name': name, 'ts': time.time(), **attributes})
+
+    @property
+    def context(self):
+        return SpanContext(self.trace_id, self.span_id)
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'status': self.status,
+            'thread': self.thread,
+            'attributes': self.attributes,
+            'events': self.events,
+        }
+
+
+class NonRecordingSpan:
+    """Stands in for a span that has already ended: children parent to it, but nothing it records is kept."""
+
+    def __init__(self, context):
+        self.trace_id = context.trace_id
+        self.span_id = context.span_id
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name, **attributes):
+        pass
+
+    @property
+    def context(self):
+        return SpanContext(self.trace_id, self.span_id)
+
+
+class Tracer:
+    def __init__(self, traces_file=TRACES_FILE, max_bytes=TRACES_MAX_BYTES, backup_count=TRACES_BACKUP_COUNT):
+        self.traces_file = traces_file
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent=None, **attributes):
+        """Start a child of parent (the current span by default); a new trace starts when there is none."""
+        parent = parent or _current_span.get()
+        return Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent.span_id if parent else None,
+                    attributes)
+
+    def finish(self, span, status=None):
+        # For spans that end in a later callback instead of a with block
+        if status:
+            span.status = status
+        span.end = time.time()
+        self.export(span)
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        current = self.start_span(name, parent, **attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = 'cancelled' if type(e).__name__ == 'JobCancelled' else 'error'
+            current.set(error=str(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(current)
+
+    def export(self, span):
+        if not self.traces_file:
+            return
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            try:
+                with open(self.traces_file, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+                    full = self.max_bytes and f.tell() >= self.max_bytes
+                if full:
+                    self._rotate()
+            except OSError as e:
+                logger.warning(f"Could not write to {self.traces_file}: {str(e)}")
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            os.remove(self.traces_file)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{self.traces_file}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.traces_file}.{index + 1}")
+        os.replace(self.traces_file, f"{self.traces_file}.1")
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_context():
+    current = _current_span.get()
+    return SpanContext(current.trace_id, current.span_id) if current else None
+
+
+@contextmanager
+def resume(parent):
+    """Make parent (a SpanContext from an earlier span) current, e.g. in a GUI callback continuing its work."""
+    token = _current_span.set(NonRecordingSpan(parent)) if parent is not None else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def span(name, parent=None, **attributes):
+    return get_tracer().span(name, parent, **attributes)
+
+
+def load_spans(path):
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed span line in {path}")
+    return spans
+
+
+def group_traces(spans):
+    traces = {}
+    for entry in spans:
+        traces.setdefault(entry['trace_id'], []).append(entry)
+    return traces
+
+
+def span_tree(spans):
+    """Spans in depth-first order as (depth, span); orphans whose parent was never exported become roots."""
+    ids = {entry['span_id'] for entry in spans}
+    children = {}
+    for entry in spans:
+        parent = entry['parent_id'] if entry['parent_id'] in ids else None
+        children.setdefault(parent, []).append(entry)
+    ordered = []
+
+    def visit(parent, depth):
+        for entry in sorted(children.get(parent, []), key=lambda s: s['start']):
+            ordered.append((depth, entry))
+            visit(entry['span_id'], depth + 1)
+
+    visit(None, 0)
+    return ordered
+
+
+def span_label(entry):
+    attributes = entry.get('attributes', {})
+    detail = next((str(attributes[key]) for key in ('stage', 'title', 'label', 'model', 'status') if attributes.get(key)), '')
+    return f"{entry['name']} {detail}".strip()
+
+
+def waterfall(spans, width=60):
+    """Text waterfall: one row per span, bar positioned on the trace's timeline."""
+    if not spans:
+        return ''
+    start = min(entry['start'] for entry in spans)
+    end = max(entry['end'] or entry['start'] for entry in spans)
+    total = max(end - start, 1e-6)
+    rows = [f"trace {spans[0]['trace_id']}  {total:.2f}s"]
+    for depth, entry in span_tree(spans):
+        offset = int((entry['start'] - start) / total * width)
+        length = max(1, int(entry['duration'] / total * width))
+        bar = ' ' * offset + '█' * min(length, width - offset)
+        name = ('  ' * depth + span_label(entry))[:40]
+        flag = '' if entry['status'] == 'ok' else f" [{entry['status']}]"
+        rows.append(f"{name:<40} |{bar:<{width}}| {entry['duration']:8.2f}s{flag}")
+    return "\n".join(rows)
+
+
+def chrome_trace(spans):
+    """Chrome trace-event format: each span becomes a complete event, one lane per thread."""
+    lanes = {}
+    events = []
+    for entry in spans:
+        lane = lanes.setdefault(entry.get('thread', ''), len(lanes) + 1)
+        events.append({
+            'name': span_label(entry),
+            'cat': entry['name'],
+            'ph': 'X',
+            'ts': entry['start'] * 1e6,
+            'dur': entry['duration'] * 1e6,
+            'pid': 1,
+            'tid': lane,
+            'args': dict(entry.get('attributes', {}), span_id=entry['span_id'], parent_id=entry['parent_id']),
+        })
+    for thread, lane in lanes.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane, 'args': {'name': thread}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show trace spans recorded by Band Manager')
+    parser.add_argument('file', nargs='?', default=TRACES_FILE, help='Span file (JSON lines)')
+    parser.add_argument('--trace', help='Trace id to show (default: the most recent)')
+    parser.add_argument('--list', action='store_true', help='List the traces in the file')
+    parser.add_argument('--chrome', help='Write a chrome://tracing / Perfetto JSON file for the selected trace')
+    parser.add_argument('--width', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    traces = group_traces(load_spans(args.file))
+    if not traces:
+        print(f"No spans in {args.file}")
+        return 1
+    latest = sorted(traces.values(), key=lambda spans: max(s['end'] or s['start'] for s in spans))
+    if args.list:
+        for spans in latest:
+            roots = [entry for depth, entry in span_tree(spans) if depth == 0]
+            duration = max(s['end'] or s['start'] for s in spans) - min(s['start'] for s in spans)
+            print(f"{spans[0]['trace_id']}  {duration:8.2f}s  {len(spans):4} spans  {', '.join(span_label(r) for r in roots[:3])}")
+        return 0
+
+    spans = traces.get(args.trace) if args.trace else latest[-1]
+    if spans is None:
+        print(f"Trace {args.trace} not found")
+        return 1
+    print(waterfall(spans, args.width))
+    if args.chrome:
+        with open(args.chrome, 'w', encoding='utf-8') as f:
+            json.dump(chrome_trace(spans), f)
+        print(f"\nChrome trace written to {args.chrome}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
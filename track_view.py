@@ -0,0 +1,89 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QPen
+
+
+class TrackView(QWidget):
+    """Timeline of the playing track; wheel zooms around the cursor, drag pans, double-click shows it all.
+
+    Subclasses paint the window of view_start to view_start + span() seconds and report the track's
+    length and the narrowest span worth zooming to.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.current_position = 0
+        self.duration = 0
+        # Visible window in seconds; a span of None shows the whole track
+        self.view_start = 0.0
+        self.view_span = None
+        self._drag = None
+        self.setMinimumHeight(100)
+
+    def total_seconds(self):
+        return self.duration / 1000
+
+    def min_span(self):
+        return 0.01
+
+    def span(self):
+        return self.view_span or self.total_seconds()
+
+    def reset_view(self):
+        self.view_start, self.view_span = 0.0, None
+
+    def set_duration(self, duration):
+        self.duration = duration
+
+    def update_position(self, position):
+        self.current_position = position
+        if self.view_span is not None:
+            # Page along with playback while zoomed in
+            seconds = position / 1000
+            if not self.view_start <= seconds < self.view_start + self.view_span:
+                self.view_start = seconds
+                self._clamp_view()
+        self.update()
+
+    def _clamp_view(self):
+        total = self.total_seconds()
+        if self.view_span is not None and self.view_span >= total:
+            self.view_span = None
+        self.view_start = min(max(0.0, self.view_start), max(0.0, total - self.span()))
+
+    def draw_position(self, painter, seconds_per_pixel):
+        if self.duration > 0:
+            position_x = int((self.current_position / 1000 - self.view_start) / seconds_per_pixel)
+            painter.setPen(QPen(QColor(255, 0, 0), 2))
+            painter.drawLine(position_x, 0, position_x, self.height())
+
+    def wheelEvent(self, event):
+        total = self.total_seconds()
+        if total <= 0:
+            return
+        span = self.span()
+        fraction = event.pos().x() / max(1, self.width())
+        anchor = self.view_start + span * fraction
+        new_span = min(total, max(self.min_span(), span * 0.8 ** (event.angleDelta().y() / 120)))
+        self.view_span = new_span
+        self.view_start = anchor - new_span * fraction
+        self._clamp_view()
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag = (event.pos().x(), self.view_start)
+
+    def mouseMoveEvent(self, event):
+        if self._drag is not None and self.view_span is not None:
+            x, start = self._drag
+            self.view_start = start - (event.pos().x() - x) * self.view_span / max(1, self.width())
+            self._clamp_view()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.reset_view()
+        self.update()
@@ -0,0 +1,214 @@
+"""Embedded receiver for UdioPro's completion callbacks, so finished jobs arrive without polling.
+
+Set UDIOPRO_CALLBACK_URL to an address UdioPro can reach that forwards to this machine (a tunnel, or
+a LAN address for a local stand-in such as mock_services.py); UDIOPRO_CALLBACK_PORT and
+UDIOPRO_CALLBACK_HOST choose where the receiver listens. The receiver is only used if a request to
+that URL comes back to it; otherwise get_callback_receiver() returns None and UdioProClient polls.
+
+The callback URL handed to UdioPro carries a random per-run token, and pushes without it are
+rejected, so nobody else who can reach the URL can complete a job with a forged payload.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from urllib.parse import urlencode, urlparse, parse_qs
+import requests
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_PATH = '/udiopro/callback'
+PING_PATH = '/udiopro/ping'
+DEFAULT_PORT = 8766
+MAX_BODY = 1024 * 1024
+
+
+class CallbackReceiver:
+    """Minimal HTTP/1.1 server on its own asyncio loop and thread; wait(work_id) blocks until the push."""
+
+    def __init__(self, public_url=None, host='127.0.0.1', port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.token = secrets.token_urlsafe(24)
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        # workId -> Event, and workId -> pushed payload; a push can arrive before wait() is called
+        self._events = {}
+        self._results = {}
+        self.received = 0
+
+    @property
+    def url(self):
+        return self.public_url or f"http://{self.host}:{self.port}"
+
+    @property
+    def callback_url(self):
+        return self.url + CALLBACK_PATH + '?' + urlencode({'token': self.token})
+
+    def _authorized(self, url):
+        return secrets.compare_digest(parse_qs(url.query).get('token', [''])[0], self.token)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._serve, name='udiopro-callbacks', daemon=True)
+        self.thread.start()
+        self._ready.wait(5)
+        if self.server is None:
+            raise OSError(f"Could not listen for UdioPro callbacks on {self.host}:{self.port}")
+        return self
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+        except OSError as e:
+            logger.error(f"UdioPro callback receiver could not start: {str(e)}")
+            return
+        finally:
+            self._ready.set()
+        logger.info(f"Listening for UdioPro callbacks on {self.host}:{self.port}")
+        self.loop.run_forever()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY:
+                await self._respond(writer, 413, {'error': 'body too large'})
+                return
+            body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b''
+            url = urlparse(target)
+            if method == 'GET' and url.path == PING_PATH:
+                await self._respond(writer, 200, {'token': self._authorized(url)})
+            elif method == 'POST' and url.path == CALLBACK_PATH:
+                if not self._authorized(url):
+                    logger.warning("Rejected a UdioPro callback without the receiver's token")
+                    await self._respond(writer, 403, {'error': 'forbidden'})
+                    return
+                payload = json.loads(body or b'{}')
+                if not isinstance(payload, dict):
+                    raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+                self._deliver(payload)
+                await self._respond(writer, 200, {'ok': True})
+            else:
+                await self._respond(writer, 404, {'error': f'Unknown path {url.path}'})
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logger.warning(f"Bad UdioPro callback request: {str(e)}")
+            await self._respond(writer, 400, {'error': 'bad request'})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    def _deliver(self, payload):
+        work_id = payload.get('workId') or payload.get('work_id')
+        if not work_id:
+            logger.warning(f"UdioPro callback without a workId: {str(payload)[:200]}")
+            return
+        if payload.get('type') != 'complete' and not payload.get('error'):
+            # Progress pushes carry nothing to act on; only the final one wakes the waiter
+            logger.debug(f"UdioPro job {work_id} is {payload.get('type')}")
+            return
+        with self._lock:
+            self.received += 1
+            self._results[work_id] = payload
+            event = self._events.setdefault(work_id, threading.Event())
+        event.set()
+
+    def reachable(self, timeout=3):
+        """Whether a request to the public URL reaches this receiver, e.g. through the tunnel."""
+        try:
+            response = requests.get(self.url + PING_PATH, params={'token': self.token}, timeout=timeout)
+            return response.ok and response.json().get('token') is True
+        except (requests.RequestException, ValueError) as e:
+            logger.info(f"UdioPro callback URL {self.url} is not reachable: {str(e)}")
+            return False
+
+    def expect(self, work_id):
+        with self._lock:
+            self._events.setdefault(work_id, threading.Event())
+
+    def expects(self, work_id):
+        with self._lock:
+            return work_id in self._events
+
+    def discard(self, work_id):
+        with self._lock:
+            self._events.pop(work_id, None)
+            self._results.pop(work_id, None)
+
+    def wait(self, work_id, timeout, sleep=time.sleep, slice_seconds=0.25):
+        """Return the pushed payload, or None if it did not arrive within timeout.
+
+        sleep(0) is called between slices so a job's cancellation still interrupts the wait.
+        """
+        with self._lock:
+            event = self._events.setdefault(work_id, threading.Event())
+        deadline = time.monotonic() + timeout
+        while not event.wait(max(0.0, min(slice_seconds, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline:
+                return None
+            sleep(0)
+        with self._lock:
+            self._events.pop(work_id, None)
+            return self._results.pop(work_id)
+
+
+_receiver = None
+_receiver_checked = False
+_receiver_lock = threading.Lock()
+
+
+def get_callback_receiver():
+    """The running receiver if UDIOPRO_CALLBACK_URL is set and reaches it, else None (poll instead)."""
+    global _receiver, _receiver_checked
+    with _receiver_lock:
+        if _receiver_checked:
+            return _receiver
+        _receiver_checked = True
+        public_url = os.getenv('UDIOPRO_CALLBACK_URL')
+        if not public_url:
+            return None
+        receiver = CallbackReceiver(public_url, os.getenv('UDIOPRO_CALLBACK_HOST', '127.0.0.1'),
+                                    int(os.getenv('UDIOPRO_CALLBACK_PORT', DEFAULT_PORT)))
+        try:
+            receiver.start()
+        except OSError as e:
+            logger.error(str(e))
+            return None
+        if not receiver.reachable():
+            logger.warning(f"UdioPro callbacks disabled: {public_url} does not reach this app; polling instead")
+            receiver.stop()
+            return None
+        _receiver = receiver
+        return _receiver
@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import requests
+from telemetry import get_telemetry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://udioapi.pro"
+
+# Feed states reported while a generation is still running
+PENDING_TYPES = ['new', 'text', 'first']
+
+# With a callback registered, the feed is still checked this often in case the push was lost
+CALLBACK_SAFETY_POLL = 120
+
+
+def udiopro_base_url():
+    return os.getenv('UDIOPRO_BASE_URL', DEFAULT_BASE_URL).rstrip('/')
+
+
+class UdioProError(Exception):
+    pass
+
+
+class UdioProTimeout(UdioProError):
+    """Polling gave up while the generation was still running; it can be polled again later."""
+
+
+class UdioProClient:
+    def __init__(self, api_key, base_url=None, session=None, timeout=30, callbacks=None):
+        self.api_key = api_key
+        self.base_url = (base_url or udiopro_base_url()).rstrip('/')
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        # A udiopro_callbacks.CallbackReceiver; jobs submitted through it complete on push instead of polling
+        self.callbacks = callbacks
+
+    def generate(self, prompt, title="Generated Song", custom_mode=False, make_instrumental=False,
+                 model="chirp-v3.5", callback_url=None, **extra):
+        """Submit a generation and return its workId."""
+        if callback_url is None and self.callbacks is not None:
+            callback_url = self.callbacks.callback_url
+        data = {
+            "prompt": prompt,
+            "title": title,
+            "custom_mode": custom_mode,
+            "make_instrumental": make_instrumental,
+            "model": model,
+            "disable_callback": callback_url is None,
+            "token": self.api_key
+        }
+        if callback_url:
+            data["callback_url"] = callback_url
+        data.update(extra)
+
+        with get_telemetry().track('udiopro_submit', 'udiopro', model):
+            response = self.session.post(f"{self.base_url}/api/generate", headers={"Content-Type": "application/json"},
+                                         json=data, timeout=self.timeout)
+            response.raise_for_status()
+            response_json = response.json()
+            work_id = response_json.get('workId')
+            if not work_id:
+                raise UdioProError(f"Failed to get Work ID from UdioPro API. Response: {response_json}")
+            if callback_url and self.callbacks is not None:
+                self.callbacks.expect(work_id)
+            return work_id
+
+    def feed(self, work_id):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        with span('udiopro_poll', work_id=work_id) as current:
+            response = self.session.get(f"{self.base_url}/api/feed", params={"workId": work_id}, headers=headers,
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            current.set(status=result.get('type'))
+            return result
+
+    def wait_for_result(self, work_id, sleep=time.sleep, timeout=300, interval=5, max_interval=30, on_status=None):
+        """Wait until the generation completes and return the complete result.
+
+        A job submitted with a callback waits for the push and polls only every CALLBACK_SAFETY_POLL
+        seconds. Otherwise the feed is polled, backing off towards max_interval while the job is
+        queued and going back to interval once UdioPro reports the first audio.
+        """
+        deadline = time.monotonic() + timeout
+        delay = interval
+        with get_telemetry().track('udiopro_render', 'udiopro') as record:
+            polls = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if self.callbacks is not None and self.callbacks.expects(work_id):
+                    pushed = self.callbacks.wait(work_id, max(0, min(CALLBACK_SAFETY_POLL, remaining)), sleep)
+                    if pushed is not None:
+                        record.extra['delivery'] = 'callback'
+                        return self._completed(pushed)
+                polls += 1
+                record.extra['polls'] = polls
+                result = self.feed(work_id)
+                record.extra['poll_status'] = result['type']
+                if result['type'] in ('complete', 'error'):
+                    record.extra['delivery'] = 'poll'
+                    if self.callbacks is not None:
+                        self.callbacks.discard(work_id)
+                    return self._completed(result)
+                if result['type'] not in PENDING_TYPES:
+                    raise UdioProError(f"Unexpected result type: {result['type']}")
+                if on_status:
+                    on_status(result['type'])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UdioProTimeout("Timed out waiting for the UdioPro result")
+                if self.callbacks is None or not self.callbacks.expects(work_id):
+                    # 'first' means the audio is nearly done, so look again soon
+                    delay = interval if result['type'] == 'first' else min(delay * 1.5, max_interval)
+                    sleep(min(delay, remaining))
+
+    def _completed(self, result):
+        if result.get('type') != 'complete':
+            raise UdioProError(f"UdioPro generation failed: {result.get('error') or result.get('message') or result}")
+        return result
+
+    def download(self, audio_url):
+        with span('download', url=audio_url) as current:
+            response = self.session.get(audio_url, timeout=self.timeout)
+            response.raise_for_status()
+            current.set(bytes=len(response.content))
+            return response.content
@@ -0,0 +1,185 @@
+"""Durable record of every UdioPro job, so a restart resumes generations instead of paying for them twice.
+
+Each extension chain and each job in it is written to SQLite before and after it is submitted.
+On startup, chains left unfinished are resumed: jobs that already have a workId are polled again,
+completed clips are downloaded, and only segments that were never submitted are submitted. A chain
+interrupted by network errors or timeouts MAX_CHAIN_ATTEMPTS times is marked failed instead.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.path.join('generated_songs', 'udiopro_jobs.db')
+
+# Chain states
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Job states
+SUBMITTING = 'submitting'   # written before the generate request; a crash here leaves no workId
+SUBMITTED = 'submitted'
+COMPLETE = 'complete'
+DOWNLOADED = 'downloaded'
+
+# Interrupted runs of one chain before it is given up on
+MAX_CHAIN_ATTEMPTS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chains (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    song_title TEXT,
+    folder TEXT NOT NULL,
+    stamp INTEGER NOT NULL,
+    fields TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL,
+    path TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    chain_id INTEGER NOT NULL REFERENCES chains(id),
+    segment INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    lyrics TEXT NOT NULL DEFAULT '',
+    work_id TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    clip TEXT,
+    path TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chain_id, segment)
+);
+"""
+
+
+# Columns added to chains after the first release, for journals created before them
+CHAIN_COLUMNS = {
+    'song_title': "TEXT",
+    'attempts': "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class JobJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Shared by the GUI and the scheduler's threads; every statement runs under the lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        existing = {row['name'] for row in self._db.execute("PRAGMA table_info(chains)")}
+        for name, definition in CHAIN_COLUMNS.items():
+            if name not in existing:
+                self._db.execute(f"ALTER TABLE chains ADD COLUMN {name} {definition}")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def start_chain(self, title, folder, stamp, song_title=None):
+        now = time.time()
+        return self._execute(
+            "INSERT INTO chains (title, song_title, folder, stamp, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (title, song_title, folder, stamp, RUNNING, now, now)).lastrowid
+
+    def chain(self, chain_id):
+        rows = self._query("SELECT * FROM chains WHERE id = ?", (chain_id,))
+        if not rows:
+            return None
+        chain = rows[0]
+        chain['fields'] = json.loads(chain['fields'])
+        return chain
+
+    def unfinished_chains(self):
+        return [self.chain(row['id']) for row in self._query("SELECT id FROM chains WHERE state = ? ORDER BY id",
+                                                             (RUNNING,))]
+
+    def save_field(self, chain_id, name, value):
+        with self._lock:
+            row = self._db.execute("SELECT fields FROM chains WHERE id = ?", (chain_id,)).fetchone()
+            fields = json.loads(row['fields'])
+            fields[name] = value
+            self._db.execute("UPDATE chains SET fields = ?, updated_at = ? WHERE id = ?",
+                             (json.dumps(fields, ensure_ascii=False), time.time(), chain_id))
+
+    def finish_chain(self, chain_id, path=None, error=None):
+        self._execute("UPDATE chains SET state = ?, path = ?, error = ?, updated_at = ? WHERE id = ?",
+                      (FAILED if error else DONE, path, error, time.time(), chain_id))
+
+    def interrupted(self, chain_id, error, max_attempts=MAX_CHAIN_ATTEMPTS):
+        """Count a run that stopped on a network error or timeout; True once the chain is marked failed."""
+        with self._lock:
+            self._db.execute("UPDATE chains SET attempts = attempts + 1, error = ?, updated_at = ? WHERE id = ?",
+                             (error, time.time(), chain_id))
+            return self._db.execute("UPDATE chains SET state = ? WHERE id = ? AND state = ? AND attempts >= ?",
+                                    (FAILED, chain_id, RUNNING, max_attempts)).rowcount > 0
+
+    def job(self, chain_id, segment):
+        rows = self._query("SELECT * FROM jobs WHERE chain_id = ? AND segment = ?", (chain_id, segment))
+        if not rows:
+            return None
+        job = rows[0]
+        job['clip'] = json.loads(job['clip']) if job['clip'] else None
+        return job
+
+    def submitting(self, chain_id, segment):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO jobs (chain_id, segment, kind, prompt, lyrics, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (chain_id, segment.index, segment.kind, segment.prompt, segment.lyrics, SUBMITTING, now, now))
+
+    def _update(self, chain_id, segment, **values):
+        values['updated_at'] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in values)
+        self._execute(f"UPDATE jobs SET {columns} WHERE chain_id = ? AND segment = ?",
+                      (*values.values(), chain_id, segment))
+
+    def submitted(self, chain_id, segment, work_id):
+        self._update(chain_id, segment, work_id=work_id, state=SUBMITTED)
+
+    def polled(self, chain_id, segment):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, updated_at = ? WHERE chain_id = ? AND segment = ?",
+                (time.time(), chain_id, segment))
+
+    def completed(self, chain_id, segment, clip):
+        self._update(chain_id, segment, clip=json.dumps(clip, ensure_ascii=False), state=COMPLETE)
+
+    def downloaded(self, chain_id, segment, path):
+        self._update(chain_id, segment, path=path, state=DOWNLOADED)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """The app's journal, or None if it cannot be opened; generation then runs unjournaled."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            try:
+                _journal = JobJournal()
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Could not open the UdioPro job journal {JOURNAL_PATH}: {str(e)}")
+        return _journal
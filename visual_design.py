@@ -1,36 +1,34 @@
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QLabel, QApplication, QScrollArea, QProgressBar
-from PyQt5.QtCore import Qt, pyqtSignal, QThread, pyqtSignal as Signal, QUrl, QTimer
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, QLabel, QScrollArea, QProgressBar
+from PyQt5.QtCore import Qt, pyqtSignal, QUrl, QTimer
 from PyQt5.QtGui import QPixmap, QMovie
 from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
 from dotenv import load_dotenv
 import os
 import sys
 import uuid
+import time
 sys.path.append('.')
 from openai import OpenAI
 import io
+from prompt_registry import get_prompt_registry
+from generation_scheduler import Priority, OPENAI_IMAGE
+from qt_jobs import submit_stage, submit_job, submit_summary
+from song_stages import load_documents
+from rate_limiter import RateLimitedClient
+from tracing import get_tracer, current_context, resume
+from chat_view import ChatView
+from document_file import DocumentFile
+from conversation_memory import ConversationMemory
 
-class ImageGenerationThread(QThread):
-    image_generated = Signal(str)
-
-    def __init__(self, client, prompt):
-        super().__init__()
-        self.client = client
-        self.prompt = prompt
-
-    def run(self):
-        try:
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=self.prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1,
-            )
-            image_url = response.data[0].url
-            self.image_generated.emit(image_url)
-        except Exception as e:
-            print(f"Error generating image: {str(e)}")
+def generate_image_url(client, prompt, sleep=time.sleep):
+    response = RateLimitedClient(client, sleep=sleep).generate_image(
+        prompt,
+        model="dall-e-3",
+        size="1024x1024",
+        quality="standard",
+        n=1,
+    )
+    return response.data[0].url
 
 class VisualDesignTab(QWidget):
     visual_design_updated = pyqtSignal(str)
@@ -40,18 +38,20 @@ class VisualDesignTab(QWidget):
         self.initUI()
         self.load_api_key()
         self.current_stream = None
+        self.image_job = None
         self.stream_buffer = ""
-        self.load_system_prompt()
+        self.prompts = get_prompt_registry()
+        self.memory = ConversationMemory('visual_design')
         self.client = None
         self.load_initial_visual_design()
         self.network_manager = QNetworkAccessManager()
         self.network_manager.finished.connect(self.on_image_downloaded)
+        self.image_trace = None
+        self.download_spans = {}
 
     def load_initial_visual_design(self):
         try:
-            with open('visual_design.md', 'r', encoding='utf-8') as f:
-                initial_visual_design = f.read()
-            self.result_area.setText(initial_visual_design)
+            self.result_file.load()
         except FileNotFoundError:
             self.chat_area.append("Warning: visual_design.md file not found. Starting with empty visual design.")
 
@@ -61,10 +61,8 @@ class VisualDesignTab(QWidget):
 
         # Chat area
         chat_layout = QVBoxLayout()
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
-        self.chat_area.textChanged.connect(lambda: self.chat_area.ensureCursorVisible())
-        self.chat_area.append("Hey there! I'm Pixel, your visual design virtuoso. Welcome to the Visual Design Tab! Here you can work on the visual aspects of your project. Start by describing your ideas for visuals or ask for suggestions in the input field below.")
+        self.chat_area = ChatView('visual_design')
+        self.chat_area.greet("Hey there! I'm Pixel, your visual design virtuoso. Welcome to the Visual Design Tab! Here you can work on the visual aspects of your project. Start by describing your ideas for visuals or ask for suggestions in the input field below.")
         chat_layout.addWidget(self.chat_area)
 
         input_layout = QHBoxLayout()
@@ -76,12 +74,17 @@ class VisualDesignTab(QWidget):
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_stream)
+        input_layout.addWidget(self.stop_button)
+
         chat_layout.addLayout(input_layout)
         self.layout.addLayout(chat_layout)
 
         # Visual design display area
         self.result_area = QTextEdit()
-        self.result_area.textChanged.connect(self.save_visual_design)
+        self.result_file = DocumentFile(self.result_area, 'visual_design.md')
         self.result_area.textChanged.connect(lambda: self.result_area.ensureCursorVisible())
         self.layout.addWidget(self.result_area)
 
@@ -105,10 +108,6 @@ class VisualDesignTab(QWidget):
         self.spinner.hide()
         self.image_layout.addWidget(self.spinner)
 
-    def save_visual_design(self):
-        with open('visual_design.md', 'w', encoding='utf-8') as f:
-            f.write(self.result_area.toPlainText())
-
     def load_api_key(self):
         load_dotenv()
         self.api_key = os.getenv('OPENAI_API_KEY')
@@ -124,26 +123,10 @@ class VisualDesignTab(QWidget):
                 print("Please check your API key in the .env file")
                 self.client = None
 
-    def load_system_prompt(self):
-        try:
-            with open('prompts/visual_design.md', 'r', encoding='utf-8') as f:
-                visual_design_prompt = f.read()
-            
-            with open('concept.md', 'r', encoding='utf-8') as f:
-                concept_content = f.read()
-            
-            self.system_prompt = f"{visual_design_prompt}\n\nContext from concept.md:\n{concept_content}"
-        except FileNotFoundError as e:
-            self.system_prompt = "You are a creative assistant to help develop visual designs for songs."
-            self.chat_area.append(f"Warning: File not found: {str(e)}. Using a default prompt.")
-
     def send_message(self):
-        # Update the system prompt with the latest content
-        self.load_system_prompt()
-        
-        user_message = self.input_field.text()
+        if self.current_stream is not None and not self.current_stream.finished:
+            return
 
-    def send_message(self):
         user_message = self.input_field.text()
         self.chat_area.append(f"You: {user_message}")
         self.input_field.clear()
@@ -162,68 +145,101 @@ class VisualDesignTab(QWidget):
 
         try:
             # Refresh the concept content
-            with open('concept.md', 'r', encoding='utf-8') as f:
-                concept_content = f.read()
-            
-            # Update the system prompt with the latest concept content
-            updated_system_prompt = f"{self.system_prompt}\n\nUpdated context from concept.md:\n{concept_content}"
+            documents = load_documents()
 
-            self.stream_buffer = ""
             self.chat_area.append("Assistant: ")
-            stream = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": updated_system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                stream=True
+            self.send_button.setEnabled(False)
+            self.stop_button.setEnabled(True)
+            self.current_stream = submit_stage(
+                self, 'visual_design', self.client, self.prompts, documents, user_message,
+                on_chunk=self.chat_area.insertPlainText,
+                on_done=self.on_stream_done,
+                on_error=self.on_stream_error,
+                on_cancel=self.on_stream_cancelled,
+                history=self.memory.messages()
             )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    self.stream_buffer += chunk.choices[0].delta.content
-                    self.chat_area.insertPlainText(chunk.choices[0].delta.content)
-                    QApplication.processEvents()
-            self.update_visual_design(self.stream_buffer)
-            
-            # Generate image based on the response
-            self.generate_image(self.stream_buffer)
         except Exception as e:
-            self.chat_area.append(f"Error sending message: {str(e)}")
-            self.chat_area.append("Please check your internet connection and the validity of your API key.")
+            self.on_stream_error(str(e))
+
+    def on_stream_done(self, result):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.memory.add_turn(result.user_message, result.text)
+        submit_summary(self, self.memory, self.client, self.prompts)
+        self.update_visual_design(result.text)
+
+        # Generate image based on the response
+        with resume(result.trace):
+            self.generate_image(result.text)
+
+    def stop_stream(self):
+        # Stops the reply, or the image generated from it
+        for job in (self.current_stream, self.image_job):
+            if job is not None and not job.finished:
+                job.cancel()
+
+    def on_stream_cancelled(self):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append("(Stopped)")
+
+    def on_stream_error(self, error):
+        self.send_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.chat_area.append(f"Error sending message: {error}")
+        self.chat_area.append("Please check your internet connection and the validity of your API key.")
 
     def update_visual_design(self, new_content):
-        try:
-            with open('visual_design.md', 'r', encoding='utf-8') as f:
-                current_visual_design = f.read()
-        except FileNotFoundError:
-            current_visual_design = ""
-        
-        updated_visual_design = current_visual_design + "\n\n" + new_content
-        self.visual_design_updated.emit(updated_visual_design)
-        
-        # Save the visual design to visual_design.md
-        with open('visual_design.md', 'w', encoding='utf-8') as f:
-            f.write(updated_visual_design)
+        # Appended in place; the editor already holds the file's content, so there is nothing to re-read
+        self.result_file.append(new_content)
+        if self.receivers(self.visual_design_updated):
+            self.visual_design_updated.emit(self.result_area.toPlainText())
 
     def generate_image(self, prompt):
         self.chat_area.append("Generating image...")
+        self.stop_button.setEnabled(True)
         self.spinner.show()
         self.spinner_movie.start()
-        self.image_thread = ImageGenerationThread(self.client, prompt)
-        self.image_thread.image_generated.connect(self.on_image_generated)
-        self.image_thread.start()
+        client = self.client
+        self.image_trace = current_context()
+        self.image_job = submit_job(
+            self, OPENAI_IMAGE,
+            lambda job, emit_chunk: generate_image_url(client, prompt, job.sleep),
+            on_done=self.on_image_generated,
+            on_error=self.on_image_error,
+            on_cancel=self.on_image_cancelled,
+            priority=Priority.BACKGROUND,
+            label='visual_design-image'
+        )
 
     def on_image_generated(self, image_url):
         self.chat_area.append(f"Image generated: {image_url}")
         self.download_image(image_url)
+        self.stop_image_spinner()
+
+    def on_image_error(self, error):
+        self.chat_area.append(f"Error generating image: {error}")
+        self.stop_image_spinner()
+
+    def on_image_cancelled(self):
+        self.chat_area.append("Image generation stopped.")
+        self.stop_image_spinner()
+
+    def stop_image_spinner(self):
         self.spinner_movie.stop()
         self.spinner.hide()
+        self.stop_button.setEnabled(False)
 
     def download_image(self, url):
         request = QNetworkRequest(QUrl(url))
-        self.network_manager.get(request)
+        reply = self.network_manager.get(request)
+        self.download_spans[reply] = get_tracer().start_span('download', self.image_trace, url=url)
 
     def on_image_downloaded(self, reply):
+        download_span = self.download_spans.pop(reply, None)
+        if download_span is not None:
+            download_span.set(bytes=reply.size())
+            get_tracer().finish(download_span, 'ok' if reply.error() == QNetworkReply.NoError else 'error')
         if reply.error() == QNetworkReply.NoError:
             data = reply.readAll()
             pixmap = QPixmap()
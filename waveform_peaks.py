@@ -0,0 +1,248 @@
+"""Per-channel, multi-level peaks of a track, so the waveform can be drawn at any zoom without the decoded PCM in memory.
+
+16-bit WAV files are memory-mapped in place; other formats are decoded once and cached as int16
+under generated_songs/waveforms/, keyed by file hash. Level n holds the min and max of every
+BASE_BLOCK * FACTOR ** (n - 1) frames per channel, so a view reads about one entry per pixel from
+the coarsest level that still resolves it, and only zooming in to single samples touches the PCM.
+"""
+import logging
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from audio_library import LIBRARY_DIR, file_hash
+
+logger = logging.getLogger(__name__)
+
+WAVEFORM_DIR = os.path.join(LIBRARY_DIR, 'waveforms')
+BASE_BLOCK = 64
+FACTOR = 4
+# Frames reduced per step while building the first level, to bound memory on long tracks
+BUILD_FRAMES = BASE_BLOCK * 16384
+
+
+def wav_samples(path):
+    """(frames, channels) int16 memory map of a 16-bit PCM WAV and its rate, or None for anything else."""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        channels = rate = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            name, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if name == b'fmt ':
+                audio_format, channels, rate, _, _, bits = struct.unpack('<HHIIHH', f.read(16))
+                if audio_format not in (1, 0xFFFE) or bits != 16:
+                    return None
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            elif name == b'data':
+                if not channels:
+                    return None
+                offset = f.tell()
+                # Files still being written can declare more data than they hold
+                size = min(size, os.path.getsize(path) - offset)
+                frames = size // (2 * channels)
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+    if not frames:
+        return np.zeros((0, channels), dtype='<i2'), rate
+    return np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(frames, channels)), rate
+
+
+def decoded_samples(path, root=WAVEFORM_DIR):
+    """Decode with pydub once and memory-map the cached int16 copy from then on."""
+    digest = file_hash(path)
+    cached = os.path.join(root, f"{digest}.npy")
+    meta = os.path.join(root, f"{digest}.rate")
+    if os.path.exists(cached) and os.path.exists(meta):
+        with open(meta, 'r') as f:
+            return np.load(cached, mmap_mode='r'), int(f.read())
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(path).set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype='<i2').reshape(-1, audio.channels)
+    os.makedirs(root, exist_ok=True)
+    _write_atomically(cached, lambda f: np.save(f, samples))
+    _write_atomically(meta, lambda f: f.write(str(audio.frame_rate).encode()))
+    return np.load(cached, mmap_mode='r'), audio.frame_rate
+
+
+def _write_atomically(path, write):
+    # A temporary file of its own in the same directory, so concurrent writers never share one
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix='.partial')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(partial, path)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+
+
+def load(path, root=WAVEFORM_DIR):
+    loaded = wav_samples(path)
+    if loaded is None:
+        loaded = decoded_samples(path, root)
+    samples, rate = loaded
+    return WaveformPeaks(samples, rate)
+
+
+def _block_extremes(lows, highs, block):
+    """(mins, maxs) of each block along the last axis of (channels, n) arrays; a short last block is kept."""
+    whole = lows.shape[1] // block * block
+    channels = lows.shape[0]
+    mins = lows[:, :whole].reshape(channels, -1, block).min(axis=2)
+    maxs = highs[:, :whole].reshape(channels, -1, block).max(axis=2)
+    if whole < lows.shape[1]:
+        mins = np.concatenate([mins, lows[:, whole:].min(axis=1, keepdims=True)], axis=1)
+        maxs = np.concatenate([maxs, highs[:, whole:].max(axis=1, keepdims=True)], axis=1)
+    return mins, maxs
+
+
+class WaveformPeaks:
+    def __init__(self, samples, rate):
+        self.samples = samples
+        self.rate = rate
+        self.frames, self.channels = samples.shape
+        # levels[0] is the PCM itself; the rest are (block, mins, maxs) with (channels, blocks) arrays,
+        # blocks growing by FACTOR
+        self.levels = [(1, samples.T, samples.T)]
+        if self.frames:
+            parts = []
+            for start in range(0, self.frames, BUILD_FRAMES):
+                # Channel-major, so every reduction runs over contiguous memory
+                chunk = np.ascontiguousarray(samples[start:start + BUILD_FRAMES].T)
+                parts.append(_block_extremes(chunk, chunk, BASE_BLOCK))
+            mins = np.concatenate([part[0] for part in parts], axis=1)
+            maxs = np.concatenate([part[1] for part in parts], axis=1)
+            block = BASE_BLOCK
+            self.levels.append((block, mins, maxs))
+            while mins.shape[1] > FACTOR:
+                block *= FACTOR
+                mins, maxs = _block_extremes(mins, maxs, FACTOR)
+                self.levels.append((block, mins, maxs))
+        coarsest = self.levels[-1]
+        self.peak = int(max(np.abs(coarsest[1].astype(np.int32)).max(initial=0),
+                            np.abs(coarsest[2].astype(np.int32)).max(initial=0)))
+
+    @property
+    def duration(self):
+        return self.frames / self.rate if self.rate else 0.0
+
+    def nbytes(self):
+        """Memory held by the peak levels; the PCM itself stays on disk."""
+        return sum(mins.nbytes + maxs.nbytes for _, mins, maxs in self.levels[1:])
+
+    def level_for(self, frames_per_pixel):
+        """The coarsest level whose blocks are no wider than a pixel."""
+        best = self.levels[0]
+        for level in self.levels[1:]:
+            if level[0] > frames_per_pixel:
+                break
+            best = level
+        return best
+
+    def columns(self, channel, start, frames_per_pixel, width):
+        """(mins, maxs) per pixel column from frame start, as floats; columns past the end are NaN."""
+        block, mins, maxs = self.level_for(frames_per_pixel)
+        edges = start + np.arange(width + 1) * frames_per_pixel
+        indices = np.clip(np.floor(edges / block).astype(np.int64), 0, mins.shape[1])
+        first, last = int(indices[0]), int(indices[-1])
+        result_min = np.full(width, np.nan)
+        result_max = np.full(width, np.nan)
+        if last <= first:
+            return result_min, result_max
+        starts = indices[:-1]
+        # Every column covers at least the block it starts in
+        visible = starts < last
+        offsets = starts[visible] - first
+        lows = np.asarray(mins[channel, first:last])
+        highs = np.asarray(maxs[channel, first:last])
+        result_min[visible] = np.minimum.reduceat(lows, offsets)
+        result_max[visible] = np.maximum.reduceat(highs, offsets)
+        return result_min, result_max
+
+    def frames_between(self, channel, start, end):
+        """Raw samples of one channel, for zoom levels where single samples are wider than a pixel."""
+        start, end = max(0, int(start)), min(self.frames, int(end))
+        return np.asarray(self.samples[start:end, channel])
+
+
+class PeakCache:
+    """Recently used peaks by path, so a track that was prefetched or played before shows at once."""
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._peaks = OrderedDict()
+        # Key -> lock held while that file's peaks are built, so one build serves every caller
+        self._loading = {}
+
+    @staticmethod
+    def _key(path):
+        stat = os.stat(path)
+        return os.path.normpath(path), stat.st_size, stat.st_mtime
+
+    def cached(self, path):
+        try:
+            key = self._key(path)
+        except OSError:
+            return None
+        with self._lock:
+            peaks = self._peaks.get(key)
+            if peaks is not None:
+                self._peaks.move_to_end(key)
+            return peaks
+
+    def get(self, path):
+        peaks = self.cached(path)
+        if peaks is not None:
+            return peaks
+        key = self._key(path)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        # Built outside the cache lock; a second caller for the same file waits here and finds it cached
+        with loading:
+            with self._lock:
+                peaks = self._peaks.get(key)
+            try:
+                if peaks is None:
+                    peaks = load(path)
+                    with self._lock:
+                        self._peaks[key] = peaks
+                        while len(self._peaks) > self.capacity:
+                            self._peaks.popitem(last=False)
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is loading:
+                        del self._loading[key]
+        return peaks
+
+    def prefetch(self, paths, should_stop=None):
+        for path in paths[:self.capacity]:
+            if should_stop:
+                should_stop()
+            try:
+                self.get(path)
+            except Exception as e:
+                logger.debug(f"Could not prefetch peaks of {path}: {str(e)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_peak_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PeakCache()
+        return _cache
@@ -1,62 +1,121 @@
-import os
-import sys
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPainter, QColor, QPen
-from pydub import AudioSegment
-import statistics
-
-class WaveformWidget(QWidget):
+import numpy as np
+from PyQt5.QtCore import Qt, QLineF, QPointF
+from PyQt5.QtGui import QPainter, QColor, QPen, QPolygonF
+from generation_scheduler import Priority, LOCAL
+from qt_jobs import submit_job
+from track_view import TrackView
+from waveform_peaks import get_peak_cache
+
+
+class WaveformWidget(TrackView):
+    """One lane per channel, drawn from the peak level that matches the zoom; single samples show when zoomed in far."""
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.waveform_data = []
-        self.current_position = 0
-        self.duration = 0
-        self.setMinimumHeight(100)
+        self.peaks = None
+        self.file_path = None
+        self._job = None
 
     def load_audio(self, file_path):
-        audio = AudioSegment.from_file(file_path)
-        self.waveform_data = audio.get_array_of_samples()
-        self.duration = len(audio)
+        """Show the track's peaks, building them on a LOCAL job with a placeholder meanwhile if they are not cached."""
+        if self._job is not None and not self._job.finished:
+            self._job.cancel()
+        self._job = None
+        self.file_path = file_path
+        peaks = get_peak_cache().cached(file_path)
+        if peaks is not None:
+            self.set_peaks(peaks)
+            return
+        self.peaks = None
+        self.setToolTip("")
+        self.reset_view()
+
+        def run(job, emit_chunk):
+            # Waits for, rather than repeats, a build the playback engine already started
+            return get_peak_cache().get(file_path)
+
+        self._job = submit_job(self, LOCAL, run, on_done=lambda peaks: self._loaded(file_path, peaks),
+                               on_error=lambda error: self._failed(file_path, error),
+                               priority=Priority.INTERACTIVE, label='waveform')
         self.update()
 
-    def set_duration(self, duration):
-        self.duration = duration
+    def peaks_ready(self, file_path):
+        if file_path == self.file_path and self.peaks is None:
+            peaks = get_peak_cache().cached(file_path)
+            if peaks is not None:
+                self._loaded(file_path, peaks)
+
+    def _loaded(self, file_path, peaks):
+        if file_path == self.file_path:
+            self._job = None
+            if peaks is not self.peaks:
+                self.set_peaks(peaks)
 
-    def update_position(self, position):
-        self.current_position = position
+    def _failed(self, file_path, error):
+        if file_path == self.file_path:
+            self._job = None
+            self.setToolTip(f"Could not load the waveform: {error}")
+            self.update()
+
+    def set_peaks(self, peaks):
+        self.peaks = peaks
+        self.duration = int(peaks.duration * 1000)
+        self.reset_view()
         self.update()
 
+    def total_seconds(self):
+        if self.peaks is not None and self.peaks.duration:
+            return self.peaks.duration
+        return super().total_seconds()
+
+    def min_span(self):
+        # About sixteen pixels per sample
+        if self.peaks is None or not self.peaks.rate:
+            return super().min_span()
+        return self.width() / 16 / self.peaks.rate
+
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
 
         # Draw background
         painter.fillRect(self.rect(), QColor(30, 30, 30))
 
-        if len(self.waveform_data) == 0:
+        peaks = self.peaks
+        width, height = self.width(), self.height()
+        span = self.span()
+        if peaks is None and self._job is not None:
+            painter.setPen(QColor(160, 160, 160))
+            painter.drawText(self.rect(), Qt.AlignCenter, "Loading waveform...")
+            return
+        if peaks is None or not peaks.frames or span <= 0 or width <= 0:
             return
 
-        # Calculate scaling factors
-        width = self.width()
-        height = self.height()
-        samples_per_pixel = max(1, len(self.waveform_data) // width)
-        max_amplitude = max(abs(max(self.waveform_data)), abs(min(self.waveform_data)))
-        amplitude_scale = height / (2 * max_amplitude)
-
-        # Draw waveform
+        frames_per_pixel = span * peaks.rate / width
+        start = self.view_start * peaks.rate
+        lane = height / peaks.channels
+        amplitude_scale = lane / (2 * max(1, peaks.peak))
         painter.setPen(QPen(QColor(0, 255, 0), 1))
-        for x in range(width):
-            start = x * samples_per_pixel
-            end = start + samples_per_pixel
-            chunk = self.waveform_data[start:end]
-            if len(chunk) > 0:
-                min_val = int(min(chunk) * amplitude_scale)
-                max_val = int(max(chunk) * amplitude_scale)
-                painter.drawLine(x, height//2 - min_val, x, height//2 - max_val)
+        for channel in range(peaks.channels):
+            middle = lane * channel + lane / 2
+            if frames_per_pixel < 1:
+                # Sample level: connect the samples, which are further apart than a pixel
+                first = int(start)
+                values = peaks.frames_between(channel, first, start + span * peaks.rate + 2)
+                xs = (np.arange(first, first + len(values)) - start) / frames_per_pixel
+                ys = middle - values * amplitude_scale
+                painter.setRenderHint(QPainter.Antialiasing)
+                painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())]))
+                continue
+            mins, maxs = peaks.columns(channel, start, frames_per_pixel, width)
+            drawn = np.flatnonzero(~np.isnan(mins))
+            tops = (middle - maxs[drawn] * amplitude_scale).tolist()
+            bottoms = (middle - mins[drawn] * amplitude_scale).tolist()
+            painter.drawLines([QLineF(x, top, x, bottom) for x, top, bottom in zip(drawn.tolist(), tops, bottoms)])
+
+        if peaks.channels > 1:
+            painter.setPen(QPen(QColor(70, 70, 70), 1))
+            for channel in range(1, peaks.channels):
+                painter.drawLine(0, int(lane * channel), width, int(lane * channel))
 
         # Draw playback position
-        if self.duration > 0:
-            position_x = int((self.current_position / self.duration) * width)
-            painter.setPen(QPen(QColor(255, 0, 0), 2))
-            painter.drawLine(position_x, 0, position_x, height)
+        self.draw_position(painter, span / width)